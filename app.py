@@ -5,35 +5,136 @@
 - TLS 指纹: 通过内置 Go TLS 服务获取
 """
 
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
+from datetime import datetime, timezone
+import base64
+import gzip
 import hashlib
+import ipaddress
+import csv
+import io
+import mmap
+import struct
 import json
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import subprocess
 import signal
+import socket
 import sys
 import atexit
 import time
 import sqlite3
+import threading
+import queue
+import math
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from contextlib import contextmanager
+from itertools import combinations
+
+try:
+    import zstandard  # 可选依赖，仅 PAYLOAD_COMPRESSION=zstd 或读取 zstd 压缩的数据时需要
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson  # 可选依赖，JSON 编解码（请求解析、响应、存储）使用 orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec  # 可选依赖，未安装 orjson 时使用 msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import brotli  # 可选依赖，客户端支持时 JSON 响应使用 brotli 压缩（否则使用 gzip）
+except ImportError:
+    brotli = None
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
-# 数据库路径
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprints.db')
+# 数据库路径（默认为程序目录下的 fingerprints.db）
+DB_PATH = os.environ.get('DB_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fingerprints.db')
 
-# TLS 服务进程
+# TLS 服务进程（记录启动它的进程，fork 出的 worker 退出时不会误停）
 tls_process = None
+tls_process_pid = None
+# 当前进程是否订阅了 TLS 服务的推送流
+tls_stream_subscribed = False
 
 # 配置
 TLS_SERVER_PORT = int(os.environ.get('TLS_PORT', 8443))
 TLS_SERVER_HOST = os.environ.get('TLS_HOST', '0.0.0.0')
 SERVER_HOST = os.environ.get('SERVER_HOST', '127.0.0.1')  # 用于前端显示的服务器地址
 ENABLE_TCP = os.environ.get('ENABLE_TCP', '').lower() in ('1', 'true', 'yes')  # 启用 TCP 指纹采集（需要 sudo）
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 20))  # 出站 HTTP 每个主机的连接池大小
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 2))  # 出站 HTTP 连接超时（秒）
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 5))  # 出站 HTTP 读取超时（秒）
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 1))  # 出站 HTTP 重试次数
+TLS_STREAM = os.environ.get('TLS_STREAM', '1').lower() in ('1', 'true', 'yes')  # 订阅 TLS 服务推送的指纹流
+TLS_STREAM_CACHE_SIZE = int(os.environ.get('TLS_STREAM_CACHE_SIZE', 50000))  # 推送指纹按 IP 保留的条数
+TLS_STREAM_TTL = int(os.environ.get('TLS_STREAM_TTL', 1800))  # 推送指纹的过期时间（秒）
+# TLS 服务本地 IPC socket（留空则只通过 HTTPS 接口查询）
+# 经 socket 可查询访客指纹，默认放在当前用户私有的运行目录（$XDG_RUNTIME_DIR 或程序目录下的 run/），不使用公共可写的 /tmp
+TLS_IPC_SOCKET = os.environ.get(
+    'TLS_IPC_SOCKET',
+    os.path.join(
+        os.environ.get('XDG_RUNTIME_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run'),
+        f'fingerprint-tls-{TLS_SERVER_PORT}.sock'
+    ) if hasattr(socket, 'AF_UNIX') else ''
+)
+DEVICE_CACHE_MAX_DEVICES = int(os.environ.get('DEVICE_CACHE_MAX_DEVICES', 500000))  # 设备信号缓存上限，0 表示禁用
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # SQLite 连接池大小
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))  # 写锁等待时间
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))  # 内存映射读取大小
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')  # 访问记录/指纹异步批量写入
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000))  # 队列上限
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 500))  # 每批最大写入条数
+WRITE_BEHIND_FLUSH_MS = int(os.environ.get('WRITE_BEHIND_FLUSH_MS', 200))  # 最长攒批时间
+WRITE_BEHIND_PUT_TIMEOUT_MS = int(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT_MS', 100))  # 队列满时等待时间，超时后同步写入
+IP_INFO_CACHE_SIZE = int(os.environ.get('IP_INFO_CACHE_SIZE', 10000))  # IP 信息缓存条数
+IP_INFO_CACHE_TTL = int(os.environ.get('IP_INFO_CACHE_TTL', 3600))  # 查询成功结果缓存时间（秒）
+IP_INFO_NEGATIVE_TTL = int(os.environ.get('IP_INFO_NEGATIVE_TTL', 60))  # 查询失败结果缓存时间（秒）
+IP_DB_PATH = os.environ.get('IP_DB_PATH', '')  # 离线 IP 数据库（CSV 或编译后的 .bin）
+IP_LOOKUP_OFFLINE = os.environ.get('IP_LOOKUP_OFFLINE', '').lower() in ('1', 'true', 'yes')  # 离线模式，不请求 ip-api.com
+BROWSER_ID_VERSION = int(os.environ.get('BROWSER_ID_VERSION', 1))  # 主浏览器指纹 ID 方案版本
+TLS_ID_VERSION = int(os.environ.get('TLS_ID_VERSION', 1))  # 主 TLS 指纹 ID 方案版本
+ID_SCHEME_VERSIONS = {  # 额外计算的方案（如 browser_v2,tls_v2），为空时计算全部已注册方案
+    name.strip() for name in os.environ.get('ID_SCHEME_VERSIONS', '').split(',') if name.strip()
+}
+ID_SCHEME_PRIMARY = {'browser': BROWSER_ID_VERSION, 'tls': TLS_ID_VERSION}
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto').lower()  # JSON 编解码: auto(已安装的最快实现)/orjson/msgspec/json
+PAYLOAD_COMPRESSION = os.environ.get('PAYLOAD_COMPRESSION', '').lower()  # 指纹数据压缩算法: 空(不压缩)/zlib/zstd
+PAYLOAD_COMPRESSION_LEVEL = int(os.environ.get('PAYLOAD_COMPRESSION_LEVEL', 0))  # 压缩级别，0 表示算法默认级别
+PAYLOAD_DICT_PATH = os.environ.get('PAYLOAD_DICT_PATH', '')  # 压缩字典 (tools/payload_storage.py train 生成)
+COMPONENT_STORE = os.environ.get('COMPONENT_STORE', '').lower() in ('1', 'true', 'yes')  # 重复子文档（WebGL、字体、请求头等）去重存储
+COMPONENT_MIN_SIZE = int(os.environ.get('COMPONENT_MIN_SIZE', 256))  # 小于该大小（JSON 字节）的子文档不拆分
+COMPONENT_CACHE_SIZE = int(os.environ.get('COMPONENT_CACHE_SIZE', 5000))  # 组件内容缓存条数
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))  # 导出时每次查询的行数
+COLLECT_BATCH_MAX_ITEMS = int(os.environ.get('COLLECT_BATCH_MAX_ITEMS', 1000))  # 批量采集每次请求的最大条数
+COLLECT_MAX_BODY_BYTES = int(os.environ.get('COLLECT_MAX_BODY_BYTES', 262144))  # /api/collect 请求体上限（字节），超出返回 413
+COLLECT_BATCH_MAX_BODY_BYTES = int(os.environ.get('COLLECT_BATCH_MAX_BODY_BYTES', 33554432))  # /api/collect/batch 请求体上限（字节），超出返回 413
+COLLECT_MAX_ARRAY_ITEMS = int(os.environ.get('COLLECT_MAX_ARRAY_ITEMS', 1000))  # 采集数据中字体、WebGL 扩展等列表的最大条数
+ENRICH_BUDGET_MS = int(os.environ.get('ENRICH_BUDGET_MS', 1000))  # 增强采集等待各数据源的总时间（毫秒）
+ENRICH_IP_INFO_TIMEOUT_MS = int(os.environ.get('ENRICH_IP_INFO_TIMEOUT_MS', 800))  # 增强采集 IP 信息查询超时（毫秒）
+ENRICH_TLS_TIMEOUT_MS = int(os.environ.get('ENRICH_TLS_TIMEOUT_MS', 300))  # 增强采集 TLS 指纹查询超时（毫秒）
+ENRICH_WORKERS = int(os.environ.get('ENRICH_WORKERS', 16))  # 增强采集查询线程数（每个进程）
+COLLECT_RESPONSE_VIEW = os.environ.get('COLLECT_RESPONSE_VIEW', 'ids')  # /api/collect 默认响应内容: ids / summary / full
+RESPONSE_COMPRESSION = os.environ.get('RESPONSE_COMPRESSION', '1').lower() in ('1', 'true', 'yes')  # JSON 响应按 Accept-Encoding 压缩
+RESPONSE_COMPRESS_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESS_MIN_SIZE', 1024))  # 小于此大小的响应不压缩（字节）
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', 6))  # gzip 压缩级别 (1-9)
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', 5))  # brotli 压缩质量 (0-11)
+TLS_RESTART_DELAY = float(os.environ.get('TLS_RESTART_DELAY', 5))  # TLS 服务意外退出后的重启间隔（秒，gunicorn 模式）
+DEBUG = os.environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')  # 开发服务器调试模式（python app.py）
 
 
 def get_tls_server_path():
@@ -52,9 +153,12 @@ def get_tls_server_path():
         return os.path.join(tls_dir, 'tls-server-linux-amd64')
 
 
-def start_tls_server():
-    """启动 TLS 指纹服务"""
-    global tls_process
+def start_tls_server(stream=TLS_STREAM):
+    """
+    启动 TLS 指纹服务
+    stream: 订阅 stdout 推送流（只有启动 TLS 服务的进程能读取，多进程部署时关闭）
+    """
+    global tls_process, tls_process_pid, tls_stream_subscribed
 
     tls_server_path = get_tls_server_path()
     tls_dir = os.path.dirname(tls_server_path)
@@ -78,6 +182,12 @@ def start_tls_server():
             '-cert', cert_path,
             '-key', key_path,
         ]
+        if TLS_IPC_SOCKET:
+            # 由当前用户创建 socket 目录（仅自己可访问），sudo 启动的 TLS 服务不必再以 root 创建
+            os.makedirs(os.path.dirname(os.path.abspath(TLS_IPC_SOCKET)), mode=0o700, exist_ok=True)
+            cmd += ['-ipc-socket', TLS_IPC_SOCKET]
+        if stream:
+            cmd += ['-stream']
 
         # 如果启用 TCP 指纹采集，需要用 sudo 运行
         if ENABLE_TCP:
@@ -85,14 +195,19 @@ def start_tls_server():
             print("[INFO] You may be prompted for your password.")
             cmd = ['sudo'] + cmd
 
+        # stdout 只承载指纹流，日志（stderr）直接输出到当前终端
         tls_process = subprocess.Popen(
             cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
+            stdout=subprocess.PIPE if stream else None,
             cwd=tls_dir,
             # sudo 需要从终端读取密码
             stdin=None if not ENABLE_TCP else subprocess.DEVNULL,
         )
+        tls_process_pid = os.getpid()
+        if stream:
+            # 持续读取 stdout，避免管道写满阻塞子进程
+            threading.Thread(target=read_tls_stream, args=(tls_process.stdout,), name='tls-stream', daemon=True).start()
+            tls_stream_subscribed = True
 
         # 等待服务启动（sudo 模式需要更长时间）
         time.sleep(1.0 if ENABLE_TCP else 0.5)
@@ -113,10 +228,21 @@ def start_tls_server():
         return False
 
 
+def read_tls_stream(stream):
+    """读取 TLS 服务 stdout 上的 NDJSON 指纹流，按客户端 IP 写入内存表"""
+    for line in stream:
+        try:
+            record = json_codec.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and record.get('type') == 'fingerprint' and record.get('ip'):
+            tls_stream_store.set(record['ip'], record.get('fingerprint'), TLS_STREAM_TTL)
+
+
 def stop_tls_server():
-    """停止 TLS 指纹服务"""
+    """停止 TLS 指纹服务（只在启动它的进程中生效）"""
     global tls_process
-    if tls_process:
+    if tls_process and tls_process_pid == os.getpid():
         print("[INFO] Stopping TLS server...")
         if ENABLE_TCP:
             # sudo 启动的进程需要用 sudo kill
@@ -134,12 +260,379 @@ def stop_tls_server():
         tls_process = None
 
 
+tls_supervisor = None
+tls_supervisor_stop = threading.Event()
+
+
+def supervise_tls_server():
+    """TLS 服务守护线程：启动失败或进程意外退出后按 TLS_RESTART_DELAY 间隔重试"""
+    while not tls_supervisor_stop.wait(TLS_RESTART_DELAY):
+        if tls_process is not None and tls_process.poll() is None:
+            continue
+        if tls_process is None:
+            print('[WARN] TLS server is not running, retrying start...')
+        else:
+            print(f'[WARN] TLS server exited (code {tls_process.returncode}), restarting...')
+        start_tls_server(stream=False)
+
+
+def start_tls_supervisor():
+    """
+    多进程部署时由主进程调用（gunicorn.conf.py）：全局只启动一个 TLS 服务并负责重启
+    推送流只能被一个进程读取，因此不订阅；worker 采集时通过本地 IPC 查询 TLS 指纹
+    首次启动失败（端口占用、启动慢等）时同样由守护线程重试，返回首次启动是否成功
+    """
+    global tls_supervisor
+    started = start_tls_server(stream=False)
+    if not started:
+        print(f'[WARN] TLS server failed to start, retrying every {TLS_RESTART_DELAY}s')
+    tls_supervisor_stop.clear()
+    tls_supervisor = threading.Thread(target=supervise_tls_server, name='tls-supervisor', daemon=True)
+    tls_supervisor.start()
+    return started
+
+
+def stop_tls_supervisor():
+    """停止守护线程和 TLS 服务"""
+    tls_supervisor_stop.set()
+    if tls_supervisor is not None:
+        tls_supervisor.join(TLS_RESTART_DELAY + 5)
+    stop_tls_server()
+
+
+# ============================================
+# JSON 编解码
+# ============================================
+
+class _NonFiniteFloat(float):
+    """
+    标准库解析出的 NaN/Infinity（含 1e400 等溢出的数字）
+    快速实现会把非有限浮点数编码为 null，存储后重新计算的指纹 ID 将会改变；
+    float 子类不被快速实现支持，编码时回退到标准库，原样写回 NaN/Infinity
+    """
+
+    __slots__ = ()
+
+
+def _parse_float(text):
+    value = float(text)
+    return value if math.isfinite(value) else _NonFiniteFloat(value)
+
+
+class JsonCodec:
+    """
+    JSON 编解码：请求解析、接口响应、指纹存储、TLS 服务 IPC 与推送流、数据导出
+    - orjson / msgspec: 编解码速度为标准库的数倍
+    - json: 标准库
+    解析结果与 json.loads 完全一致（指纹 ID 由解析结果计算）；快速实现无法处理的输入
+    （NaN/Infinity、超过 64 位的整数、孤立代理项、非 UTF-8 编码等）回退到标准库。
+    编码输出只保证是等价的 JSON，不保证与 json.dumps 逐字节相同，
+    需要稳定字节的场景（指纹 ID、组件哈希）直接使用标准库。
+    """
+
+    NAMES = ('orjson', 'msgspec', 'json')
+
+    # 快速实现无法编码时（超过 64 位的整数、非字符串键、孤立代理项等）回退到标准库
+    ENCODE_ERRORS = (TypeError, OverflowError, UnicodeEncodeError) + ((msgspec.EncodeError,) if msgspec else ())
+    # orjson 将超过 64 位的整数解析为浮点数，包含连续 19 位以上数字时交给标准库
+    # （数字映射为 0、其余字节映射为空格后查找子串，比正则扫描快一个数量级）
+    DIGIT_TABLE = bytes(48 if 48 <= i <= 57 else 32 for i in range(256))
+    LONG_NUMBER = b'0' * 19
+
+    def __init__(self, name='auto'):
+        if name == 'auto':
+            name = 'orjson' if orjson else 'msgspec' if msgspec else 'json'
+        if name not in self.NAMES:
+            raise RuntimeError(f"JSON_CODEC must be one of: auto, {', '.join(self.NAMES)}")
+        if (name == 'orjson' and orjson is None) or (name == 'msgspec' and msgspec is None):
+            raise RuntimeError(f'JSON_CODEC={name} requires the {name} package')
+        self.name = name
+        self.dumps_bytes = self.encoder()
+        self._fallback = json.loads if name == 'json' else self._loads_standard
+        if name == 'msgspec':
+            self._object_decoder = msgspec.json.Decoder(dict)
+            self._decode = msgspec.json.Decoder().decode
+        elif name == 'orjson':
+            self._decode = orjson.loads
+
+    def encoder(self, sort_keys=False, default=None):
+        """返回 obj -> bytes 的编码函数（default 处理无法直接编码的值，同 json.dumps）"""
+        if self.name == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            fast = lambda obj: orjson.dumps(obj, default=default, option=option)  # noqa: E731
+        elif self.name == 'msgspec' and default is None:
+            # msgspec 直接编码日期时间等类型（不交给 default），指定 default 时使用标准库以保持输出一致
+            fast = msgspec.json.Encoder(order='sorted' if sort_keys else None).encode
+        else:
+            fast = None
+
+        def encode(obj):
+            if fast is not None:
+                try:
+                    return fast(obj)
+                except self.ENCODE_ERRORS:
+                    pass
+            return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(',', ':')).encode()
+        return encode
+
+    def dumps(self, obj):
+        """编码为 JSON 文本"""
+        if self.name == 'json':
+            return json.dumps(obj)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, data):
+        """解析 JSON 文本或 UTF-8 字节"""
+        if self.name == 'json' or (self.name == 'orjson' and self._has_long_number(data)):
+            return self._fallback(data)
+        try:
+            return self._decode(data)
+        except ValueError:
+            return self._fallback(data)
+
+    def loads_object(self, data):
+        """解析顶层为对象的 JSON（msgspec 在解码时直接校验类型），不是对象时抛出 ValueError"""
+        if self.name == 'msgspec':
+            try:
+                return self._object_decoder.decode(data)
+            except ValueError:
+                # 不是对象或超出快速实现的范围（如 1e400）：由标准库解析，错误信息与其他实现一致
+                value = self._fallback(data)
+        else:
+            value = self.loads(data)
+        if not isinstance(value, dict):
+            raise ValueError(f'Expected a JSON object, got {type(value).__name__}')
+        return value
+
+    @staticmethod
+    def _loads_standard(data):
+        """标准库解析，非有限浮点数标记为 _NonFiniteFloat"""
+        return json.loads(data, parse_float=_parse_float, parse_constant=_parse_float)
+
+    def _has_long_number(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8', 'surrogatepass')
+        return self.LONG_NUMBER in data.translate(self.DIGIT_TABLE)
+
+
+json_codec = JsonCodec(JSON_CODEC)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """
+    Flask 的 JSON 处理（request.json、jsonify）使用 json_codec；输出格式同默认实现（键排序、紧凑）
+    只覆盖公开的 dumps/loads，响应仍由默认实现的 response() 构建
+    """
+
+    # DefaultJSONProvider.response() 在非调试模式下传入的参数（紧凑输出，与 json_codec 的输出一致）
+    COMPACT_ARGS = {'separators': (',', ':')}
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._encode = json_codec.encoder(sort_keys=self.sort_keys, default=self.default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs and kwargs != self.COMPACT_ARGS:
+            # 缩进输出（调试模式）等其他参数使用默认实现
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_codec.loads(s)
+
+
+if json_codec.name != 'json':
+    app.json = CodecJSONProvider(app)
+
+
+# ============================================
+# 出站 HTTP 会话
+# ============================================
+
+http_session = None
+http_session_pid = None
+http_session_lock = threading.Lock()
+
+
+def create_http_session():
+    """创建 HTTP 会话：连接池复用 keep-alive 连接，连接失败和网关错误自动重试"""
+    session = requests.Session()
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.1,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session():
+    """获取当前进程共享的 HTTP 会话（fork 后的子进程重新创建，避免共用连接）"""
+    global http_session, http_session_pid
+    with http_session_lock:
+        if http_session is None or http_session_pid != os.getpid():
+            http_session = create_http_session()
+            http_session_pid = os.getpid()
+        return http_session
+
+
+def http_get(url, **kwargs):
+    """通过共享会话发起 GET 请求，默认使用分离的连接/读取超时"""
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return get_http_session().get(url, **kwargs)
+
+
+# ============================================
+# TLS 服务本地 IPC
+# ============================================
+
+class TLSSidecarClient:
+    """
+    通过 Unix domain socket 查询 TLS 服务的指纹存储
+    帧格式: 4 字节大端长度 + JSON；连接保持复用，避免回环 TLS 握手和 HTTP 解析
+    """
+
+    MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.pid = os.getpid()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _checkout(self):
+        """取出空闲连接，没有时新建；返回 (连接, 是否为复用连接)"""
+        if self.pid != os.getpid():
+            # fork 后不复用父进程的连接
+            self.idle = queue.LifoQueue()
+            self.pid = os.getpid()
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 65536))
+            if not chunk:
+                raise ConnectionError('TLS sidecar closed the connection')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def request(self, payload):
+        """发送一个请求帧并返回解析后的响应"""
+        body = json_codec.dumps_bytes(payload)
+        frame = struct.pack('>I', len(body)) + body
+        while True:
+            sock, reused = self._checkout()
+            try:
+                sock.sendall(frame)
+                size, = struct.unpack('>I', self._recv_exact(sock, 4))
+                if size > self.MAX_FRAME_SIZE:
+                    raise ConnectionError(f'TLS sidecar frame too large: {size} bytes')
+                data = self._recv_exact(sock, size)
+            except OSError:
+                sock.close()
+                if reused:
+                    # 复用的连接可能已被对端关闭，换新连接重试
+                    continue
+                raise
+            self.idle.put(sock)
+            return json_codec.loads(data)
+
+    def query_fingerprint(self, ip):
+        """按客户端 IP 查询 TLS/HTTP2/TCP 指纹"""
+        return self.request({'op': 'fingerprint', 'ip': ip})
+
+    def ping(self):
+        """检查 TLS 服务是否在响应"""
+        return self.request({'op': 'ping'})
+
+
+tls_ipc_client = TLSSidecarClient(TLS_IPC_SOCKET, HTTP_READ_TIMEOUT) if TLS_IPC_SOCKET else None
+
+
+def tls_server_running():
+    """
+    TLS 服务是否在运行
+    tls_process 只在启动它的进程中可信（gunicorn worker 从主进程 fork 得到的是失效的副本），
+    其他进程通过本地 IPC ping 判断
+    """
+    if tls_process is not None and tls_process_pid == os.getpid():
+        return tls_process.poll() is None
+    if tls_ipc_client is None:
+        return False
+    try:
+        return bool(tls_ipc_client.ping().get('success'))
+    except OSError:
+        return False
+
+
+TLS_SIDECAR_URL = f'https://127.0.0.1:{TLS_SERVER_PORT}/api/fingerprint'
+
+
+def lookup_network_fingerprint(client_ip):
+    """
+    采集时附带的同 IP TLS/HTTP2/TCP 指纹
+    优先读推送流内存表；当前进程未订阅推送流时（多进程部署）通过本地 IPC 查询
+    """
+    fingerprint = tls_stream_store.get(client_ip)
+    if fingerprint is not None or tls_stream_subscribed or tls_ipc_client is None:
+        return fingerprint
+    try:
+        result = tls_ipc_client.query_fingerprint(client_ip)
+    except OSError:
+        return None
+    return result.get('fingerprint') if result.get('success') else None
+
+
+def query_tls_sidecar(client_ip):
+    """
+    查询 TLS 服务记录的客户端指纹
+    依次使用：推送流内存表 → 本地 IPC → HTTPS 接口
+    """
+    fingerprint = tls_stream_store.get(client_ip)
+    if fingerprint is not None:
+        return {'success': True, 'client_ip': client_ip, 'fingerprint': fingerprint}
+
+    if tls_ipc_client is not None:
+        try:
+            return tls_ipc_client.query_fingerprint(client_ip)
+        except OSError:
+            pass
+
+    resp = http_get(TLS_SIDECAR_URL, verify=False)
+    return resp.json()
+
+
 # 注册退出时清理
 atexit.register(stop_tls_server)
 
 
 def signal_handler(signum, frame):
     """处理信号"""
+    write_behind.stop()
     stop_tls_server()
     sys.exit(0)
 
@@ -152,20 +645,241 @@ signal.signal(signal.SIGTERM, signal_handler)
 # SQLite 数据库操作
 # ============================================
 
+# 核心信号（前端字段名 → device_fingerprints 列名），模糊匹配按此计数
+CORE_SIGNAL_COLUMNS = (
+    ('audio', 'audio'),
+    ('canvasGeometry', 'canvas_geometry'),
+    ('webglRenderer', 'webgl_renderer'),
+    ('math', 'math'),
+)
+
+# 设备匹配所需的列（id 用于保持遍历顺序）
+DEVICE_SIGNAL_COLUMNS = (
+    'id', 'device_id',
+    'audio', 'canvas_geometry', 'webgl_renderer', 'math',
+    'screen', 'timezone', 'platform', 'hardware_concurrency',
+)
+
+# 从指纹数据提取到 fingerprints 独立列的热点字段: (列名, 类型, 候选路径)
+# 路径按顺序取第一个非空值；以 '@tls' 开头的路径相对于该指纹使用的 TLS 数据
+FINGERPRINT_COLUMNS = (
+    ('tls_id', 'TEXT', (('tls_id',),)),
+    ('combined_id', 'TEXT', (('combined_id',),)),
+    ('canvas_hash', 'TEXT', (('client', 'canvas', 'hash'),)),
+    ('webgl_renderer', 'TEXT', (('client', 'webgl', 'unmaskedRenderer'), ('client', 'webgl', 'renderer'))),
+    ('webgl_vendor', 'TEXT', (('client', 'webgl', 'unmaskedVendor'), ('client', 'webgl', 'vendor'))),
+    ('platform', 'TEXT', (('client', 'navigator', 'platform'),)),
+    ('automation_score', 'REAL', (('client', 'automation', 'score'),)),
+    ('ja3_hash', 'TEXT', (('@tls', 'ja3_hash'),)),
+    ('ja4', 'TEXT', (('@tls', 'ja4'),)),
+    ('http2_hash', 'TEXT', (('server', 'tls', 'http2', 'akamai_hash'),)),
+)
+FINGERPRINT_INDEXED_COLUMNS = ('ip', 'tls_id', 'canvas_hash', 'webgl_renderer', 'ja3_hash', 'ja4', 'http2_hash')
+# 提取规则变化时加 1，旧版本的行会被 backfill_fingerprint_columns 重新提取
+FINGERPRINT_COLUMNS_VERSION = 1
+
+
+class ConnectionPool:
+    """
+    SQLite 连接池
+    - 连接长期复用，避免每次调用都 open/close
+    - WAL 模式下读写互不阻塞，synchronous=NORMAL 减少 fsync
+    - busy_timeout 让并发写入排队等待而不是直接报 database is locked
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+        # INSERT OR REPLACE 替换旧行时也触发删除触发器，保持计数准确
+        conn.execute('PRAGMA recursive_triggers=ON')
+        return conn
+
+    def acquire(self):
+        """借出连接，池满时等待其他线程归还"""
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self.created -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError('database connection pool exhausted')
+
+    def close(self):
+        """关闭所有空闲连接（gunicorn 主进程 fork worker 之前调用，连接不跨进程使用）"""
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+            with self.lock:
+                self.created -= 1
+
+    def release(self, conn):
+        """归还连接，未提交的事务回滚（与关闭连接的语义一致）"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self.lock:
+                self.created -= 1
+            return
+        self.idle.put(conn)
+
+
+db_pool = None
+db_pool_lock = threading.Lock()
+
+
+def get_db_pool():
+    """获取当前进程的连接池（fork 后的子进程重新创建）"""
+    global db_pool
+    with db_pool_lock:
+        if db_pool is None or db_pool.pid != os.getpid() or db_pool.path != DB_PATH:
+            db_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+        return db_pool
+
+
 @contextmanager
 def get_db():
-    """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """获取数据库连接（从连接池借出，同一线程内嵌套调用复用同一连接）"""
+    pool = get_db_pool()
+    conn = getattr(pool.local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+
+    conn = pool.acquire()
+    pool.local.conn = conn
     try:
         yield conn
     finally:
-        conn.close()
+        pool.local.conn = None
+        pool.release(conn)
+
+
+@contextmanager
+def db_transaction():
+    """
+    工作单元：块内所有 DB 辅助函数共用同一连接，结束时只提交一次
+    异常时整体回滚；通过 after_commit 注册的回调在提交成功后执行
+    """
+    with get_db() as conn:
+        local = get_db_pool().local
+        if getattr(local, 'after_commit', None) is not None:
+            # 已处于事务中，并入外层事务
+            yield conn
+            return
+
+        local.after_commit = []
+        try:
+            yield conn
+            conn.commit()
+            callbacks = local.after_commit
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            local.after_commit = None
+
+    for callback in callbacks:
+        callback()
+
+
+def commit(conn):
+    """提交事务；处于 db_transaction 中时由外层统一提交"""
+    if getattr(get_db_pool().local, 'after_commit', None) is None:
+        conn.commit()
+
+
+def after_commit(callback):
+    """事务提交后执行回调；不在 db_transaction 中时立即执行"""
+    pending = getattr(get_db_pool().local, 'after_commit', None)
+    if pending is None:
+        callback()
+    else:
+        pending.append(callback)
+
+
+@contextmanager
+def savepoint(name='item'):
+    """
+    事务内的保存点：块内出错时只回滚块内的写入及其注册的提交后回调，外层事务继续
+    需在 db_transaction 中使用
+    """
+    with get_db() as conn:
+        pending = get_db_pool().local.after_commit
+        mark = len(pending)
+        if not conn.in_transaction:
+            # 先显式开始事务，否则释放最外层保存点会直接提交；
+            # 使用 IMMEDIATE 在开始时取得写锁：DEFERRED 事务先读后写时，若其他连接已提交写入，
+            # 升级为写锁会返回 SQLITE_BUSY_SNAPSHOT，busy_timeout 不会重试
+            conn.execute('BEGIN IMMEDIATE')
+        conn.execute(f'SAVEPOINT {name}')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f'ROLLBACK TO {name}')
+            conn.execute(f'RELEASE {name}')
+            del pending[mark:]
+            raise
+        conn.execute(f'RELEASE {name}')
+
+
+# 数据库中的时间统一为 UTC 'YYYY-MM-DD HH:MM:SS'（与 SQLite CURRENT_TIMESTAMP 一致），可直接按字符串比较
+DB_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def db_now():
+    """当前 UTC 时间（数据库时间格式）"""
+    return datetime.now(timezone.utc).strftime(DB_TIME_FORMAT)
+
+
+def normalize_time_bound(value):
+    """
+    将 since / until 参数转换为数据库时间格式
+    接受 ISO 8601 日期或日期时间（'T' 或空格分隔）；带时区时换算为 UTC，不带时区时按 UTC 处理
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError(f'Invalid time: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime(DB_TIME_FORMAT)
 
 
 def init_db():
-    """初始化数据库"""
+    """
+    初始化数据库
+    整个过程在一个写事务中完成：多个 worker 同时启动时依次执行，
+    补列、计数器初始化等"先检查再修改"的步骤不会互相冲突
+    """
     with get_db() as conn:
+        conn.execute('BEGIN IMMEDIATE')
         conn.execute('''
             CREATE TABLE IF NOT EXISTS fingerprints (
                 id TEXT PRIMARY KEY,
@@ -175,7 +889,69 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON fingerprints(created_at DESC)')
+        # 列表按 (created_at, id) 键集分页
+        conn.execute('DROP INDEX IF EXISTS idx_created_at')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprints_created_id ON fingerprints(created_at DESC, id DESC)')
+
+        # 行数计数器（由触发器维护，列表接口不再每次 COUNT(*) 全表）
+        conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        if not conn.execute("SELECT 1 FROM counters WHERE name = 'fingerprints'").fetchone():
+            conn.execute("INSERT INTO counters (name, value) SELECT 'fingerprints', COUNT(*) FROM fingerprints")
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_fingerprints_count_insert AFTER INSERT ON fingerprints
+            BEGIN UPDATE counters SET value = value + 1 WHERE name = 'fingerprints'; END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_fingerprints_count_delete AFTER DELETE ON fingerprints
+            BEGIN UPDATE counters SET value = value - 1 WHERE name = 'fingerprints'; END
+        ''')
+        # 热点字段列（旧库自动补列，已有数据由 backfill_fingerprint_columns 回填）
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(fingerprints)')}
+        for column, column_type, _ in FINGERPRINT_COLUMNS + (('columns_version', 'INTEGER', ()),):
+            if column not in existing:
+                conn.execute(f'ALTER TABLE fingerprints ADD COLUMN {column} {column_type}')
+        for column in FINGERPRINT_INDEXED_COLUMNS:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_fingerprints_{column} ON fingerprints({column})')
+
+        # 各版本方案计算出的 ID（与主 ID 并存，切换方案版本后旧 ID 仍可查询）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fingerprint_ids (
+                fingerprint_id TEXT NOT NULL,
+                scheme TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (fingerprint_id, scheme)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprint_ids_value ON fingerprint_ids(value, scheme)')
+
+        # 压缩字典（fingerprints.data 中记录字典 ID，解压时按 ID 读取）
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payload_dictionaries (
+                id INTEGER PRIMARY KEY,
+                method TEXT NOT NULL,
+                content BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        payload_codec.store_dictionary(conn)
+
+        # 去重存储的组件（按内容哈希寻址）及指纹对组件的引用
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS components (
+                hash TEXT PRIMARY KEY,
+                data NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fingerprint_components (
+                fingerprint_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (fingerprint_id, path)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_fingerprint_components_hash ON fingerprint_components(hash)')
 
         # 设备指纹表（用于设备唯一性判定）
         conn.execute('''
@@ -202,6 +978,12 @@ def init_db():
         ''')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_core_id ON device_fingerprints(core_id)')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_device_id ON device_fingerprints(device_id)')
+        # 核心信号两两组合索引：模糊匹配只需查找至少共享 2 个核心信号的候选设备
+        for (_, col_a), (_, col_b) in combinations(CORE_SIGNAL_COLUMNS, 2):
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_device_{col_a}_{col_b} '
+                f'ON device_fingerprints({col_a}, {col_b})'
+            )
 
         # 设备访问记录表
         conn.execute('''
@@ -217,58 +999,662 @@ def init_db():
             )
         ''')
         conn.execute('CREATE INDEX IF NOT EXISTS idx_device_visits_device_id ON device_visits(device_id)')
+        # 按时间范围增量导出
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_device_last_seen ON device_fingerprints(last_seen)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_device_visits_visit_time ON device_visits(visit_time)')
+
+        # 旧版本以本地时间 isoformat()（'T' 分隔）写入的时间转换为 UTC 数据库时间格式（只执行一次）
+        if conn.execute('PRAGMA user_version').fetchone()[0] < 1:
+            for table, column in (('fingerprints', 'created_at'), ('device_fingerprints', 'first_seen'),
+                                  ('device_fingerprints', 'last_seen')):
+                conn.execute(
+                    f"UPDATE {table} SET {column} = datetime({column}, 'utc') WHERE {column} LIKE '____-__-__T%'"
+                )
+            conn.execute('PRAGMA user_version = 1')
         conn.commit()
     print(f"[INFO] Database initialized at {DB_PATH}")
 
 
-def save_fingerprint(fp_id, fingerprint_data):
-    """保存指纹到数据库"""
+# ============================================
+# 异步批量写入（write-behind）
+# ============================================
+
+class WriteBehindQueue:
+    """
+    追加型写入的异步批量队列
+    - 每个队列项是一组语句（如组件与引用它们的指纹行），整组在同一事务中写入
+    - 后台线程按条数或时间攒批，用 executemany 在一个事务中写入
+    - 队列有上限，满时短暂等待，仍满则回退为同步写入整组（背压），组内依赖顺序不受影响
+    - 退出时（atexit / 信号）排空队列
+    """
+
+    def __init__(self, max_size, batch_size, flush_interval):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _ensure_started(self):
+        """按需启动后台线程（fork 后的子进程重新启动）"""
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self.thread.start()
+
+    def put(self, statements):
+        """入队一组写入 [(sql, params), ...]；队列满且等待超时时同步写入"""
+        statements = tuple(statements)
+        if not self.stopping.is_set():
+            self._ensure_started()
+            try:
+                self.queue.put(statements, timeout=WRITE_BEHIND_PUT_TIMEOUT_MS / 1000)
+                return
+            except queue.Full:
+                pass
+        self._flush([statements])
+
+    def _take(self):
+        """取出一批：攒满 batch_size 条或等待 flush_interval 后返回"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                if batch:
+                    batch.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                else:
+                    batch.append(self.queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        """按入队顺序展开各组语句，连续相同语句合并为 executemany，整批一个事务"""
+        statements = [statement for group in batch for statement in group]
+        try:
+            with get_db() as conn:
+                start = 0
+                while start < len(statements):
+                    end = start
+                    while end < len(statements) and statements[end][0] == statements[start][0]:
+                        end += 1
+                    conn.executemany(statements[start][0], [params for _, params in statements[start:end]])
+                    start = end
+                conn.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                print(f'[ERROR] Write-behind write failed: {e}')
+                return
+            # 整批失败时逐组重试，只丢弃出错的那一组
+            for group in batch:
+                self._flush([group])
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self._take()
+            if batch:
+                self._flush(batch)
+
+    def stop(self, timeout=10):
+        """停止后台线程并写入剩余数据"""
+        self.stopping.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(timeout)
+        # 线程未启动或未能及时退出时，在当前线程写完剩余数据
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._flush(batch)
+
+
+write_behind = WriteBehindQueue(WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_MS / 1000)
+atexit.register(write_behind.stop)
+
+
+def execute_writes(statements):
+    """
+    执行一组追加型写入 [(sql, params), ...]，组内语句按顺序在同一事务中写入
+    WRITE_BEHIND 开启时在事务提交后整组入队异步写入，否则直接在当前连接执行
+    """
+    if WRITE_BEHIND:
+        statements = tuple(statements)
+        after_commit(lambda: write_behind.put(statements))
+        return
     with get_db() as conn:
-        server = fingerprint_data.get('server', {})
-        conn.execute(
-            'INSERT OR REPLACE INTO fingerprints (id, data, ip, user_agent, created_at) VALUES (?, ?, ?, ?, ?)',
+        for sql, params in statements:
+            conn.execute(sql, params)
+        commit(conn)
+
+
+def execute_write(sql, params):
+    """执行单条追加型写入"""
+    execute_writes([(sql, params)])
+
+
+# ============================================
+# 指纹数据压缩存储
+# ============================================
+
+class PayloadCodec:
+    """
+    fingerprints.data 的存储编码
+    - 不压缩: JSON 文本 (TEXT)，与旧数据一致
+    - 压缩: BLOB = 0x01 + 算法标识 (1 字节) + 字典 ID (4 字节，0 表示无字典) + 压缩数据
+    读取时按头部识别，切换算法或字典后旧数据仍可读取
+    字典 ID 为字典内容的 CRC32；用过的字典保存在 payload_dictionaries 表中，更换字典后旧数据仍可解压
+    """
+
+    MAGIC = b'\x01'
+    METHODS = {'zlib': b'z', 'zstd': b's'}
+    DEFAULT_LEVELS = {'zlib': 6, 'zstd': 3}
+
+    def __init__(self, method='', level=0, dict_path=''):
+        if method and method not in self.METHODS:
+            raise ValueError(f'Unknown payload compression: {method}')
+        if method == 'zstd' and zstandard is None:
+            raise RuntimeError('PAYLOAD_COMPRESSION=zstd requires the zstandard package')
+        self.method = method
+        self.level = level or self.DEFAULT_LEVELS.get(method, 0)
+        self.dictionary = None
+        self.dict_id = 0
+        if method and dict_path:
+            with open(dict_path, 'rb') as f:
+                self.dictionary = f.read()
+            self.dict_id = zlib.crc32(self.dictionary)
+        self.dictionaries = {self.dict_id: self.dictionary} if self.dictionary else {}
+        self.header = self.MAGIC + self.METHODS[method] + struct.pack('>I', self.dict_id) if method else b''
+        # zstd 压缩/解压对象不能被多个线程同时使用
+        self.local = threading.local()
+
+    def encode(self, text):
+        """编码 JSON 文本，不压缩时原样返回"""
+        if not self.method:
+            return text
+        raw = text.encode()
+        if self.method == 'zlib':
+            if self.dictionary:
+                compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+                return self.header + compressor.compress(raw) + compressor.flush()
+            return self.header + zlib.compress(raw, self.level)
+        compressor = getattr(self.local, 'compressor', None)
+        if compressor is None:
+            dict_data = zstandard.ZstdCompressionDict(self.dictionary) if self.dictionary else None
+            compressor = self.local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+        return self.header + compressor.compress(raw)
+
+    def decode(self, data):
+        """解码为 JSON 文本，兼容未压缩的旧数据"""
+        if isinstance(data, str):
+            return data
+        if data[:1] != self.MAGIC:
+            return data.decode()
+        method = data[1:2]
+        dict_id = struct.unpack('>I', data[2:6])[0]
+        dictionary = self._dictionary(dict_id)
+        payload = data[6:]
+        if method == b'z':
+            if dictionary:
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                return (decompressor.decompress(payload) + decompressor.flush()).decode()
+            return zlib.decompress(payload).decode()
+        if method == b's':
+            if zstandard is None:
+                raise RuntimeError('Reading zstd-compressed fingerprints requires the zstandard package')
+            decompressors = getattr(self.local, 'decompressors', None)
+            if decompressors is None:
+                decompressors = self.local.decompressors = {}
+            decompressor = decompressors.get(dict_id)
+            if decompressor is None:
+                dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+                decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+            return decompressor.decompress(payload).decode()
+        raise ValueError(f'Unknown payload encoding: {method!r}')
+
+    def loads(self, data):
+        """解码并解析为 dict"""
+        return json_codec.loads(self.decode(data))
+
+    def store_dictionary(self, conn):
+        """将当前字典保存到数据库（init_db 时调用）"""
+        if self.dictionary:
+            conn.execute(
+                'INSERT OR IGNORE INTO payload_dictionaries (id, method, content) VALUES (?, ?, ?)',
+                (self.dict_id, self.method, self.dictionary)
+            )
+
+    def _dictionary(self, dict_id):
+        """按 ID 查找字典，不在内存中时从数据库读取"""
+        if not dict_id:
+            return None
+        if dict_id not in self.dictionaries:
+            with get_db() as conn:
+                row = conn.execute('SELECT content FROM payload_dictionaries WHERE id = ?', (dict_id,)).fetchone()
+            if row is None:
+                raise ValueError(f'Compression dictionary {dict_id:08x} not found')
+            self.dictionaries[dict_id] = bytes(row['content'])
+        return self.dictionaries[dict_id]
+
+
+payload_codec = PayloadCodec(PAYLOAD_COMPRESSION, PAYLOAD_COMPRESSION_LEVEL, PAYLOAD_DICT_PATH)
+
+
+# ============================================
+# 组件去重存储
+# ============================================
+
+# 按内容寻址单独存储的子文档路径；同一内容只保存一份，指纹中只记录哈希
+COMPONENT_PATHS = (
+    ('client', 'webgl'),
+    ('client', 'fonts'),
+    ('client', 'features'),
+    ('client', 'math'),
+    ('client', 'plugins'),
+    ('client', 'mimeTypes'),
+    ('client', 'audio'),
+    ('server', 'headers'),
+    ('server', 'tls', 'tls'),
+    ('server', 'tls', 'http2'),
+)
+
+
+def _without_path(doc, path):
+    """返回移除指定路径后的副本（只复制路径上的各层）"""
+    doc = dict(doc)
+    if len(path) == 1:
+        doc.pop(path[0], None)
+    else:
+        doc[path[0]] = _without_path(doc[path[0]], path[1:])
+    return doc
+
+
+def split_components(fingerprint):
+    """
+    拆分出可共享的子文档，原数据不会被修改
+    返回 (存储用文档, [(路径, 哈希, JSON 文本)])；存储用文档的 '$components' 记录 路径 -> 哈希
+    """
+    stored = fingerprint
+    refs = {}
+    components = []
+    for path in COMPONENT_PATHS:
+        value = lookup_path(fingerprint, path)
+        if not isinstance(value, (dict, list)) or not value:
+            continue
+        # 哈希需与已存储的组件一致，使用标准库编码
+        text = json.dumps(value, sort_keys=True, separators=(',', ':'))
+        if len(text) < COMPONENT_MIN_SIZE:
+            continue
+        digest = hashlib.sha256(text.encode()).hexdigest()[:32]
+        name = '.'.join(path)
+        refs[name] = digest
+        components.append((name, digest, text))
+        stored = _without_path(stored, path)
+    if refs:
+        stored = dict(stored)
+        stored['$components'] = refs
+    return stored, components
+
+
+def component_writes(fp_id, components):
+    """组件内容（已存在时跳过）及指纹与组件引用关系的写入语句，先清除该指纹的旧引用"""
+    statements = [('DELETE FROM fingerprint_components WHERE fingerprint_id = ?', (fp_id,))]
+    for name, digest, text in components:
+        statements.append((
+            'INSERT OR IGNORE INTO components (hash, data) VALUES (?, ?)',
+            (digest, payload_codec.encode(text))
+        ))
+    for name, digest, _ in components:
+        statements.append((
+            'INSERT INTO fingerprint_components (fingerprint_id, path, hash) VALUES (?, ?, ?)',
+            (fp_id, name, digest)
+        ))
+    return statements
+
+
+def save_components(fp_id, components):
+    """保存组件内容及指纹与组件的引用关系"""
+    execute_writes(component_writes(fp_id, components))
+
+
+def load_components(digests):
+    """批量读取组件 JSON 文本 {哈希: 文本}，优先使用缓存"""
+    texts = {}
+    missing = []
+    for digest in set(digests):
+        text = component_cache.get(digest)
+        if text is None:
+            missing.append(digest)
+        else:
+            texts[digest] = text
+    if missing:
+        with get_db() as conn:
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                rows = conn.execute(
+                    f'SELECT hash, data FROM components WHERE hash IN ({", ".join("?" for _ in chunk)})',
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    text = payload_codec.decode(row['data'])
+                    texts[row['hash']] = text
+                    # 组件内容按哈希寻址，不会变化
+                    component_cache.set(row['hash'], text, 86400)
+        for digest in missing:
+            if digest not in texts:
+                raise ValueError(f'Component {digest} not found')
+    return texts
+
+
+def decode_fingerprints(values):
+    """解码 fingerprints.data 并还原拆分出的组件（多行共用一次组件查询）"""
+    docs = [payload_codec.loads(value) for value in values]
+    refs = [doc.pop('$components', None) if isinstance(doc, dict) else None for doc in docs]
+    digests = [digest for ref in refs if ref for digest in ref.values()]
+    if not digests:
+        return docs
+    texts = load_components(digests)
+    for doc, ref in zip(docs, refs):
+        for name, digest in (ref or {}).items():
+            path = name.split('.')
+            node = doc
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = json_codec.loads(texts[digest])
+    return docs
+
+
+def decode_fingerprint(value):
+    """解码单条 fingerprints.data"""
+    return decode_fingerprints([value])[0]
+
+
+def get_component_usage(digest, limit=100):
+    """共享某个组件的指纹"""
+    with get_db() as conn:
+        count = conn.execute(
+            'SELECT COUNT(*) AS count FROM fingerprint_components WHERE hash = ?', (digest,)
+        ).fetchone()['count']
+        rows = conn.execute(
+            'SELECT fingerprint_id, path FROM fingerprint_components WHERE hash = ? LIMIT ?',
+            (digest, limit)
+        ).fetchall()
+        return count, [dict(row) for row in rows]
+
+
+def get_fingerprint_components(fp_id):
+    """指纹引用的组件及每个组件被多少指纹共享"""
+    with get_db() as conn:
+        rows = conn.execute(
+            'SELECT path, hash, '
+            '(SELECT COUNT(*) FROM fingerprint_components s WHERE s.hash = c.hash) AS shared_by '
+            'FROM fingerprint_components c WHERE fingerprint_id = ? ORDER BY path',
+            (fp_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def prune_components():
+    """删除没有被任何指纹引用的组件，返回删除数量"""
+    with get_db() as conn:
+        cursor = conn.execute(
+            'DELETE FROM components WHERE NOT EXISTS '
+            '(SELECT 1 FROM fingerprint_components r WHERE r.hash = components.hash)'
+        )
+        commit(conn)
+        return cursor.rowcount
+
+
+def extract_fingerprint_columns(fingerprint):
+    """按 FINGERPRINT_COLUMNS 提取热点字段，返回与列顺序一致的元组"""
+    roots = {'@tls': fingerprint_tls_data(fingerprint)}
+    values = []
+    for _, _, paths in FINGERPRINT_COLUMNS:
+        value = None
+        for path in paths:
+            if path[0] in roots:
+                value = lookup_path(roots[path[0]], path[1:])
+            else:
+                value = lookup_path(fingerprint, path)
+            if value is not None:
+                break
+        # 只保存 SQLite 可直接存储的标量
+        values.append(value if isinstance(value, (str, int, float)) else None)
+    return tuple(values)
+
+
+_FINGERPRINT_COLUMN_NAMES = ', '.join(column for column, _, _ in FINGERPRINT_COLUMNS)
+_FINGERPRINT_COLUMN_PLACEHOLDERS = ', '.join('?' for _ in FINGERPRINT_COLUMNS)
+
+
+def save_fingerprint(fp_id, fingerprint_data):
+    """保存指纹到数据库（热点字段同时写入独立列）"""
+    server = fingerprint_data.get('server', {})
+    stored = fingerprint_data
+    components = []
+    if COMPONENT_STORE:
+        stored, components = split_components(fingerprint_data)
+    # 组件与指纹行作为一组写入（异步写入时也在同一事务中），读取到指纹时组件一定已存在；
+    # 未开启组件存储时同样清除被替换指纹的旧组件引用
+    execute_writes([
+        *component_writes(fp_id, components),
+        (
+            f'INSERT OR REPLACE INTO fingerprints (id, data, ip, user_agent, created_at, '
+            f'{_FINGERPRINT_COLUMN_NAMES}, columns_version) '
+            f'VALUES (?, ?, ?, ?, ?, {_FINGERPRINT_COLUMN_PLACEHOLDERS}, ?)',
             (
                 fp_id,
-                json.dumps(fingerprint_data),
+                payload_codec.encode(json_codec.dumps(stored)),
                 server.get('ip'),
                 server.get('user_agent'),
-                datetime.now().isoformat()
+                db_now(),
+                *extract_fingerprint_columns(fingerprint_data),
+                FINGERPRINT_COLUMNS_VERSION,
             )
+        ),
+    ])
+
+
+def backfill_fingerprint_columns(batch_size=1000, progress=None):
+    """
+    为旧数据回填热点字段列
+    按 rowid 分批处理，每批一个事务，可随时中断后重新运行；返回回填的行数
+    """
+    assignments = ', '.join(f'{column} = ?' for column, _, _ in FINGERPRINT_COLUMNS)
+    last_rowid = 0
+    total = 0
+    while True:
+        with get_db() as conn:
+            rows = conn.execute(
+                'SELECT rowid, data FROM fingerprints '
+                'WHERE rowid > ? AND (columns_version IS NULL OR columns_version < ?) '
+                'ORDER BY rowid LIMIT ?',
+                (last_rowid, FINGERPRINT_COLUMNS_VERSION, batch_size)
+            ).fetchall()
+            if not rows:
+                return total
+            updates = []
+            for row in rows:
+                try:
+                    values = extract_fingerprint_columns(decode_fingerprint(row['data']))
+                except Exception:
+                    # 数据无法解析或解压时只标记为已处理，不中断回填
+                    values = (None,) * len(FINGERPRINT_COLUMNS)
+                updates.append((*values, FINGERPRINT_COLUMNS_VERSION, row['rowid']))
+            conn.executemany(
+                f'UPDATE fingerprints SET {assignments}, columns_version = ? WHERE rowid = ?',
+                updates
+            )
+            conn.commit()
+        last_rowid = rows[-1]['rowid']
+        total += len(rows)
+        if progress:
+            progress(total, last_rowid)
+
+
+def save_fingerprint_ids(fp_id, ids):
+    """保存各版本方案的 ID"""
+    for scheme, value in ids.items():
+        execute_write(
+            'INSERT OR REPLACE INTO fingerprint_ids (fingerprint_id, scheme, value) VALUES (?, ?, ?)',
+            (fp_id, scheme, value)
         )
-        conn.commit()
 
 
 def get_fingerprint(fp_id):
-    """根据 ID 获取指纹"""
+    """根据 ID 获取指纹（也可以是其它版本方案的浏览器 ID）"""
     with get_db() as conn:
         row = conn.execute('SELECT data FROM fingerprints WHERE id = ?', (fp_id,)).fetchone()
+        if not row:
+            row = conn.execute(
+                "SELECT f.data FROM fingerprint_ids i JOIN fingerprints f ON f.id = i.fingerprint_id "
+                "WHERE i.value = ? AND i.scheme LIKE 'browser_v%' LIMIT 1",
+                (fp_id,)
+            ).fetchone()
         if row:
-            return json.loads(row['data'])
+            return decode_fingerprint(row['data'])
         return None
 
 
-def get_all_fingerprints(limit=100):
-    """获取所有指纹"""
+# 可用于过滤/统计的列（均为独立列，不需要解析 data）
+FINGERPRINT_FILTER_COLUMNS = ('ip',) + tuple(column for column, _, _ in FINGERPRINT_COLUMNS)
+
+# 列表可选返回的字段（fields 参数）；summary 为历史页使用的摘要字段
+FINGERPRINT_LIST_FIELDS = ('id', 'created_at', 'ip', 'user_agent') + FINGERPRINT_FILTER_COLUMNS[1:]
+FINGERPRINT_SUMMARY_FIELDS = (
+    'id', 'created_at', 'ip', 'user_agent', 'tls_id',
+    'canvas_hash', 'webgl_renderer', 'platform', 'ja4', 'automation_score',
+)
+
+
+def fingerprint_filter_clause(filters):
+    """
+    将过滤条件转换为 WHERE 子句
+    filters: {列名: 值}，另支持:
+    - min_automation_score / max_automation_score: 评分范围
+    - ua: User-Agent 子串
+    - since / until: 创建时间范围（ISO 格式，不带时区时按 UTC；包含 since，不包含 until）
+    """
+    conditions = []
+    params = []
+    for key, value in (filters or {}).items():
+        if key in FINGERPRINT_FILTER_COLUMNS:
+            conditions.append(f'{key} = ?')
+        elif key == 'min_automation_score':
+            conditions.append('automation_score >= ?')
+        elif key == 'max_automation_score':
+            conditions.append('automation_score <= ?')
+        elif key == 'ua':
+            conditions.append("user_agent LIKE ? ESCAPE '\\'")
+            value = '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        elif key == 'since':
+            conditions.append('created_at >= ?')
+            value = normalize_time_bound(value)
+        elif key == 'until':
+            conditions.append('created_at < ?')
+            value = normalize_time_bound(value)
+        else:
+            raise ValueError(f'Unsupported filter: {key}')
+        params.append(value)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def encode_cursor(created_at, fp_id):
+    """分页游标：最后一行的 (created_at, id)"""
+    return base64.urlsafe_b64encode(json.dumps([created_at, fp_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, fp_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    return created_at, fp_id
+
+
+def list_fingerprint_page(limit=100, cursor=None, filters=None, fields=None):
+    """
+    按创建时间倒序分页获取指纹（键集分页，翻页代价与页码无关）
+    fields 为 None 时返回完整指纹，否则只返回指定的列（不解析 data）
+    返回 (指纹列表, 下一页游标或 None)
+    """
+    where, params = fingerprint_filter_clause(filters)
+    if cursor:
+        created_at, fp_id = decode_cursor(cursor)
+        where += (' AND ' if where else ' WHERE ') + '(created_at, id) < (?, ?)'
+        params += [created_at, fp_id]
+    if fields is not None:
+        unknown = set(fields) - set(FINGERPRINT_LIST_FIELDS)
+        if unknown:
+            raise ValueError(f'Unsupported field: {", ".join(sorted(unknown))}')
+    columns = 'data' if fields is None else ', '.join(fields)
+
     with get_db() as conn:
         rows = conn.execute(
-            'SELECT data FROM fingerprints ORDER BY created_at DESC LIMIT ?',
-            (limit,)
+            f'SELECT created_at AS _created_at, id AS _id, {columns} FROM fingerprints{where} '
+            f'ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [limit + 1]
         ).fetchall()
-        return [json.loads(row['data']) for row in rows]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['_created_at'], rows[-1]['_id'])
+    if fields is None:
+        items = decode_fingerprints([row['data'] for row in rows])
+    else:
+        items = [{field: row[field] for field in fields} for row in rows]
+    return items, next_cursor
 
 
-def get_fingerprint_count():
-    """获取指纹总数"""
+def get_all_fingerprints(limit=100, filters=None):
+    """获取最新的指纹（完整数据）"""
+    return list_fingerprint_page(limit=limit, filters=filters)[0]
+
+
+def get_fingerprint_count(filters=None):
+    """获取指纹总数；无过滤条件时读取计数器"""
     with get_db() as conn:
-        row = conn.execute('SELECT COUNT(*) as count FROM fingerprints').fetchone()
+        if not filters:
+            row = conn.execute("SELECT value FROM counters WHERE name = 'fingerprints'").fetchone()
+            if row is not None:
+                return row['value']
+        where, params = fingerprint_filter_clause(filters)
+        row = conn.execute(f'SELECT COUNT(*) as count FROM fingerprints{where}', params).fetchone()
         return row['count']
 
 
+def get_fingerprint_value_counts(column, limit=20, filters=None):
+    """按列统计出现次数最多的值"""
+    if column not in FINGERPRINT_FILTER_COLUMNS:
+        raise ValueError(f'Unsupported field: {column}')
+    where, params = fingerprint_filter_clause(filters)
+    where += (' AND ' if where else ' WHERE ') + f'{column} IS NOT NULL'
+    with get_db() as conn:
+        rows = conn.execute(
+            f'SELECT {column} AS value, COUNT(*) AS count FROM fingerprints{where} '
+            f'GROUP BY {column} ORDER BY count DESC LIMIT ?',
+            params + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
 def delete_fingerprint(fp_id):
     """删除指纹"""
     with get_db() as conn:
         cursor = conn.execute('DELETE FROM fingerprints WHERE id = ?', (fp_id,))
-        conn.commit()
+        conn.execute('DELETE FROM fingerprint_ids WHERE fingerprint_id = ?', (fp_id,))
+        conn.execute('DELETE FROM fingerprint_components WHERE fingerprint_id = ?', (fp_id,))
+        commit(conn)
         return cursor.rowcount > 0
 
 
@@ -276,64 +1662,452 @@ def delete_all_fingerprints():
     """清空所有指纹"""
     with get_db() as conn:
         cursor = conn.execute('DELETE FROM fingerprints')
-        conn.commit()
+        conn.execute('DELETE FROM fingerprint_ids')
+        conn.execute('DELETE FROM fingerprint_components')
+        conn.execute('DELETE FROM components')
+        commit(conn)
         return cursor.rowcount
 
 
+# ============================================
+# 数据导出
+# ============================================
+
+# 表名: (时间列, 主键列)；since / until 按时间列过滤，按主键分块读取
+# （last_seen 等时间列会在导出期间被更新，以它分页会重复或遗漏行；主键不会变化）
+EXPORT_TABLES = {
+    'fingerprints': ('created_at', 'id'),
+    'device_fingerprints': ('last_seen', 'id'),
+    'device_visits': ('visit_time', 'id'),
+}
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def export_query(table, filters=None):
+    """
+    校验导出参数，返回 (列名, WHERE 子句, 参数)
+    filters: since / until（时间列范围，包含 since，不包含 until）；
+    fingerprints 另支持 /api/fingerprints 的全部过滤条件
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f'Unsupported table: {table}')
+    time_column, _ = EXPORT_TABLES[table]
+    if table == 'fingerprints':
+        where, params = fingerprint_filter_clause(filters)
+        return FINGERPRINT_LIST_FIELDS + ('data',), where, params
+
+    conditions = []
+    params = []
+    for key, value in (filters or {}).items():
+        if key == 'since':
+            conditions.append(f'{time_column} >= ?')
+        elif key == 'until':
+            conditions.append(f'{time_column} < ?')
+        else:
+            raise ValueError(f'Unsupported filter: {key}')
+        params.append(normalize_time_bound(value))
+    with get_db() as conn:
+        columns = tuple(row['name'] for row in conn.execute(f'PRAGMA table_info({table})'))
+    return columns, (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def iter_export_rows(table, columns, where, params, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    分块读取导出数据，逐块产出字典列表
+    - 按主键键集分页，每块一个短查询，不长期占用读事务，内存占用与表大小无关
+    - fingerprints 的 data 列解码为完整指纹
+    """
+    _, key_column = EXPORT_TABLES[table]
+    last = None
+    while True:
+        clause, clause_params = where, list(params)
+        if last is not None:
+            clause += (' AND ' if clause else ' WHERE ') + f'{key_column} > ?'
+            clause_params.append(last)
+        with get_db() as conn:
+            rows = conn.execute(
+                f'SELECT {", ".join(columns)} FROM {table}{clause} '
+                f'ORDER BY {key_column} LIMIT ?',
+                clause_params + [chunk_size]
+            ).fetchall()
+        if not rows:
+            return
+        last = rows[-1][key_column]
+        items = [dict(row) for row in rows]
+        if table == 'fingerprints':
+            for item, fingerprint in zip(items, decode_fingerprints([item['data'] for item in items])):
+                item['data'] = fingerprint
+        yield items
+        if len(rows) < chunk_size:
+            return
+
+
+def export_ndjson(chunks):
+    """每行一个 JSON 对象"""
+    for items in chunks:
+        yield ''.join(json_codec.dumps(item) + '\n' for item in items)
+
+
+def export_csv(columns, chunks):
+    """CSV（嵌套的对象/数组以 JSON 文本写入单元格）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for items in chunks:
+        for item in items:
+            writer.writerow([
+                json_codec.dumps(item[column]) if isinstance(item[column], (dict, list)) else item[column]
+                for column in columns
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# ============================================
+# 采集数据模型
+# ============================================
+
+# 采集数据中的列表字段，条数超过 COLLECT_MAX_ARRAY_ITEMS 时拒绝
+COLLECT_ARRAY_PATHS = (
+    ('fonts',),
+    ('webgl', 'extensions'),
+    ('navigator', 'languages'),
+    ('plugins', 'list'),
+    ('mimeTypes', 'list'),
+    ('webrtcIps',),
+)
+
+# 客户端提交的 TLS 数据中参与 TLS ID 计算的列表字段 → 元素类型（stable_tls_fields 依赖这些类型）
+TLS_ARRAY_FIELDS = (
+    ('ciphers', str),
+    ('extensions', dict),
+    ('supported_groups', str),
+    ('supported_versions', str),
+)
+
+# 设备信号允许的取值（可存入 SQLite 并参与相等比较）
+SIGNAL_VALUE_TYPES = (str, int, float, type(None))
+
+# 采集数据的最大嵌套层数（前端数据不超过 10 层；过深的数据在计算 ID 时会超出递归深度）
+COLLECT_MAX_DEPTH = 128
+
+
+def check_array_size(value, name):
+    """列表条数超过 COLLECT_MAX_ARRAY_ITEMS 时抛出 ValueError"""
+    if isinstance(value, list) and len(value) > COLLECT_MAX_ARRAY_ITEMS:
+        raise ValueError(f'{name} has too many items (max {COLLECT_MAX_ARRAY_ITEMS})')
+
+
+def check_nesting_depth(value, limit=COLLECT_MAX_DEPTH):
+    """对象/数组嵌套超过 limit 层时抛出 ValueError"""
+    stack = [(value, 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > limit:
+            raise ValueError(f'Payload is nested too deeply (max {limit} levels)')
+        for child in (node.values() if isinstance(node, dict) else node):
+            if isinstance(child, (dict, list)):
+                stack.append((child, depth + 1))
+
+
+class DeviceSignals:
+    """设备稳定信号（deviceId.signals）中匹配与存储使用的字段，属性名与 device_fingerprints 的列名一致"""
+
+    # 前端字段名 → 属性名
+    FIELDS = (
+        ('audio', 'audio'),
+        ('canvasGeometry', 'canvas_geometry'),
+        ('webglRenderer', 'webgl_renderer'),
+        ('webglVendor', 'webgl_vendor'),
+        ('fonts', 'fonts'),
+        ('math', 'math'),
+        ('screen', 'screen'),
+        ('timezone', 'timezone'),
+        ('platform', 'platform'),
+        ('hardwareConcurrency', 'hardware_concurrency'),
+    )
+
+    __slots__ = tuple(attr for _, attr in FIELDS)
+
+    def __init__(self, data):
+        for key, attr in self.FIELDS:
+            value = data.get(key)
+            if not isinstance(value, SIGNAL_VALUE_TYPES):
+                raise ValueError(f'deviceId.signals.{key} must be a string, number or null')
+            setattr(self, attr, value)
+
+
+class DeviceIdentity:
+    """设备标识（前端 deviceId），设备匹配、保存与批量预取使用"""
+
+    __slots__ = ('core_id', 'extended_id', 'device_id', 'confidence', 'signals')
+
+    def __init__(self, data):
+        for key in ('coreId', 'fullCoreId', 'extendedId', 'fullExtendedId'):
+            if not isinstance(data.get(key), (str, type(None))):
+                raise ValueError(f'deviceId.{key} must be a string')
+        confidence = data.get('confidence', 0)
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+            raise ValueError('deviceId.confidence must be a number')
+        signals = data.get('signals') or {}
+        if not isinstance(signals, dict):
+            raise ValueError('deviceId.signals must be an object')
+
+        self.core_id = data.get('coreId') or (data.get('fullCoreId') or '')[:32]
+        self.extended_id = data.get('extendedId') or (data.get('fullExtendedId') or '')[:32]
+        # 使用 fullCoreId 作为 device_id（更稳定）
+        self.device_id = data.get('fullCoreId') or self.core_id
+        self.confidence = confidence
+        self.signals = DeviceSignals(signals)
+
+
+class CollectPayload:
+    """
+    一次采集提交的数据，在入口处校验一次，之后 ID 计算、设备匹配与存储共用
+    - data: 原始数据（原样参与浏览器指纹 ID 计算并存储，ID 不受校验影响）
+    - device: 设备标识，未提交时为 None
+    - tls: 客户端提交的 TLS 数据，未提交时为 None
+    数据不符合要求时抛出 ValueError
+    """
+
+    __slots__ = ('data', 'device', 'tls')
+
+    def __init__(self, data):
+        for path in COLLECT_ARRAY_PATHS:
+            check_array_size(lookup_path(data, path), '.'.join(path))
+
+        tls = data.get('tls') or None
+        if tls is not None:
+            if not isinstance(tls, dict):
+                raise ValueError('tls must be an object')
+            for key, item_type in TLS_ARRAY_FIELDS:
+                if key not in tls:
+                    continue
+                items = tls[key]
+                if not isinstance(items, list) or not all(isinstance(item, item_type) for item in items):
+                    raise ValueError(f'tls.{key} must be a list of {"objects" if item_type is dict else "strings"}')
+                check_array_size(items, f'tls.{key}')
+            if not all(isinstance(item.get('name', ''), str) for item in tls.get('extensions', ())):
+                raise ValueError('tls.extensions[].name must be a string')
+
+        device = data.get('deviceId') or None
+        if device is not None and not isinstance(device, dict):
+            raise ValueError('deviceId must be an object')
+
+        self.data = data
+        self.tls = tls
+        self.device = DeviceIdentity(device) if device else None
+
+
 # ============================================
 # 设备匹配相关函数
 # ============================================
 
-def match_device(device_id_data):
+def find_candidate_devices(conn, signals, min_id=0):
+    """
+    查找至少共享 2 个核心信号的候选设备
+    利用核心信号两两组合索引，代价只与候选数量相关，不随设备总数增长
+    结果按 id 排序，与全表扫描的遍历顺序一致；min_id 用于只查询缓存之后新增的设备
+    """
+    subqueries = []
+    params = []
+    for (col_a, value_a), (col_b, value_b) in combinations(matchable_core_signals(signals), 2):
+        # 使用 IS 以保持 None == NULL 的比较语义
+        subqueries.append(f'SELECT id FROM device_fingerprints WHERE {col_a} IS ? AND {col_b} IS ?')
+        params.extend((value_a, value_b))
+
+    return conn.execute(
+        f'SELECT {", ".join(DEVICE_SIGNAL_COLUMNS)} FROM device_fingerprints '
+        f'WHERE id > ? AND id IN ({" UNION ".join(subqueries)}) ORDER BY id',
+        [min_id] + params
+    ).fetchall()
+
+
+def matchable_core_signals(signals):
+    """
+    返回可参与匹配的核心信号 [(列名, 值)]（DeviceSignals 的属性名即列名）
+    None 与其他值一样参与匹配，与 match_device 评分中 None == None 计为匹配一致
+    """
+    return [(column, getattr(signals, column)) for _, column in CORE_SIGNAL_COLUMNS]
+
+
+class DeviceSignalCache:
+    """
+    设备信号内存缓存
+    - 只保存匹配所需的核心/环境信号，字符串做 intern 以共享重复值
+    - 按核心信号两两组合建立倒排索引，模糊匹配无需读取整表
+    - 启动时加载，插入路径写穿；每次匹配前增量同步其他进程新增的设备
+    - 超过 DEVICE_CACHE_MAX_DEVICES 或未加载时返回 False，调用方回退到 SQLite 索引查询
+    """
+
+    def __init__(self, max_devices):
+        self.max_devices = max_devices
+        self.lock = threading.Lock()
+        self.devices = {}      # id -> 信号元组（按 DEVICE_SIGNAL_COLUMNS 顺序）
+        self.pair_index = {}   # (列 a, 值 a, 列 b, 值 b) -> [id, ...]
+        self.synced_id = 0     # 已从数据库同步到的最大 id
+        self.ready = False
+        self.disabled = max_devices <= 0
+
+    def _add(self, row):
+        """添加一行设备信号（需持有锁）"""
+        entry = tuple(sys.intern(v) if isinstance(v, str) else v for v in row)
+        device = dict(zip(DEVICE_SIGNAL_COLUMNS, entry))
+        if device['id'] in self.devices:
+            return
+        self.devices[device['id']] = entry
+        for (_, col_a), (_, col_b) in combinations(CORE_SIGNAL_COLUMNS, 2):
+            key = (col_a, device[col_a], col_b, device[col_b])
+            self.pair_index.setdefault(key, []).append(device['id'])
+
+    def _disable(self):
+        """超出内存上限，释放缓存并回退到 SQLite（需持有锁）"""
+        print(f'[WARN] Device cache exceeds {self.max_devices} devices, falling back to SQLite')
+        self.devices = {}
+        self.pair_index = {}
+        self.ready = False
+        self.disabled = True
+
+    def sync(self, conn):
+        """
+        增量加载 id 大于已同步位置的设备，返回缓存是否可用
+        连接处于未提交事务中时不加载（避免缓存读到可能回滚的数据）
+        """
+        if self.disabled:
+            return False
+        if conn.in_transaction:
+            return self.ready
+        with self.lock:
+            rows = conn.execute(
+                f'SELECT {", ".join(DEVICE_SIGNAL_COLUMNS)} FROM device_fingerprints WHERE id > ? ORDER BY id',
+                (self.synced_id,)
+            ).fetchall()
+            if len(self.devices) + len(rows) > self.max_devices:
+                self._disable()
+                return False
+            for row in rows:
+                self._add(tuple(row))
+                self.synced_id = row['id']
+            self.ready = True
+            return True
+
+    def add(self, row):
+        """写穿：新设备插入数据库后同步写入缓存"""
+        with self.lock:
+            if not self.ready:
+                return
+            if len(self.devices) >= self.max_devices:
+                self._disable()
+                return
+            self._add(row)
+
+    def find_candidates(self, signals):
+        """查找至少共享 2 个核心信号的候选设备，语义与 find_candidate_devices 一致"""
+        values = matchable_core_signals(signals)
+        ids = set()
+        with self.lock:
+            for (col_a, value_a), (col_b, value_b) in combinations(values, 2):
+                ids.update(self.pair_index.get((col_a, value_a, col_b, value_b), ()))
+            entries = [self.devices[i] for i in sorted(ids)]
+        return [dict(zip(DEVICE_SIGNAL_COLUMNS, entry)) for entry in entries]
+
+
+device_cache = DeviceSignalCache(DEVICE_CACHE_MAX_DEVICES)
+
+
+def prefetch_devices(core_ids):
+    """
+    批量精确匹配：一次查询取出一批 core_id 对应的已有设备
+    返回 {core_id: 设备行或 None}，作为 match_device 的 known_devices 参数
+    """
+    core_ids = list(dict.fromkeys(core_ids))
+    known = dict.fromkeys(core_ids)
+    with get_db() as conn:
+        # 每条语句的参数个数有上限，分段查询
+        for start in range(0, len(core_ids), 500):
+            chunk = core_ids[start:start + 500]
+            rows = conn.execute(
+                f'SELECT * FROM device_fingerprints WHERE core_id IN ({", ".join("?" for _ in chunk)}) ORDER BY id',
+                chunk
+            )
+            for row in rows:
+                if known[row['core_id']] is None:
+                    known[row['core_id']] = dict(row)
+    return known
+
+
+def match_device(device, known_devices=None):
     """
     设备匹配逻辑
     三层匹配策略：
     1. coreId 精确匹配 → 置信度 95%+，同一设备
     2. 核心信号 ≥3/4 匹配 → 置信度 70-90%，可能同一设备
     3. 环境信号相似度 > 0.6 → 置信度 50-70%，需人工确认
+    device: DeviceIdentity
+    known_devices: 批量采集时 prefetch_devices 预取的结果，命中时不再逐条查询（随匹配结果同步更新）
     """
-    if not device_id_data:
+    if not device:
         return None
 
-    core_id = device_id_data.get('coreId') or device_id_data.get('fullCoreId', '')[:32]
-    signals = device_id_data.get('signals', {})
+    core_id = device.core_id
+    signals = device.signals
 
     with get_db() as conn:
         # 第一层：精确匹配 core_id
-        row = conn.execute(
-            'SELECT * FROM device_fingerprints WHERE core_id = ?',
-            (core_id,)
-        ).fetchone()
+        if known_devices is not None and core_id in known_devices:
+            row = known_devices[core_id]
+        else:
+            row = conn.execute(
+                'SELECT * FROM device_fingerprints WHERE core_id = ?',
+                (core_id,)
+            ).fetchone()
 
         if row:
             # 找到匹配，更新访问记录
             conn.execute(
                 'UPDATE device_fingerprints SET last_seen = ?, visit_count = visit_count + 1 WHERE core_id = ?',
-                (datetime.now().isoformat(), core_id)
+                (db_now(), core_id)
             )
-            conn.commit()
+            commit(conn)
+            if known_devices is not None:
+                known_devices[core_id] = dict(row, visit_count=row['visit_count'] + 1)
 
             return {
                 'match': True,
                 'match_type': 'exact',
-                'confidence': 95 + (5 if device_id_data.get('extendedId') == row['extended_id'] else 0),
+                'confidence': 95 + (5 if device.extended_id == row['extended_id'] else 0),
                 'device_id': row['device_id'],
                 'first_seen': row['first_seen'],
                 'visit_count': row['visit_count'] + 1,
             }
 
-        # 第二层：模糊匹配核心信号
-        all_devices = conn.execute('SELECT * FROM device_fingerprints').fetchall()
+        # 第二层：模糊匹配核心信号（仅在共享 ≥2 个核心信号的候选设备中查找）
+        # 优先使用内存缓存，缓存不可用时回退到 SQLite 索引查询
+        if device_cache.sync(conn):
+            candidates = device_cache.find_candidates(signals)
+            if conn.in_transaction:
+                # 事务中未同步进缓存的设备（含本事务新增）直接查库补充
+                seen = {candidate['id'] for candidate in candidates}
+                candidates += [
+                    candidate for candidate in find_candidate_devices(conn, signals, min_id=device_cache.synced_id)
+                    if candidate['id'] not in seen
+                ]
+                candidates.sort(key=lambda candidate: candidate['id'])
+        else:
+            candidates = find_candidate_devices(conn, signals)
 
         best_match = None
         best_score = 0
 
-        for device in all_devices:
+        for candidate in candidates:
             core_matches = sum([
-                signals.get('audio') == device['audio'],
-                signals.get('canvasGeometry') == device['canvas_geometry'],
-                signals.get('webglRenderer') == device['webgl_renderer'],
-                signals.get('math') == device['math'],
+                signals.audio == candidate['audio'],
+                signals.canvas_geometry == candidate['canvas_geometry'],
+                signals.webgl_renderer == candidate['webgl_renderer'],
+                signals.math == candidate['math'],
             ])
 
             if core_matches >= 3:
@@ -344,19 +2118,17 @@ def match_device(device_id_data):
                         'match': True,
                         'match_type': 'fuzzy_core',
                         'confidence': score,
-                        'device_id': device['device_id'],
-                        'first_seen': device['first_seen'],
-                        'visit_count': device['visit_count'],
+                        'device_id': candidate['device_id'],
                         'core_matches': core_matches,
                     }
 
             # 第三层：环境信号相似度
             elif core_matches >= 2:
                 env_matches = sum([
-                    signals.get('screen') == device['screen'],
-                    signals.get('timezone') == device['timezone'],
-                    signals.get('platform') == device['platform'],
-                    signals.get('hardwareConcurrency') == device['hardware_concurrency'],
+                    signals.screen == candidate['screen'],
+                    signals.timezone == candidate['timezone'],
+                    signals.platform == candidate['platform'],
+                    signals.hardware_concurrency == candidate['hardware_concurrency'],
                 ])
                 env_total = 4
                 env_similarity = env_matches / env_total
@@ -369,9 +2141,7 @@ def match_device(device_id_data):
                             'match': True,
                             'match_type': 'fuzzy_env',
                             'confidence': int(score),
-                            'device_id': device['device_id'],
-                            'first_seen': device['first_seen'],
-                            'visit_count': device['visit_count'],
+                            'device_id': candidate['device_id'],
                             'core_matches': core_matches,
                             'env_similarity': env_similarity,
                         }
@@ -380,12 +2150,26 @@ def match_device(device_id_data):
             # 更新匹配设备的访问记录
             conn.execute(
                 'UPDATE device_fingerprints SET last_seen = ?, visit_count = visit_count + 1 WHERE device_id = ?',
-                (datetime.now().isoformat(), best_match['device_id'])
+                (db_now(), best_match['device_id'])
             )
-            conn.commit()
-            best_match['visit_count'] += 1
+            commit(conn)
+            row = conn.execute(
+                'SELECT first_seen, visit_count FROM device_fingerprints WHERE device_id = ?',
+                (best_match['device_id'],)
+            ).fetchone()
+            best_match['first_seen'] = row['first_seen']
+            best_match['visit_count'] = row['visit_count']
+            if known_devices is not None:
+                # 预取结果中该设备的访问次数已过期
+                for key in [key for key, known in known_devices.items()
+                            if known and known['device_id'] == best_match['device_id']]:
+                    del known_devices[key]
             return best_match
 
+    if known_devices is not None:
+        # 新设备随后会被保存，之后同一 core_id 的匹配需要查库
+        known_devices.pop(core_id, None)
+
     # 新设备
     return {
         'match': False,
@@ -395,21 +2179,19 @@ def match_device(device_id_data):
     }
 
 
-def save_device_fingerprint(device_id_data, ip_address, user_agent):
-    """保存设备指纹"""
-    if not device_id_data:
+def save_device_fingerprint(device, ip_address, user_agent):
+    """保存设备指纹（device: DeviceIdentity）"""
+    if not device:
         return None
 
-    core_id = device_id_data.get('coreId') or device_id_data.get('fullCoreId', '')[:32]
-    extended_id = device_id_data.get('extendedId') or device_id_data.get('fullExtendedId', '')[:32]
-    signals = device_id_data.get('signals', {})
-
-    # 使用 fullCoreId 作为 device_id（更稳定）
-    device_id = device_id_data.get('fullCoreId', core_id)
+    core_id = device.core_id
+    extended_id = device.extended_id
+    signals = device.signals
+    device_id = device.device_id
 
     with get_db() as conn:
         try:
-            conn.execute('''
+            cursor = conn.execute('''
                 INSERT INTO device_fingerprints (
                     device_id, core_id, extended_id,
                     audio, canvas_geometry, webgl_renderer, webgl_vendor,
@@ -420,19 +2202,25 @@ def save_device_fingerprint(device_id_data, ip_address, user_agent):
                 device_id,
                 core_id,
                 extended_id,
-                signals.get('audio'),
-                signals.get('canvasGeometry'),
-                signals.get('webglRenderer'),
-                signals.get('webglVendor'),
-                signals.get('fonts'),
-                signals.get('math'),
-                signals.get('screen'),
-                signals.get('timezone'),
-                signals.get('platform'),
-                signals.get('hardwareConcurrency'),
-                device_id_data.get('confidence', 0),
+                signals.audio,
+                signals.canvas_geometry,
+                signals.webgl_renderer,
+                signals.webgl_vendor,
+                signals.fonts,
+                signals.math,
+                signals.screen,
+                signals.timezone,
+                signals.platform,
+                signals.hardware_concurrency,
+                device.confidence,
             ))
-            conn.commit()
+            commit(conn)
+            # 写穿到内存缓存（读回存储后的值，保持与数据库一致的类型）
+            row = conn.execute(
+                f'SELECT {", ".join(DEVICE_SIGNAL_COLUMNS)} FROM device_fingerprints WHERE id = ?',
+                (cursor.lastrowid,)
+            ).fetchone()
+            after_commit(lambda: device_cache.add(tuple(row)))
             return device_id
         except sqlite3.IntegrityError:
             # 设备已存在，更新
@@ -440,24 +2228,33 @@ def save_device_fingerprint(device_id_data, ip_address, user_agent):
                 UPDATE device_fingerprints SET
                     extended_id = ?, last_seen = ?, visit_count = visit_count + 1
                 WHERE device_id = ?
-            ''', (extended_id, datetime.now().isoformat(), device_id))
-            conn.commit()
+            ''', (extended_id, db_now(), device_id))
+            commit(conn)
             return device_id
 
 
+def load_device_cache():
+    """启动时加载设备信号缓存"""
+    with get_db() as conn:
+        if device_cache.sync(conn):
+            print(f"[INFO] Device cache loaded: {len(device_cache.devices)} devices")
+
+
 def record_device_visit(device_id, ip_address, user_agent, match_type, confidence):
     """记录设备访问"""
-    with get_db() as conn:
-        conn.execute('''
-            INSERT INTO device_visits (device_id, ip_address, user_agent, match_type, confidence)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (device_id, ip_address, user_agent, match_type, confidence))
-        conn.commit()
+    # 显式记录访问时间，异步写入时不受排队延迟影响
+    visit_time = db_now()
+    execute_write('''
+        INSERT INTO device_visits (device_id, ip_address, user_agent, match_type, confidence, visit_time)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (device_id, ip_address, user_agent, match_type, confidence, visit_time))
 
 
 # 初始化数据库
 init_db()
 
+load_device_cache()
+
 
 def get_client_ip():
     """获取客户端真实 IP"""
@@ -469,10 +2266,276 @@ def get_client_ip():
         return request.remote_addr
 
 
+class TTLCache:
+    """带过期时间的 LRU 缓存（线程安全），记录命中/未命中次数"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.items = OrderedDict()  # key -> (过期时间, 值)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """返回未过期的缓存值，不存在时返回 None"""
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                if item[0] > time.monotonic():
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self.items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.items[key] = (time.monotonic() + ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+            }
+
+
+ip_info_cache = TTLCache(IP_INFO_CACHE_SIZE)
+
+# TLS 服务推送的指纹（客户端 IP -> {tls, http2, tcp}）
+tls_stream_store = TTLCache(TLS_STREAM_CACHE_SIZE)
+
+# 去重存储的组件内容（哈希 -> JSON 文本）
+component_cache = TTLCache(COMPONENT_CACHE_SIZE)
+
+
+def is_local_ip(ip):
+    """是否为非公网地址（私有、回环、链路本地、CGNAT、保留地址等）"""
+    if ip == 'localhost':
+        return True
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return not addr.is_global
+
+
 def get_ip_info(ip):
+    """查询 IP 详细信息（带缓存）"""
+    info = ip_info_cache.get(ip)
+    if info is None:
+        info = lookup_ip_info(ip)
+        cache_ip_info(ip, info)
+    return info
+
+
+def cache_ip_info(ip, info):
+    """缓存查询结果，成功与失败结果分别设置过期时间"""
+    ttl = IP_INFO_NEGATIVE_TTL if info['type'] == 'unknown' else IP_INFO_CACHE_TTL
+    ip_info_cache.set(ip, info, ttl)
+
+
+# ============================================
+# 离线 IP 数据库
+# ============================================
+# CSV 格式（首行为表头，start_ip/end_ip 外的列均可选）:
+#   start_ip,end_ip,country,country_code,region,city,isp,org,asn,timezone,is_proxy,is_datacenter,is_mobile
+# 加载时编译为二进制文件并内存映射，按起始地址二分查找:
+#   头部: magic(8) + IPv4 条数(u32) + IPv6 条数(u32) + 记录区长度(u32)
+#   IPv4 区: [start(4) end(4) record(u32)] * n，IPv6 区: [start(16) end(16) record(u32)] * n
+#   记录区: 去重后的记录 JSON 数组
+
+IP_DB_MAGIC = b'FPIPDB01'
+IP_DB_HEADER = struct.Struct('>8sIII')
+IP_DB_RECORD_FIELDS = (
+    'country', 'country_code', 'region', 'city', 'isp', 'org', 'asn', 'timezone',
+    'is_proxy', 'is_datacenter', 'is_mobile',
+)
+IP_DB_FLAG_FIELDS = ('is_proxy', 'is_datacenter', 'is_mobile')
+
+
+def build_ip_database(csv_path, bin_path):
+    """将 CSV 格式的 IP 段数据编译为可内存映射的二进制文件"""
+    ranges = {4: [], 6: []}
+    records = []
+    record_ids = {}
+
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            start = ipaddress.ip_address(row['start_ip'].strip())
+            end = ipaddress.ip_address(row['end_ip'].strip())
+            record = []
+            for field in IP_DB_RECORD_FIELDS:
+                value = (row.get(field) or '').strip()
+                if field in IP_DB_FLAG_FIELDS:
+                    value = value.lower() in ('1', 'true', 'yes')
+                record.append(value)
+            record = tuple(record)
+            if record not in record_ids:
+                record_ids[record] = len(records)
+                records.append(record)
+            ranges[start.version].append((start.packed, end.packed, record_ids[record]))
+
+    records_blob = json.dumps(records, ensure_ascii=False).encode('utf-8')
+    tmp_path = bin_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(IP_DB_HEADER.pack(IP_DB_MAGIC, len(ranges[4]), len(ranges[6]), len(records_blob)))
+        for version in (4, 6):
+            for start, end, record_id in sorted(ranges[version]):
+                f.write(start + end + struct.pack('>I', record_id))
+        f.write(records_blob)
+    os.replace(tmp_path, bin_path)
+
+
+class IPRangeDatabase:
+    """内存映射的 IP 段数据库，IPv4/IPv6 分区按起始地址二分查找"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n4, n6, records_len = IP_DB_HEADER.unpack_from(self.mm, 0)
+        if magic != IP_DB_MAGIC:
+            raise ValueError(f'{path} is not a compiled IP database')
+        offset = IP_DB_HEADER.size
+        # 版本 -> (区段偏移, 条数, 地址长度, 条目长度)
+        self.sections = {
+            4: (offset, n4, 4, 12),
+            6: (offset + n4 * 12, n6, 16, 36),
+        }
+        records_offset = offset + n4 * 12 + n6 * 36
+        records = json.loads(self.mm[records_offset:records_offset + records_len].decode('utf-8'))
+        self.records = [dict(zip(IP_DB_RECORD_FIELDS, record)) for record in records]
+        self.size = n4 + n6
+
+    def lookup(self, ip):
+        """返回 IP 所在段的记录，未收录时返回 None"""
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 6 and addr.ipv4_mapped:
+            addr = addr.ipv4_mapped
+        offset, count, width, stride = self.sections[addr.version]
+        key = addr.packed
+
+        # 查找最后一个 start <= key 的段（定长大端字节序比较即数值比较）
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = offset + mid * stride
+            if self.mm[pos:pos + width] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        pos = offset + (lo - 1) * stride
+        if key > self.mm[pos + width:pos + 2 * width]:
+            return None
+        record_id, = struct.unpack_from('>I', self.mm, pos + 2 * width)
+        return self.records[record_id]
+
+
+def load_ip_database(path):
+    """加载离线 IP 数据库；CSV 文件在首次加载或更新后自动编译为 .bin"""
+    if not path:
+        return None
+    try:
+        if path.lower().endswith('.csv'):
+            bin_path = path[:-4] + '.bin'
+            if not os.path.exists(bin_path) or os.path.getmtime(bin_path) < os.path.getmtime(path):
+                build_ip_database(path, bin_path)
+            path = bin_path
+        db = IPRangeDatabase(path)
+        print(f"[INFO] IP database loaded: {db.size} ranges from {path}")
+        return db
+    except Exception as e:
+        print(f"[WARNING] Failed to load IP database {path}: {e}")
+        return None
+
+
+ip_database = load_ip_database(IP_DB_PATH)
+
+
+def build_ip_info(ip, data, source):
+    """根据查询结果构建 IP 信息并计算风险分数"""
+    # 计算风险分数
+    risk_score = 0
+    if data.get('is_proxy'):
+        risk_score += 40
+    if data.get('is_datacenter'):
+        risk_score += 30
+    if data.get('is_mobile'):
+        risk_score += 10
+
+    if risk_score >= 50:
+        risk_level = '高风险'
+    elif risk_score >= 20:
+        risk_level = '中风险'
+    else:
+        risk_level = '低风险'
+
+    return {
+        'ip': ip,
+        'type': 'public',
+        'source': source,
+        'country': data.get('country') or '未知',
+        'country_code': data.get('country_code') or '',
+        'region': data.get('region') or '未知',
+        'city': data.get('city') or '未知',
+        'isp': data.get('isp') or '未知',
+        'org': data.get('org') or '未知',
+        'asn': data.get('asn') or '-',
+        'timezone': data.get('timezone') or '未知',
+        'is_proxy': data.get('is_proxy', False),
+        'is_vpn': data.get('is_proxy', False),
+        'is_datacenter': data.get('is_datacenter', False),
+        'is_mobile': data.get('is_mobile', False),
+        'risk_score': risk_score,
+        'risk_level': risk_level,
+    }
+
+
+# ip-api.com（免费，支持代理检测和时区）
+IP_API_URL = (
+    'http://ip-api.com/json/{ip}'
+    '?fields=status,message,country,countryCode,regionName,city,isp,org,as,proxy,hosting,mobile,timezone'
+)
+
+
+def lookup_ip_info(ip):
     """查询 IP 详细信息（地区、ISP、纯净度、时区等）"""
+    info = lookup_ip_info_offline(ip)
+    if info is not None:
+        return info
+
+    if not IP_LOOKUP_OFFLINE:
+        try:
+            info = parse_ip_api_response(ip, http_get(IP_API_URL.format(ip=ip)).json())
+            if info is not None:
+                return info
+        except Exception as e:
+            print(f'[WARN] IP info query failed: {e}')
+
+    return unknown_ip_info(ip)
+
+
+def lookup_ip_info_offline(ip):
+    """本地 IP 与离线数据库查询，未命中时返回 None"""
     # 本地 IP 不查询
-    if ip in ('127.0.0.1', 'localhost', '::1') or ip.startswith('192.168.') or ip.startswith('10.'):
+    if is_local_ip(ip):
         return {
             'ip': ip,
             'type': 'local',
@@ -482,6 +2545,7 @@ def get_ip_info(ip):
             'city': '-',
             'isp': '本地',
             'org': '-',
+            'asn': '-',
             'timezone': 'Local',
             'is_proxy': False,
             'is_vpn': False,
@@ -491,51 +2555,35 @@ def get_ip_info(ip):
             'risk_level': '安全',
         }
 
-    try:
-        # 使用 ip-api.com（免费，支持代理检测和时区）
-        resp = requests.get(
-            f'http://ip-api.com/json/{ip}?fields=status,message,country,countryCode,regionName,city,isp,org,proxy,hosting,mobile,timezone',
-            timeout=5
-        )
-        data = resp.json()
-
-        if data.get('status') == 'success':
-            # 计算风险分数
-            risk_score = 0
-            if data.get('proxy'):
-                risk_score += 40
-            if data.get('hosting'):
-                risk_score += 30
-            if data.get('mobile'):
-                risk_score += 10
-
-            if risk_score >= 50:
-                risk_level = '高风险'
-            elif risk_score >= 20:
-                risk_level = '中风险'
-            else:
-                risk_level = '低风险'
+    # 优先查询离线数据库
+    if ip_database is not None:
+        record = ip_database.lookup(ip)
+        if record is not None:
+            return build_ip_info(ip, record, 'local_db')
+    return None
 
-            return {
-                'ip': ip,
-                'type': 'public',
-                'country': data.get('country', '未知'),
-                'country_code': data.get('countryCode', ''),
-                'region': data.get('regionName', '未知'),
-                'city': data.get('city', '未知'),
-                'isp': data.get('isp', '未知'),
-                'org': data.get('org', '未知'),
-                'timezone': data.get('timezone', '未知'),
-                'is_proxy': data.get('proxy', False),
-                'is_vpn': data.get('proxy', False),
-                'is_datacenter': data.get('hosting', False),
-                'is_mobile': data.get('mobile', False),
-                'risk_score': risk_score,
-                'risk_level': risk_level,
-            }
-    except Exception as e:
-        print(f'[WARN] IP info query failed: {e}')
 
+def parse_ip_api_response(ip, data):
+    """解析 ip-api.com 的响应，查询失败时返回 None"""
+    if data.get('status') != 'success':
+        return None
+    return build_ip_info(ip, {
+        'country': data.get('country'),
+        'country_code': data.get('countryCode'),
+        'region': data.get('regionName'),
+        'city': data.get('city'),
+        'isp': data.get('isp'),
+        'org': data.get('org'),
+        'asn': data.get('as'),
+        'timezone': data.get('timezone'),
+        'is_proxy': data.get('proxy', False),
+        'is_datacenter': data.get('hosting', False),
+        'is_mobile': data.get('mobile', False),
+    }, 'ip-api')
+
+
+def unknown_ip_info(ip):
+    """查询失败时的结果"""
     return {
         'ip': ip,
         'type': 'unknown',
@@ -545,6 +2593,7 @@ def get_ip_info(ip):
         'city': '-',
         'isp': '-',
         'org': '-',
+        'asn': '-',
         'timezone': '-',
         'is_proxy': None,
         'is_vpn': None,
@@ -584,96 +2633,326 @@ def collect_server_fingerprint():
     }
 
 
-def generate_browser_fingerprint_id(data):
-    """生成浏览器指纹 ID（基于 Canvas, WebGL, Audio 等稳定特征）"""
-    client = data.get('client', {}).copy()
-
-    # 移除变化字段
-    client.pop('timestamp', None)
-    client.pop('hash', None)
-    client.pop('timing', None)
-    client.pop('tls', None)  # TLS 单独处理
-    client.pop('incognito', None)  # 无痕模式检测结果不影响 ID
-
-    # 移除 screen 中的窗口相关字段（会随窗口变化）
-    if 'screen' in client:
-        screen = client['screen'].copy() if isinstance(client['screen'], dict) else {}
-        screen.pop('innerWidth', None)
-        screen.pop('innerHeight', None)
-        screen.pop('outerWidth', None)
-        screen.pop('outerHeight', None)
-        screen.pop('availWidth', None)
-        screen.pop('availHeight', None)
-        screen.pop('screenX', None)  # 窗口位置会随拖动变化
-        screen.pop('screenY', None)
-        client['screen'] = screen
-
-    # 移除 navigator 中不稳定的字段
-    if 'navigator' in client and isinstance(client['navigator'], dict):
-        navigator = client['navigator'].copy()
-        navigator.pop('connection', None)  # effectiveType/downlink/rtt 都会随网络变化
-        navigator.pop('languages', None)  # 无痕模式会简化 languages 数组
-        navigator.pop('doNotTrack', None)  # 无痕模式可能改变 DNT 设置
-        client['navigator'] = navigator
-
-    # 移除 audio 中不稳定的字段
-    if 'audio' in client and isinstance(client['audio'], dict):
-        audio = client['audio'].copy()
-        audio.pop('fingerprint', None)  # 浮点数计算可能有细微差异
-        audio.pop('baseLatency', None)  # 延迟会变化
-        audio.pop('outputLatency', None)
-        audio.pop('state', None)  # 第一次可能是 timeout，后续是 collected
-        audio.pop('error', None)  # 错误信息可能变化
-        client['audio'] = audio
-
-    # 移除 storage 中异步检测的字段
-    if 'storage' in client and isinstance(client['storage'], dict):
-        storage = client['storage'].copy()
-        storage.pop('indexedDBEnabled', None)  # indexedDB.open() 是异步的，第一次可能为 false
-        client['storage'] = storage
-
-    # 移除 automation 中不稳定的字段
-    if 'automation' in client and isinstance(client['automation'], dict):
-        automation = client['automation'].copy()
-        automation.pop('score', None)  # score 依赖于异步检测的结果
-        if 'checks' in automation and isinstance(automation['checks'], dict):
-            checks = automation['checks'].copy()
-            checks.pop('permissionsInconsistent', None)  # 异步检测，返回后才设置
-            checks.pop('languagesLengthZero', None)  # 依赖 languages 数组，无痕模式下不同
-            automation['checks'] = checks
-        client['automation'] = automation
-
-    stable_data = {
-        'client': client,
-        'user_agent': data.get('server', {}).get('user_agent', ''),
-        # 'accept_language' 可能在无痕模式下不同，不纳入计算
-        'accept_encoding': data.get('server', {}).get('accept_encoding', ''),
-    }
-    content = json.dumps(stable_data, sort_keys=True)
-    return hashlib.sha256(content.encode()).hexdigest()[:16]
+@contextmanager
+def timed(timings, name):
+    """记录代码块耗时（毫秒）到 timings[name]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
 
 
-def generate_tls_fingerprint_id(tls_data):
-    """生成 TLS 指纹 ID（基于稳定的 TLS 特征，排除 GREASE 和随机值，排序以消除顺序差异）"""
+def format_server_timing(timings):
+    """格式化为 Server-Timing 响应头（浏览器开发者工具可直接展示）"""
+    return ', '.join(f'{name};dur={duration:.2f}' for name, duration in timings.items())
+
+
+# ============================================
+# 响应压缩
+# ============================================
+
+COMPRESSIBLE_MIMETYPES = ('application/json',)
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[name] = q
+    return encodings
+
+
+def negotiate_encoding(header):
+    """选择压缩方式：客户端 q 值最高的，相同时 brotli 优先；都不接受时返回 None"""
+    encodings = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for name in (('br',) if brotli else ()) + ('gzip',):
+        q = encodings.get(name, encodings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(data, RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    """JSON 响应按 Accept-Encoding 压缩（流式导出等响应不处理）"""
+    if (not RESPONSE_COMPRESSION or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < RESPONSE_COMPRESS_MIN_SIZE:
+        return response
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# ============================================
+# 指纹 ID 方案（版本化）
+# ============================================
+
+def compile_exclusion_schema(excluded_fields, coerced_paths=()):
+    """将排除规则编译为嵌套节点 (drop, children, coerce)，避免每次请求重复解析路径"""
+    def new_node():
+        return [frozenset(), {}, False]
+
+    root = new_node()
+    for path, fields in excluded_fields.items():
+        node = root
+        for key in path:
+            node = node[1].setdefault(key, new_node())
+        node[0] = frozenset(fields)
+    for path in coerced_paths:
+        node = root
+        for key in path:
+            node = node[1].setdefault(key, new_node())
+        node[2] = True
+
+    def freeze(node):
+        drop, children, coerce = node
+        return drop, tuple((key, freeze(child)) for key, child in children.items()), coerce
+
+    return freeze(root)
+
+
+def apply_exclusion_schema(value, node):
+    """
+    按编译后的规则过滤数据，原数据不会被修改
+    只复制规则列出的层级（每层一次浅复制），其余子树按引用共享。这几次复制无法省去：
+    C 编码器只接受真实的 dict，过滤必须在编码前完成；在 Python 中边编码边过滤，
+    或用 dict 子类在编码时过滤，都比浅复制 + C 编码慢。实测过滤约 8µs，序列化约 150µs
+    """
+    drop, children, coerce = node
+    if not isinstance(value, dict):
+        return {} if coerce else value
+    value = value.copy()
+    for key in drop:
+        value.pop(key, None)
+    for key, child in children:
+        if key in value:
+            value[key] = apply_exclusion_schema(value[key], child)
+    return value
+
+
+def lookup_path(data, path, default=None):
+    """按路径取值，中间层缺失或不是对象时返回默认值"""
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return default
+        data = data[key]
+    return data
+
+
+# 与 json.dumps(..., sort_keys=True) 输出一致；数据来自 JSON 解析不会有循环引用，省去循环检测
+# ID 由输出的字节计算，始终使用标准库（不使用 json_codec）
+_canonical_json = json.JSONEncoder(sort_keys=True, check_circular=False).encode
+
+
+class FingerprintIdScheme:
+    """
+    版本化的指纹 ID 方案
+    - include: 输出字段 -> (源路径, 默认值)，为 None 时使用整个输入
+    - exclude: 路径 -> 该层需要移除的字段（路径基于 include 之后的结构）
+    - coerce: 不是对象时按空对象处理的路径
+    - transform: 过滤后的进一步整理（去 GREASE、排序等）
+    修改规则时注册新版本而不是改动已有版本，已存储的 ID 保持不变
+    """
+
+    def __init__(self, kind, version, include=None, exclude=None, coerce=(), transform=None):
+        self.kind = kind
+        self.version = version
+        self.include = None if include is None else tuple(
+            (key, tuple(path), default) for key, (path, default) in include.items()
+        )
+        self.schema = compile_exclusion_schema(exclude or {}, coerce)
+        self.transform = transform
+
+    @property
+    def name(self):
+        return f'{self.kind}_v{self.version}'
+
+    def extract(self, data):
+        """提取参与计算的稳定数据"""
+        if self.include is not None:
+            data = {key: lookup_path(data, path, default) for key, path, default in self.include}
+        data = apply_exclusion_schema(data, self.schema)
+        if self.transform:
+            data = self.transform(data)
+        return data
+
+    def compute(self, data):
+        """计算 ID，没有输入数据时返回 None"""
+        if data is None:
+            return None
+        content = _canonical_json(self.extract(data))
+        return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+ID_SCHEMES = {}  # kind -> {version: FingerprintIdScheme}
+
+
+def register_id_scheme(scheme):
+    """注册 ID 方案"""
+    ID_SCHEMES.setdefault(scheme.kind, {})[scheme.version] = scheme
+    return scheme
+
+
+def get_id_scheme(kind, version=None):
+    """获取 ID 方案，未指定版本时返回主版本"""
+    if version is None:
+        version = ID_SCHEME_PRIMARY.get(kind)
+    return ID_SCHEMES[kind][version]
+
+
+def active_id_schemes():
+    """每次采集需要计算的方案：主版本 + ID_SCHEME_VERSIONS 指定的版本（未指定时为全部已注册版本）"""
+    schemes = [get_id_scheme(kind) for kind in ID_SCHEMES]
+    for kind, versions in ID_SCHEMES.items():
+        for version, scheme in sorted(versions.items()):
+            if scheme not in schemes and (not ID_SCHEME_VERSIONS or scheme.name in ID_SCHEME_VERSIONS):
+                schemes.append(scheme)
+    return schemes
+
+
+def fingerprint_tls_data(fingerprint):
+    """指纹使用的 TLS 数据：优先客户端提交的，其次是 TLS 服务推送的（与采集时一致）"""
+    tls_data = lookup_path(fingerprint, ('client', 'tls'))
     if not tls_data:
-        return None
+        tls_data = lookup_path(fingerprint, ('server', 'tls', 'tls'))
+    return tls_data if isinstance(tls_data, dict) else None
+
+
+def compute_fingerprint_ids(fingerprint, tls_data=None):
+    """
+    一次计算所有启用方案的 ID
+    返回 {方案名: ID}，如 {'browser_v1': '...', 'tls_v1': '...'}；无 TLS 数据时不含 tls 方案
+    """
+    inputs = {'browser': fingerprint, 'tls': tls_data or None}
+    ids = {}
+    for scheme in active_id_schemes():
+        fp_id = scheme.compute(inputs.get(scheme.kind))
+        if fp_id is not None:
+            ids[scheme.name] = fp_id
+    return ids
+
 
-    # 只提取稳定字段，并排序以消除顺序随机化的影响
-    stable_tls = {
-        'tls_version': tls_data.get('tls_version'),
-        'cipher_suite': tls_data.get('cipher_suite'),
+def stable_tls_fields(tls):
+    """TLS 稳定字段：排除 GREASE 和随机值，排序以消除顺序差异"""
+    return {
+        'tls_version': tls['tls_version'],
+        'cipher_suite': tls['cipher_suite'],
         # 过滤掉 GREASE 值的 ciphers（保持顺序，因为 cipher 优先级有意义）
-        'ciphers_stable': [c for c in tls_data.get('ciphers', []) if 'GREASE' not in c],
+        'ciphers_stable': [c for c in tls['ciphers'] if 'GREASE' not in c],
         # 过滤掉 GREASE 值的 extensions，并排序（Chrome 会随机化顺序）
-        'extensions_stable': sorted([e.get('name') for e in tls_data.get('extensions', []) if 'GREASE' not in e.get('name', '')]),
+        'extensions_stable': sorted([e.get('name') for e in tls['extensions'] if 'GREASE' not in e.get('name', '')]),
         # 过滤掉 GREASE 的 supported_groups
-        'groups_stable': [g for g in tls_data.get('supported_groups', []) if 'GREASE' not in g],
+        'groups_stable': [g for g in tls['supported_groups'] if 'GREASE' not in g],
         # 过滤掉 GREASE 的 supported_versions
-        'versions_stable': [v for v in tls_data.get('supported_versions', []) if 'GREASE' not in v],
+        'versions_stable': [v for v in tls['supported_versions'] if 'GREASE' not in v],
     }
 
-    content = json.dumps(stable_tls, sort_keys=True)
-    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+# 浏览器指纹 v1（基于 Canvas, WebGL, Audio 等稳定特征）
+register_id_scheme(FingerprintIdScheme(
+    'browser', 1,
+    include={
+        'client': (('client',), {}),
+        'user_agent': (('server', 'user_agent'), ''),
+        # 'accept_language' 可能在无痕模式下不同，不纳入计算
+        'accept_encoding': (('server', 'accept_encoding'), ''),
+    },
+    exclude={
+        ('client',): (
+            'timestamp', 'hash', 'timing',
+            'tls',  # TLS 单独处理
+            'incognito',  # 无痕模式检测结果不影响 ID
+        ),
+        # 窗口尺寸与位置会随窗口变化/拖动变化
+        ('client', 'screen'): (
+            'innerWidth', 'innerHeight', 'outerWidth', 'outerHeight',
+            'availWidth', 'availHeight', 'screenX', 'screenY',
+        ),
+        ('client', 'navigator'): (
+            'connection',  # effectiveType/downlink/rtt 都会随网络变化
+            'languages',  # 无痕模式会简化 languages 数组
+            'doNotTrack',  # 无痕模式可能改变 DNT 设置
+        ),
+        ('client', 'audio'): (
+            'fingerprint',  # 浮点数计算可能有细微差异
+            'baseLatency', 'outputLatency',  # 延迟会变化
+            'state',  # 第一次可能是 timeout，后续是 collected
+            'error',  # 错误信息可能变化
+        ),
+        ('client', 'storage'): (
+            'indexedDBEnabled',  # indexedDB.open() 是异步的，第一次可能为 false
+        ),
+        ('client', 'automation'): (
+            'score',  # score 依赖于异步检测的结果
+        ),
+        ('client', 'automation', 'checks'): (
+            'permissionsInconsistent',  # 异步检测，返回后才设置
+            'languagesLengthZero',  # 依赖 languages 数组，无痕模式下不同
+        ),
+    },
+    # screen 不是对象时按空对象处理
+    coerce=(('client', 'screen'),),
+))
+
+# TLS 指纹 v1
+register_id_scheme(FingerprintIdScheme(
+    'tls', 1,
+    include={
+        'tls_version': (('tls_version',), None),
+        'cipher_suite': (('cipher_suite',), None),
+        'ciphers': (('ciphers',), []),
+        'extensions': (('extensions',), []),
+        'supported_groups': (('supported_groups',), []),
+        'supported_versions': (('supported_versions',), []),
+    },
+    transform=stable_tls_fields,
+))
+
+for kind, version in ID_SCHEME_PRIMARY.items():
+    if version not in ID_SCHEMES.get(kind, {}):
+        raise ValueError(f'Unknown {kind} ID scheme version: {version}')
+
+
+def generate_browser_fingerprint_id(data):
+    """生成浏览器指纹 ID（主版本方案）"""
+    return get_id_scheme('browser').compute(data)
+
+
+def generate_tls_fingerprint_id(tls_data):
+    """生成 TLS 指纹 ID（主版本方案）"""
+    if not tls_data:
+        return None
+    return get_id_scheme('tls').compute(tls_data)
 
 
 def generate_combined_fingerprint_id(browser_id, tls_id):
@@ -684,6 +2963,319 @@ def generate_combined_fingerprint_id(browser_id, tls_id):
     return hashlib.sha256(combined.encode()).hexdigest()[:16]
 
 
+# ============================================
+# 指纹采集
+# ============================================
+
+def prepare_fingerprint(payload, server_fp, network_lookup=lookup_network_fingerprint):
+    """
+    合并客户端与服务端指纹并计算各方案 ID（不访问数据库）
+    payload: CollectPayload
+    network_lookup: 按 IP 查询 TLS 服务记录的指纹（异步模式下传入已查询到的结果）
+    返回 (完整指纹, {方案名: ID})
+    """
+    full_fingerprint = {
+        'client': payload.data,
+        'server': server_fp,
+    }
+
+    # TLS 数据（如果有的话）
+    # 客户端未提交时，使用 TLS 服务推送的同 IP 指纹（无需额外请求）
+    tls_data = payload.tls
+    if not tls_data:
+        network_fp = network_lookup(server_fp.get('ip'))
+        if network_fp:
+            server_fp['tls'] = network_fp
+            tls_data = network_fp.get('tls')
+
+    # 一次计算所有启用版本的 ID，主版本作为浏览器/TLS 指纹 ID
+    ids = compute_fingerprint_ids(full_fingerprint, tls_data)
+    browser_id = ids[get_id_scheme('browser').name]
+    tls_id = ids.get(get_id_scheme('tls').name)
+
+    # 使用浏览器 ID 作为主 ID
+    full_fingerprint['id'] = browser_id
+    full_fingerprint['browser_id'] = browser_id
+    full_fingerprint['tls_id'] = tls_id
+    full_fingerprint['combined_id'] = generate_combined_fingerprint_id(browser_id, tls_id)
+    full_fingerprint['ids'] = ids
+    return full_fingerprint, ids
+
+
+def store_collected_fingerprint(full_fingerprint, device, timings, known_devices=None):
+    """
+    设备匹配、记录访问并保存指纹（在 db_transaction 中调用）
+    device: 提交的设备标识（CollectPayload.device）
+    返回设备匹配结果（未提交设备数据时为 None）
+    """
+    server_fp = full_fingerprint['server']
+    device_match = None
+    device_id = None
+
+    if device:
+        # 设备匹配
+        with timed(timings, 'match'):
+            device_match = match_device(device, known_devices)
+
+        if device_match and device_match.get('match'):
+            # 匹配到已有设备
+            device_id = device_match['device_id']
+        else:
+            # 新设备，保存
+            with timed(timings, 'device'):
+                device_id = save_device_fingerprint(
+                    device,
+                    server_fp.get('ip'),
+                    server_fp.get('user_agent')
+                )
+            if device_match:
+                device_match['device_id'] = device_id
+
+        # 记录访问
+        if device_id:
+            with timed(timings, 'visit'):
+                record_device_visit(
+                    device_id,
+                    server_fp.get('ip'),
+                    server_fp.get('user_agent'),
+                    device_match.get('match_type', 'new') if device_match else 'new',
+                    device_match.get('confidence', 0) if device_match else 0
+                )
+
+    # 存储到 SQLite
+    with timed(timings, 'fingerprint'):
+        save_fingerprint(full_fingerprint['id'], full_fingerprint)
+        save_fingerprint_ids(full_fingerprint['id'], full_fingerprint['ids'])
+    return device_match
+
+
+# /api/collect 的响应内容（?view=）
+# ids: 只返回各 ID 与设备匹配结果；summary: 另附服务端采集的部分（IP、请求头、TLS 等）；
+# full: 附带完整指纹（包括客户端刚提交的全部数据）
+COLLECT_VIEWS = ('ids', 'summary', 'full')
+if COLLECT_RESPONSE_VIEW not in COLLECT_VIEWS:
+    raise RuntimeError(f"COLLECT_RESPONSE_VIEW must be one of: {', '.join(COLLECT_VIEWS)}")
+
+
+def parse_collect_view(value):
+    """解析 ?view= 参数，未指定时使用 COLLECT_RESPONSE_VIEW"""
+    if not value:
+        return COLLECT_RESPONSE_VIEW
+    if value not in COLLECT_VIEWS:
+        raise ValueError(f"Invalid view: {value} (available: {', '.join(COLLECT_VIEWS)})")
+    return value
+
+
+def collect_response_data(full_fingerprint, ids, device_match, view):
+    """/api/collect 的响应内容"""
+    response_data = {
+        'success': True,
+        'id': full_fingerprint['id'],
+        'browser_id': full_fingerprint['browser_id'],
+        'tls_id': full_fingerprint['tls_id'],
+        'combined_id': full_fingerprint['combined_id'],
+        'ids': ids,
+    }
+    if view == 'full':
+        response_data['fingerprint'] = full_fingerprint
+    elif view == 'summary':
+        response_data['fingerprint'] = {'server': full_fingerprint['server']}
+
+    # 添加设备匹配信息
+    if device_match:
+        response_data['device_match'] = device_match
+    return response_data
+
+
+def read_collect_body(limit=COLLECT_MAX_BODY_BYTES):
+    """读取采集请求体，超过 limit 字节时抛出 RequestEntityTooLarge"""
+    if request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge()
+    # 分块传输（没有 Content-Length）时最多读取 limit + 1 字节，多出的 1 字节说明超限
+    chunks = []
+    size = 0
+    while size <= limit:
+        chunk = request.stream.read(limit + 1 - size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    if size > limit:
+        raise RequestEntityTooLarge()
+    return b''.join(chunks)
+
+
+def parse_collect_payload(body):
+    """
+    解析并校验 /api/collect 的请求体，返回 CollectPayload
+    顶层必须是 JSON 对象（空请求体以及 null 等假值视为 {}，与原先 request.json or {} 一致），否则抛出 ValueError
+    """
+    if not body.strip():
+        return CollectPayload({})
+    try:
+        data = json_codec.loads_object(body)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    except RecursionError:
+        raise ValueError(f'Payload is nested too deeply (max {COLLECT_MAX_DEPTH} levels)')
+    except ValueError:
+        # 顶层不是对象：只有出错时才再解析一次
+        if json_codec.loads(body):
+            raise
+        data = {}
+    # 嵌套层数不会超过左括号的个数，括号不多时（通常如此）无需遍历检查
+    if body.count(b'{') + body.count(b'[') > COLLECT_MAX_DEPTH:
+        check_nesting_depth(data)
+    return CollectPayload(data)
+
+
+def parse_collect_batch(body, mimetype):
+    """
+    解析批量采集请求体：JSON 数组或 NDJSON
+    返回 [(条目, 错误信息)]；NDJSON 中无法解析的行只影响该条
+    """
+    if mimetype == 'application/json' or body.lstrip()[:1] == b'[':
+        try:
+            items = json_codec.loads(body)
+        except ValueError as e:
+            raise ValueError(f'Invalid JSON: {e}')
+        except RecursionError:
+            raise ValueError(f'Payload is nested too deeply (max {COLLECT_MAX_DEPTH} levels)')
+        if not isinstance(items, list):
+            raise ValueError('Expected a JSON array or NDJSON')
+        return [(item, None) for item in items]
+
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append((json_codec.loads(line), None))
+        except ValueError as e:
+            items.append((None, f'Invalid JSON: {e}'))
+        except RecursionError:
+            items.append((None, f'Payload is nested too deeply (max {COLLECT_MAX_DEPTH} levels)'))
+    return items
+
+
+# ============================================
+# 增强采集（并发查询 IP 信息与 TLS 指纹）
+# ============================================
+
+def lookup_tls_enrichment(ip):
+    """
+    TLS 服务记录的同 IP 指纹（{tls, http2, tcp}，未记录时为 None）
+    只查询推送流内存表与本地 IPC：HTTPS 接口返回的是发起请求的连接（即本服务自身）的指纹
+    """
+    fingerprint = tls_stream_store.get(ip)
+    if fingerprint is not None or tls_ipc_client is None:
+        return fingerprint
+    result = tls_ipc_client.query_fingerprint(ip)
+    return result.get('fingerprint') if result.get('success') else None
+
+
+# 数据源名称 → 查询函数（参数为客户端 IP）
+ENRICHMENT_SOURCES = {
+    'ip_info': get_ip_info,
+    'tls': lookup_tls_enrichment,
+}
+# 数据源名称 → 超时（毫秒），同时受 ENRICH_BUDGET_MS 限制
+ENRICHMENT_TIMEOUTS = {
+    'ip_info': ENRICH_IP_INFO_TIMEOUT_MS,
+    'tls': ENRICH_TLS_TIMEOUT_MS,
+}
+
+enrichment_executor = None
+enrichment_executor_pid = None
+enrichment_executor_lock = threading.Lock()
+
+
+def get_enrichment_executor():
+    """当前进程的查询线程池（fork 后的子进程重新创建）"""
+    global enrichment_executor, enrichment_executor_pid
+    with enrichment_executor_lock:
+        if enrichment_executor is None or enrichment_executor_pid != os.getpid():
+            enrichment_executor = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix='enrich')
+            enrichment_executor_pid = os.getpid()
+        return enrichment_executor
+
+
+def parse_enrich_sources(value):
+    """
+    解析 ?enrich= 参数，返回要查询的数据源名称
+    1/true/all 表示全部，也可以逗号分隔指定（如 enrich=ip_info）；未指定时返回空元组
+    """
+    if not value or value.lower() in ('0', 'false', 'no'):
+        return ()
+    if value.lower() in ('1', 'true', 'yes', 'all'):
+        return tuple(ENRICHMENT_SOURCES)
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in ENRICHMENT_SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown enrichment source: {', '.join(unknown)} "
+                         f"(available: {', '.join(ENRICHMENT_SOURCES)})")
+    return names
+
+
+def enrichment_wait_seconds(name, started, now):
+    """数据源还能等待的时间：自身超时与总预算中较早到达的一个"""
+    timeout = min(ENRICHMENT_TIMEOUTS[name], ENRICH_BUDGET_MS) / 1000
+    return max(started + timeout - now, 0)
+
+
+def apply_enrichment(response_data, results):
+    """
+    合并各数据源结果到响应：
+    enrichment[名称] = {status: ok/timeout/error, data, error?}，有数据源未成功时 partial 为 true
+    """
+    response_data['enrichment'] = results
+    response_data['partial'] = any(result['status'] != 'ok' for result in results.values())
+    return response_data
+
+
+class Enrichment:
+    """一次增强采集：创建时并发发起所有查询，wait() 按各自超时取结果"""
+
+    def __init__(self, sources, ip, timings):
+        executor = get_enrichment_executor()
+        self.started = time.monotonic()
+        self.timings = timings
+        self.futures = {name: executor.submit(self.run, name, ip) for name in sources}
+        self.results = {}
+
+    def run(self, name, ip):
+        """在线程池中执行一个查询，记录完成所用时间"""
+        try:
+            return ENRICHMENT_SOURCES[name](ip)
+        finally:
+            self.timings[f'enrich_{name}'] = (time.monotonic() - self.started) * 1000
+
+    def wait(self, name):
+        """等待一个数据源，超时后不再等待（查询在后台继续，结果照常写入缓存）"""
+        if name not in self.results:
+            future = self.futures[name]
+            try:
+                result = {'status': 'ok', 'data': future.result(
+                    enrichment_wait_seconds(name, self.started, time.monotonic())
+                )}
+            except FutureTimeoutError:
+                result = {'status': 'timeout', 'data': None}
+            except Exception as e:
+                result = {'status': 'error', 'data': None, 'error': str(e)}
+            self.results[name] = result
+            # 超时的查询记录等待的时间
+            self.timings.setdefault(f'enrich_{name}', (time.monotonic() - self.started) * 1000)
+        return self.results[name]
+
+    def network_lookup(self, ip):
+        """prepare_fingerprint 的 network_lookup：使用本次查询到的 TLS 指纹"""
+        return self.wait('tls')['data']
+
+    def collect(self):
+        """等待所有数据源，返回 {名称: 结果}"""
+        return {name: self.wait(name) for name in self.futures}
+
+
 @app.route('/')
 def index():
     """主页 - 指纹收集页面"""
@@ -709,86 +3301,123 @@ def serve_static(filename):
 
 @app.route('/api/collect', methods=['POST'])
 def collect_fingerprint():
-    """接收前端收集的指纹并合并服务端数据"""
+    """
+    接收前端收集的指纹并合并服务端数据
+    ?view=ids|summary|full: 响应内容（默认 COLLECT_RESPONSE_VIEW，见 COLLECT_VIEWS）
+    ?enrich=1（或 enrich=ip_info,tls）: 同时并发查询 IP 信息与 TLS 指纹，在超时内合并到响应中，
+    省去前端单独请求 /api/ip-info 与 /api/tls
+    """
     try:
-        client_fp = request.json or {}
-        server_fp = collect_server_fingerprint()
-
-        # 合并指纹
-        full_fingerprint = {
-            'client': client_fp,
-            'server': server_fp,
-        }
-
-        # 生成浏览器指纹 ID
-        browser_id = generate_browser_fingerprint_id(full_fingerprint)
+        view = parse_collect_view(request.args.get('view'))
+        sources = parse_enrich_sources(request.args.get('enrich'))
+        payload = parse_collect_payload(read_collect_body())
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'error': f'Payload too large (max {COLLECT_MAX_BODY_BYTES} bytes)'}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
-        # TLS 指纹 ID（如果有的话）
-        tls_data = client_fp.get('tls')
-        tls_id = generate_tls_fingerprint_id(tls_data) if tls_data else None
+    try:
+        timings = {}
+        server_fp = collect_server_fingerprint()
+        enrichment = Enrichment(sources, server_fp['ip'], timings) if sources else None
+        network_lookup = lookup_network_fingerprint
+        if enrichment and 'tls' in sources:
+            network_lookup = enrichment.network_lookup
+        full_fingerprint, ids = prepare_fingerprint(payload, server_fp, network_lookup)
+
+        # 所有写入在同一事务中完成，只提交一次
+        with timed(timings, 'db'), db_transaction():
+            device_match = store_collected_fingerprint(full_fingerprint, payload.device, timings)
+
+        response_data = collect_response_data(full_fingerprint, ids, device_match, view)
+        if enrichment:
+            apply_enrichment(response_data, enrichment.collect())
+        response = jsonify(response_data)
+        response.headers['Server-Timing'] = format_server_timing(timings)
+        return response
 
-        # 综合指纹 ID
-        combined_id = generate_combined_fingerprint_id(browser_id, tls_id)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-        # 设备ID处理
-        device_id_data = client_fp.get('deviceId')
-        device_match = None
-        device_id = None
 
-        if device_id_data:
-            # 设备匹配
-            device_match = match_device(device_id_data)
+@app.route('/api/collect/batch', methods=['POST'])
+def collect_fingerprint_batch():
+    """
+    批量提交指纹（边缘采集器、回放工具）
+    - 请求体为 JSON 数组或 NDJSON（每行一条）
+    - 每条为前端采集结果，或 {"client": 采集结果, "server": {...}}，
+      server 中的字段覆盖本次请求的服务端数据（如原始访客的 ip、user_agent、headers）
+    - 整批一个事务，已有设备一次预取；单条出错只回滚该条，results 按提交顺序返回每条结果
+    """
+    try:
+        items = parse_collect_batch(read_collect_body(COLLECT_BATCH_MAX_BODY_BYTES), request.mimetype)
+    except RequestEntityTooLarge:
+        error = f'Payload too large (max {COLLECT_BATCH_MAX_BODY_BYTES} bytes)'
+        return jsonify({'success': False, 'error': error}), 413
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if len(items) > COLLECT_BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'Too many items (max {COLLECT_BATCH_MAX_ITEMS})'}), 413
+
+    timings = {}
+    server_fp = collect_server_fingerprint()
+    results = [None] * len(items)
+    prepared = []
+    with timed(timings, 'ids'):
+        for index, (item, error) in enumerate(items):
+            try:
+                if error:
+                    raise ValueError(error)
+                client_fp, server_overrides = item, {}
+                if isinstance(item, dict) and isinstance(item.get('client'), dict):
+                    client_fp, server_overrides = item['client'], item.get('server') or {}
+                if not isinstance(client_fp, dict) or not isinstance(server_overrides, dict):
+                    raise ValueError('Item must be a JSON object')
+                # 与 /api/collect 相同的嵌套层数限制（整批请求体的括号数不能说明单条的层数，逐条检查）
+                check_nesting_depth(client_fp)
+                check_nesting_depth(server_overrides)
+                payload = CollectPayload(client_fp)
+                prepared.append((index, payload.device,
+                                 *prepare_fingerprint(payload, {**server_fp, **server_overrides})))
+            except Exception as e:
+                results[index] = {'index': index, 'success': False, 'error': str(e)}
 
-            if device_match and device_match.get('match'):
-                # 匹配到已有设备
-                device_id = device_match['device_id']
-            else:
-                # 新设备，保存
-                device_id = save_device_fingerprint(
-                    device_id_data,
-                    server_fp.get('ip'),
-                    server_fp.get('user_agent')
-                )
+    try:
+        with timed(timings, 'db'), db_transaction() as conn:
+            device_cache.sync(conn)
+            known_devices = prefetch_devices([device.core_id for _, device, _, _ in prepared if device])
+
+            for index, device, full_fingerprint, ids in prepared:
+                try:
+                    with savepoint():
+                        device_match = store_collected_fingerprint(full_fingerprint, device, {}, known_devices)
+                except Exception as e:
+                    results[index] = {'index': index, 'success': False, 'error': str(e)}
+                    continue
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'id': full_fingerprint['id'],
+                    'tls_id': full_fingerprint['tls_id'],
+                    'combined_id': full_fingerprint['combined_id'],
+                    'ids': ids,
+                }
                 if device_match:
-                    device_match['device_id'] = device_id
-
-            # 记录访问
-            if device_id:
-                record_device_visit(
-                    device_id,
-                    server_fp.get('ip'),
-                    server_fp.get('user_agent'),
-                    device_match.get('match_type', 'new') if device_match else 'new',
-                    device_match.get('confidence', 0) if device_match else 0
-                )
-
-        # 使用浏览器 ID 作为主 ID
-        full_fingerprint['id'] = browser_id
-        full_fingerprint['browser_id'] = browser_id
-        full_fingerprint['tls_id'] = tls_id
-        full_fingerprint['combined_id'] = combined_id
-
-        # 存储到 SQLite
-        save_fingerprint(browser_id, full_fingerprint)
-
-        response_data = {
-            'success': True,
-            'id': browser_id,
-            'browser_id': browser_id,
-            'tls_id': tls_id,
-            'combined_id': combined_id,
-            'fingerprint': full_fingerprint,
-        }
-
-        # 添加设备匹配信息
-        if device_match:
-            response_data['device_match'] = device_match
-
-        return jsonify(response_data)
-
+                    results[index]['device_match'] = device_match
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    saved = sum(1 for result in results if result['success'])
+    response = jsonify({
+        'success': True,
+        'count': len(results),
+        'saved': saved,
+        'failed': len(results) - saved,
+        'results': results,
+    })
+    response.headers['Server-Timing'] = format_server_timing(timings)
+    return response
+
 
 @app.route('/api/fingerprint/<fp_id>', methods=['GET'])
 def get_fingerprint_by_id(fp_id):
@@ -801,11 +3430,98 @@ def get_fingerprint_by_id(fp_id):
 
 @app.route('/api/fingerprints', methods=['GET'])
 def list_fingerprints():
-    """列出所有指纹"""
-    return jsonify({
-        'success': True,
-        'count': get_fingerprint_count(),
-        'fingerprints': get_all_fingerprints(limit=100)
+    """
+    分页列出指纹（按创建时间倒序）
+    - limit: 每页条数（默认 100，最多 1000）；cursor: 上一页返回的 next_cursor
+    - fields: summary 或逗号分隔的列名，只返回这些列（不解析完整数据）
+    - 其余参数为过滤条件（ip、ua、since、until、tls_id、ja4 等）
+    - count=exact 时额外返回满足过滤条件的精确数量
+    """
+    args = request.args.to_dict()
+    try:
+        limit = min(max(int(args.pop('limit', 100)), 1), 1000)
+        cursor = args.pop('cursor', None)
+        fields = args.pop('fields', None)
+        if fields == 'summary':
+            fields = FINGERPRINT_SUMMARY_FIELDS
+        elif fields:
+            fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+        exact = args.pop('count', None) == 'exact'
+
+        fingerprints, next_cursor = list_fingerprint_page(limit, cursor, args, fields)
+        result = {
+            'success': True,
+            'count': get_fingerprint_count(),
+            'fingerprints': fingerprints,
+            'next_cursor': next_cursor,
+        }
+        if exact:
+            result['matched'] = get_fingerprint_count(args)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/analytics/<field>', methods=['GET'])
+def fingerprint_analytics(field):
+    """
+    热点字段取值分布（SQL 聚合），查询参数同 /api/fingerprints 的过滤条件
+    - limit: 返回的取值个数（默认 20，最多 1000）
+    """
+    filters = request.args.to_dict()
+    try:
+        limit = int(filters.pop('limit', 20))
+        if limit < 1:
+            # SQLite 的 LIMIT 为负数时不限制条数
+            raise ValueError('limit must be at least 1')
+        limit = min(limit, 1000)
+        return jsonify({
+            'success': True,
+            'field': field,
+            'total': get_fingerprint_count(filters),
+            'values': get_fingerprint_value_counts(field, limit=limit, filters=filters),
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+
+@app.route('/api/fingerprint/<fp_id>/components', methods=['GET'])
+def fingerprint_components(fp_id):
+    """指纹引用的共享组件（需开启 COMPONENT_STORE）"""
+    return jsonify({'success': True, 'components': get_fingerprint_components(fp_id)})
+
+
+@app.route('/api/components/<digest>', methods=['GET'])
+def component_usage(digest):
+    """共享该组件的指纹"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    count, fingerprints = get_component_usage(digest, limit=limit)
+    return jsonify({'success': True, 'hash': digest, 'count': count, 'fingerprints': fingerprints})
+
+
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table):
+    """
+    流式导出整张表（fingerprints / device_fingerprints / device_visits）
+    - format: ndjson（默认）或 csv
+    - since / until: UTC 时间范围（fingerprints 按 created_at，设备按 last_seen，访问记录按 visit_time）
+    """
+    filters = request.args.to_dict()
+    export_format = filters.pop('format', 'ndjson')
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported format: {export_format}')
+        # 参数在开始输出前校验，出错时仍能返回 400
+        columns, where, params = export_query(table, filters)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    chunks = iter_export_rows(table, columns, where, params)
+    body = export_ndjson(chunks) if export_format == 'ndjson' else export_csv(columns, chunks)
+    filename = f'{table}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.{export_format}'
+    return Response(body, mimetype=EXPORT_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no',  # 反向代理不缓冲整个响应
     })
 
 
@@ -854,13 +3570,23 @@ def ip_info_by_ip(ip):
     })
 
 
+@app.route('/api/stats', methods=['GET'])
+def service_stats():
+    """服务内部缓存统计"""
+    return jsonify({
+        'success': True,
+        'ip_info_cache': ip_info_cache.stats(),
+        'tls_stream_store': tls_stream_store.stats(),
+        'component_cache': component_cache.stats(),
+    })
+
+
 @app.route('/api/tls-check', methods=['GET'])
 def tls_check():
     """
     检查 TLS 服务状态
     """
-    global tls_process
-    is_running = tls_process is not None and tls_process.poll() is None
+    is_running = tls_server_running()
 
     return jsonify({
         'tls_server_running': is_running,
@@ -880,9 +3606,7 @@ def get_tls_fingerprint():
 
     try:
         # 从本地 TLS 服务获取指纹
-        tls_url = f'https://127.0.0.1:{TLS_SERVER_PORT}/api/fingerprint'
-        resp = requests.get(tls_url, timeout=5, verify=False)
-        data = resp.json()
+        data = query_tls_sidecar(client_ip)
 
         return jsonify({
             'success': True,
@@ -945,6 +3669,7 @@ if __name__ == '__main__':
     print(f'[INFO] Fingerprint Collector running on http://0.0.0.0:5000')
     print(f'[INFO] TLS Server: https://{SERVER_HOST}:{TLS_SERVER_PORT}')
     print(f'[INFO] Set SERVER_HOST env to change the public hostname (current: {SERVER_HOST})')
+    print('[HINT] Development server (single process). For production use: gunicorn -c gunicorn.conf.py app:app')
 
-    # 启动 Flask（关闭 reloader 避免启动两次 TLS 服务）
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    # 启动 Flask 开发服务器（关闭 reloader 避免启动两次 TLS 服务）
+    app.run(host='0.0.0.0', port=5000, debug=DEBUG, use_reloader=False)
@@ -0,0 +1,508 @@
+"""
+异步服务入口（ASGI）
+
+用法:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+    uvicorn asgi:app --host 0.0.0.0 --port 5000     # 单进程（不启动 TLS 服务）
+
+- /api/collect、/api/ip-info、/api/ip-info/<ip>、/api/tls 为原生异步实现：
+  出站 HTTP 使用 httpx 异步客户端，TLS 服务 IPC 使用 asyncio Unix socket，
+  数据库读写在有界线程池中执行；等待 I/O 时不占用线程，单进程可同时处理数千个请求
+- 其余接口（以及上述路径的其他方法，如 CORS 预检）转发给 Flask 应用
+- 请求解析、指纹合并与 ID 计算、设备匹配、响应格式（含 CORS 头）与同步接口共用 app.py 的实现
+"""
+
+import asyncio
+import io
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+import app as core
+
+# 数据库操作线程池（与连接池大小一致，避免线程等待空闲连接）
+db_executor = ThreadPoolExecutor(max_workers=core.DB_POOL_SIZE, thread_name_prefix='db')
+# 同步接口的转发线程池
+wsgi_app = WSGIMiddleware(core.app, workers=int(os.environ.get('ASGI_WSGI_THREADS', 10)))
+
+
+async def run_blocking(func, *args):
+    """在数据库线程池中执行同步函数"""
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+# ============================================
+# 异步出站 HTTP
+# ============================================
+
+http_clients = {}
+
+
+def get_async_http_client(verify=True):
+    """当前事件循环共享的 httpx 客户端（连接池与超时配置同 app.create_http_session）"""
+    key = (id(asyncio.get_running_loop()), verify)
+    client = http_clients.get(key)
+    if client is None:
+        client = httpx.AsyncClient(
+            verify=verify,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=core.HTTP_POOL_SIZE),
+            timeout=httpx.Timeout(core.HTTP_READ_TIMEOUT, connect=core.HTTP_CONNECT_TIMEOUT),
+        )
+        http_clients[key] = client
+    return client
+
+
+async def http_get_async(url, verify=True):
+    """GET 请求，连接失败和 502/503/504 时按 HTTP_RETRIES 重试（与同步会话的重试策略一致）"""
+    client = get_async_http_client(verify)
+    for attempt in range(core.HTTP_RETRIES + 1):
+        if attempt > 1:
+            await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+        try:
+            resp = await client.get(url)
+        except (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+            if attempt == core.HTTP_RETRIES:
+                raise
+            continue
+        if resp.status_code in (502, 503, 504) and attempt < core.HTTP_RETRIES:
+            continue
+        return resp
+
+
+async def close_http_clients():
+    for client in list(http_clients.values()):
+        await client.aclose()
+    http_clients.clear()
+
+
+# ============================================
+# TLS 服务异步 IPC
+# ============================================
+
+class AsyncTLSSidecarClient:
+    """TLSSidecarClient 的 asyncio 版本（帧格式相同，连接复用）"""
+
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.idle = []
+        self.loop = None
+
+    async def _checkout(self):
+        """取出空闲连接，没有时新建；返回 (reader, writer, 是否为复用连接)"""
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # 连接不跨事件循环使用
+            self.idle = []
+            self.loop = loop
+        if self.idle:
+            return (*self.idle.pop(), True)
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), self.timeout)
+        return reader, writer, False
+
+    async def _exchange(self, reader, writer, frame):
+        writer.write(frame)
+        await writer.drain()
+        size, = struct.unpack('>I', await reader.readexactly(4))
+        if size > core.TLSSidecarClient.MAX_FRAME_SIZE:
+            raise ConnectionError(f'TLS sidecar frame too large: {size} bytes')
+        return await reader.readexactly(size)
+
+    async def request(self, payload):
+        """发送一个请求帧并返回解析后的响应"""
+        body = core.json_codec.dumps_bytes(payload)
+        frame = struct.pack('>I', len(body)) + body
+        while True:
+            reader, writer, reused = await self._checkout()
+            try:
+                data = await asyncio.wait_for(self._exchange(reader, writer, frame), self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                writer.close()
+                if reused and not isinstance(e, asyncio.TimeoutError):
+                    # 复用的连接可能已被对端关闭，换新连接重试
+                    continue
+                if isinstance(e, asyncio.IncompleteReadError):
+                    raise ConnectionError('TLS sidecar closed the connection')
+                raise
+            except BaseException:
+                # 请求被取消时连接状态未知，不再复用
+                writer.close()
+                raise
+            self.idle.append((reader, writer))
+            return core.json_codec.loads(data)
+
+    async def query_fingerprint(self, ip):
+        """按客户端 IP 查询 TLS/HTTP2/TCP 指纹"""
+        return await self.request({'op': 'fingerprint', 'ip': ip})
+
+
+tls_ipc_client = AsyncTLSSidecarClient(core.TLS_IPC_SOCKET, core.HTTP_READ_TIMEOUT) if core.TLS_IPC_SOCKET else None
+
+
+async def lookup_network_fingerprint_async(client_ip):
+    """app.lookup_network_fingerprint 的异步版本"""
+    fingerprint = core.tls_stream_store.get(client_ip)
+    if fingerprint is not None or core.tls_stream_subscribed or tls_ipc_client is None:
+        return fingerprint
+    try:
+        result = await tls_ipc_client.query_fingerprint(client_ip)
+    except OSError:
+        return None
+    return result.get('fingerprint') if result.get('success') else None
+
+
+async def query_tls_sidecar_async(client_ip):
+    """app.query_tls_sidecar 的异步版本：推送流内存表 → 本地 IPC → HTTPS 接口"""
+    fingerprint = core.tls_stream_store.get(client_ip)
+    if fingerprint is not None:
+        return {'success': True, 'client_ip': client_ip, 'fingerprint': fingerprint}
+
+    if tls_ipc_client is not None:
+        try:
+            return await tls_ipc_client.query_fingerprint(client_ip)
+        except OSError:
+            pass
+
+    resp = await http_get_async(core.TLS_SIDECAR_URL, verify=False)
+    return resp.json()
+
+
+# ============================================
+# 异步 IP 信息查询
+# ============================================
+
+# 同一 IP 的并发查询只发起一次
+ip_info_inflight = {}
+
+
+async def lookup_ip_info_async(ip):
+    """app.lookup_ip_info 的异步版本"""
+    info = core.lookup_ip_info_offline(ip)
+    if info is not None:
+        return info
+
+    if not core.IP_LOOKUP_OFFLINE:
+        try:
+            resp = await http_get_async(core.IP_API_URL.format(ip=ip))
+            info = core.parse_ip_api_response(ip, resp.json())
+            if info is not None:
+                return info
+        except Exception as e:
+            print(f'[WARN] IP info query failed: {e}')
+
+    return core.unknown_ip_info(ip)
+
+
+async def fetch_and_cache_ip_info(ip):
+    try:
+        info = await lookup_ip_info_async(ip)
+        core.cache_ip_info(ip, info)
+        return info
+    finally:
+        ip_info_inflight.pop(ip, None)
+
+
+async def get_ip_info_async(ip):
+    """app.get_ip_info 的异步版本（带缓存）"""
+    info = core.ip_info_cache.get(ip)
+    if info is not None:
+        return info
+    task = ip_info_inflight.get(ip)
+    if task is None:
+        task = ip_info_inflight[ip] = asyncio.ensure_future(fetch_and_cache_ip_info(ip))
+    # 单个请求被取消时不影响其他等待同一结果的请求
+    return await asyncio.shield(task)
+
+
+# ============================================
+# 增强采集
+# ============================================
+
+async def lookup_tls_enrichment_async(ip):
+    """app.lookup_tls_enrichment 的异步版本（只查询推送流内存表与本地 IPC，不使用 HTTPS 接口）"""
+    fingerprint = core.tls_stream_store.get(ip)
+    if fingerprint is not None or tls_ipc_client is None:
+        return fingerprint
+    result = await tls_ipc_client.query_fingerprint(ip)
+    return result.get('fingerprint') if result.get('success') else None
+
+
+# 与 app.ENRICHMENT_SOURCES 对应的异步查询函数
+ENRICHMENT_SOURCES = {
+    'ip_info': get_ip_info_async,
+    'tls': lookup_tls_enrichment_async,
+}
+
+
+def discard_result(task):
+    """超时后不再等待的查询，完成时取走异常，避免未读取异常的警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+class Enrichment:
+    """app.Enrichment 的异步版本"""
+
+    def __init__(self, sources, ip, timings):
+        self.started = time.monotonic()
+        self.timings = timings
+        self.tasks = {name: asyncio.ensure_future(self.run(name, ip)) for name in sources}
+        for task in self.tasks.values():
+            task.add_done_callback(discard_result)
+        self.results = {}
+
+    async def run(self, name, ip):
+        try:
+            return await ENRICHMENT_SOURCES[name](ip)
+        finally:
+            self.timings[f'enrich_{name}'] = (time.monotonic() - self.started) * 1000
+
+    async def wait(self, name):
+        if name not in self.results:
+            try:
+                data = await asyncio.wait_for(
+                    asyncio.shield(self.tasks[name]),
+                    core.enrichment_wait_seconds(name, self.started, time.monotonic())
+                )
+                result = {'status': 'ok', 'data': data}
+            except asyncio.TimeoutError:
+                result = {'status': 'timeout', 'data': None}
+            except Exception as e:
+                result = {'status': 'error', 'data': None, 'error': str(e)}
+            self.results[name] = result
+            self.timings.setdefault(f'enrich_{name}', (time.monotonic() - self.started) * 1000)
+        return self.results[name]
+
+    async def collect(self):
+        return {name: await self.wait(name) for name in self.tasks}
+
+
+# ============================================
+# 接口
+# ============================================
+
+def collect_and_store(payload, server_fp, network_fp):
+    """合并指纹、计算 ID 并写入数据库（在数据库线程池中执行）"""
+    timings = {}
+    full_fingerprint, ids = core.prepare_fingerprint(payload, server_fp, lambda ip: network_fp)
+    with core.timed(timings, 'db'), core.db_transaction():
+        device_match = core.store_collected_fingerprint(full_fingerprint, payload.device, timings)
+    return full_fingerprint, ids, device_match, timings
+
+
+async def collect_fingerprint(request_context):
+    """POST /api/collect（支持 ?view= 与 ?enrich=，见 app.collect_fingerprint）"""
+    with request_context:
+        try:
+            view = core.parse_collect_view(core.request.args.get('view'))
+            sources = core.parse_enrich_sources(core.request.args.get('enrich'))
+            payload = core.parse_collect_payload(core.read_collect_body())
+        except core.RequestEntityTooLarge:
+            error = f'Payload too large (max {core.COLLECT_MAX_BODY_BYTES} bytes)'
+            return finalize(core.jsonify({'success': False, 'error': error}), 413)
+        except ValueError as e:
+            return finalize(core.jsonify({'success': False, 'error': str(e)}), 400)
+
+    try:
+        with request_context:
+            server_fp = core.collect_server_fingerprint()
+
+        timings = {}
+        enrichment = Enrichment(sources, server_fp['ip'], timings) if sources else None
+        network_fp = None
+        if not payload.tls:
+            if enrichment and 'tls' in sources:
+                network_fp = (await enrichment.wait('tls'))['data']
+            else:
+                network_fp = await lookup_network_fingerprint_async(server_fp.get('ip'))
+        full_fingerprint, ids, device_match, db_timings = await run_blocking(
+            collect_and_store, payload, server_fp, network_fp
+        )
+        timings.update(db_timings)
+
+        response_data = core.collect_response_data(full_fingerprint, ids, device_match, view)
+        if enrichment:
+            core.apply_enrichment(response_data, await enrichment.collect())
+        with request_context:
+            response = core.jsonify(response_data)
+            response.headers['Server-Timing'] = core.format_server_timing(timings)
+            return finalize(response)
+
+    except Exception as e:
+        with request_context:
+            return finalize(core.jsonify({'success': False, 'error': str(e)}), 500)
+
+
+async def ip_info(request_context, ip=None):
+    """GET /api/ip-info 与 /api/ip-info/<ip>"""
+    if ip is None:
+        with request_context:
+            ip = core.get_client_ip()
+    info = await get_ip_info_async(ip)
+    with request_context:
+        return finalize(core.jsonify({
+            'success': True,
+            'ip_info': info,
+        }))
+
+
+async def tls_fingerprint(request_context):
+    """GET /api/tls"""
+    with request_context:
+        client_ip = core.get_client_ip()
+
+    try:
+        data = await query_tls_sidecar_async(client_ip)
+        body = {
+            'success': True,
+            'client_ip': client_ip,
+            'fingerprint': data.get('fingerprint'),
+            'note': 'TLS fingerprint from local Go server'
+        }
+        status = 200
+    except (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError):
+        # 与 requests.exceptions.ConnectionError 对应
+        body = {
+            'success': False,
+            'error': 'TLS server is not running',
+            'suggestion': 'Start the server with TLS support'
+        }
+        status = 503
+    except Exception as e:
+        body = {
+            'success': False,
+            'error': str(e)
+        }
+        status = 500
+
+    with request_context:
+        return finalize(core.jsonify(body), status)
+
+
+def finalize(response, status=None):
+    """设置状态码并执行 Flask 的 after_request（CORS 等），需在请求上下文中调用"""
+    if status is not None:
+        response.status_code = status
+    return core.app.process_response(response)
+
+
+def route(method, path):
+    """返回 (处理函数, 参数)，非异步接口返回 None"""
+    if method == 'POST' and path == '/api/collect':
+        return collect_fingerprint, ()
+    if method == 'GET':
+        if path == '/api/ip-info':
+            return ip_info, ()
+        if path == '/api/tls':
+            return tls_fingerprint, ()
+        if path.startswith('/api/ip-info/'):
+            ip = path[len('/api/ip-info/'):]
+            if ip and '/' not in ip:
+                return ip_info, (ip,)
+    return None
+
+
+# ============================================
+# ASGI 应用
+# ============================================
+
+def build_environ(scope, body):
+    """由 ASGI scope 构造 WSGI environ（用于创建 Flask 请求上下文）"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        # 请求体已完整读取，分块传输（没有 Content-Length）的请求体也可读取
+        'wsgi.input_terminated': True,
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive, limit):
+    """读取请求体；超过 limit 字节后不再保存（请求处理时按 Content-Length 返回 413）"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        if size <= limit:
+            chunk = message.get('body', b'')
+            chunks.append(chunk)
+            size += len(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def send_response(send, response):
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.to_wsgi_list()],
+    })
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_http_clients()
+            await asyncio.get_running_loop().run_in_executor(None, core.write_behind.stop)
+            db_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = route(scope['method'], scope['path']) if scope['type'] == 'http' else None
+    if handler is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    func, args = handler
+    body = await read_body(receive, core.COLLECT_MAX_BODY_BYTES)
+    request_context = core.app.request_context(build_environ(scope, body))
+    try:
+        response = await func(request_context, *args)
+    except Exception as e:
+        with request_context:
+            response = core.app.handle_exception(e)
+    await send_response(send, response)
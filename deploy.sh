@@ -287,7 +287,8 @@ WorkingDirectory=$APP_DIR
 Environment=ENABLE_TCP=$ENABLE_TCP
 Environment=SERVER_HOST=$SERVER_HOST
 Environment=TLS_PORT=$TLS_PORT
-ExecStart=$APP_DIR/.venv/bin/python app.py
+Environment=GUNICORN_BIND=0.0.0.0:$FLASK_PORT
+ExecStart=$APP_DIR/.venv/bin/gunicorn -c gunicorn.conf.py app:app
 Restart=always
 RestartSec=5
 
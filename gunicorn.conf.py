@@ -0,0 +1,49 @@
+"""
+gunicorn 生产环境配置
+
+用法: gunicorn -c gunicorn.conf.py app:app
+异步模式: GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+- 主进程预加载应用（preload_app）：数据库初始化、设备缓存加载只执行一次，worker fork 后共享
+- TLS 服务由主进程启动并守护，worker 重启或退出不会重复启动/停止 TLS 服务
+- 推送流只能被一个进程读取，worker 采集时通过本地 IPC（TLS_IPC_SOCKET）查询 TLS 指纹
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+# 采集请求会等待 IP 查询等出站 HTTP，每个 worker 用多个线程处理；
+# 异步模式（asgi:app）使用 uvicorn.workers.UvicornWorker，单个 worker 即可同时处理大量请求
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    """主进程启动：启动并守护 TLS 服务"""
+    import app
+    app.start_tls_supervisor()
+
+
+def when_ready(server):
+    """fork worker 之前关闭主进程预加载时打开的数据库连接（SQLite 连接不能跨进程使用）"""
+    import app
+    app.get_db_pool().close()
+
+
+def worker_exit(server, worker):
+    """worker 退出前写完异步写入队列"""
+    import app
+    app.write_behind.stop()
+
+
+def on_exit(server):
+    """主进程退出：停止 TLS 服务"""
+    import app
+    app.stop_tls_supervisor()
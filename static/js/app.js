@@ -265,16 +265,25 @@ class FingerprintApp {
             const deviceIdResult = generateDeviceId(stableSignals);
             this.fingerprint.deviceId = deviceIdResult;
 
-            // 发送到服务器
-            const result = await sendFingerprint(this.fingerprint);
+            // 发送到服务器（同时查询 IP 信息与 TLS 指纹；只需要服务端采集的部分，不回传已提交的数据）
+            const result = await sendFingerprint(this.fingerprint, { enrich: true, view: 'summary' });
 
             if (result.success) {
                 this.serverData = result.fingerprint?.server || null;
+                const ipInfo = result.enrichment?.ip_info?.data;
+                if (this.serverData && ipInfo) {
+                    this.serverData = { ...this.serverData, ip_info: ipInfo };
+                }
                 this.displayResults(result);
 
-                // 自动获取 TLS 指纹
-                this.setStatus('Fetching TLS...', 'collecting');
-                await this.fetchTls(true); // silent mode
+                // 服务端已查到 TLS 指纹时直接显示，否则从 TLS Server 获取
+                const tlsData = result.enrichment?.tls?.data;
+                if (tlsData) {
+                    this.showTls(tlsData);
+                } else {
+                    this.setStatus('Fetching TLS...', 'collecting');
+                    await this.fetchTls(true); // silent mode
+                }
 
                 // 保存数据
                 this.saveData();
@@ -298,59 +307,7 @@ class FingerprintApp {
             const result = await fetchTlsFingerprint(this.config);
 
             if (result && result.success) {
-                // New response format: fingerprint contains { tls, http2, tcp }
-                const fpData = result.fingerprint;
-
-                // Store TLS, HTTP/2, and TCP data
-                this.tlsData = {
-                    tls: fpData.tls,
-                    http2: fpData.http2,
-                    tcp: fpData.tcp
-                };
-
-                document.getElementById('tlsJson').textContent = JSON.stringify(this.tlsData, null, 2);
-
-                // 更新 TLS ID (优先使用 JA4，更稳定)
-                const tlsId = fpData.tls?.ja4?.substring(0, 16) ||
-                              fpData.tls?.ja3_hash?.substring(0, 16) || '-';
-                document.getElementById('tlsId').textContent = tlsId;
-
-                // 更新 HTTP/2 ID (如果有)
-                const http2IdEl = document.getElementById('http2Id');
-                if (http2IdEl && fpData.http2) {
-                    const http2Id = fpData.http2.akamai_hash?.substring(0, 16) || '-';
-                    http2IdEl.textContent = http2Id;
-                }
-
-                // 更新 TCP/IP ID (如果有)
-                const tcpIdEl = document.getElementById('tcpId');
-                if (tcpIdEl) {
-                    if (fpData.tcp) {
-                        // 显示推断的 OS 和置信度
-                        const tcpInfo = fpData.tcp.inferred_os || 'Unknown';
-                        tcpIdEl.textContent = tcpInfo;
-                        // 如果有异常，添加警告样式
-                        if (fpData.tcp.anomalies && fpData.tcp.anomalies.length > 0) {
-                            tcpIdEl.style.color = '#e74c3c';
-                            tcpIdEl.title = fpData.tcp.anomalies.join('\n');
-                        } else {
-                            tcpIdEl.style.color = '';
-                            tcpIdEl.title = `TTL: ${fpData.tcp.ttl}, Window: ${fpData.tcp.window_size}`;
-                        }
-                    } else {
-                        tcpIdEl.textContent = '-';
-                        tcpIdEl.title = 'TCP fingerprinting requires sudo';
-                    }
-                }
-
-                // 更新 TLS 摘要卡片
-                this.updateTlsSummary(fpData);
-
-                // 更新一致性校验状态
-                this.updateConsistencyCheck(fpData.tcp);
-
-                // 保存数据
-                this.saveData();
+                this.showTls(result.fingerprint);
 
                 if (!silent) {
                     this.setStatus('TLS fetched', 'success');
@@ -372,6 +329,60 @@ class FingerprintApp {
         }
     }
 
+    // 显示 TLS/HTTP2/TCP 指纹 (fingerprint 格式为 { tls, http2, tcp })
+    showTls(fpData) {
+        // Store TLS, HTTP/2, and TCP data
+        this.tlsData = {
+            tls: fpData.tls,
+            http2: fpData.http2,
+            tcp: fpData.tcp
+        };
+
+        document.getElementById('tlsJson').textContent = JSON.stringify(this.tlsData, null, 2);
+
+        // 更新 TLS ID (优先使用 JA4，更稳定)
+        const tlsId = fpData.tls?.ja4?.substring(0, 16) ||
+                      fpData.tls?.ja3_hash?.substring(0, 16) || '-';
+        document.getElementById('tlsId').textContent = tlsId;
+
+        // 更新 HTTP/2 ID (如果有)
+        const http2IdEl = document.getElementById('http2Id');
+        if (http2IdEl && fpData.http2) {
+            const http2Id = fpData.http2.akamai_hash?.substring(0, 16) || '-';
+            http2IdEl.textContent = http2Id;
+        }
+
+        // 更新 TCP/IP ID (如果有)
+        const tcpIdEl = document.getElementById('tcpId');
+        if (tcpIdEl) {
+            if (fpData.tcp) {
+                // 显示推断的 OS 和置信度
+                const tcpInfo = fpData.tcp.inferred_os || 'Unknown';
+                tcpIdEl.textContent = tcpInfo;
+                // 如果有异常，添加警告样式
+                if (fpData.tcp.anomalies && fpData.tcp.anomalies.length > 0) {
+                    tcpIdEl.style.color = '#e74c3c';
+                    tcpIdEl.title = fpData.tcp.anomalies.join('\n');
+                } else {
+                    tcpIdEl.style.color = '';
+                    tcpIdEl.title = `TTL: ${fpData.tcp.ttl}, Window: ${fpData.tcp.window_size}`;
+                }
+            } else {
+                tcpIdEl.textContent = '-';
+                tcpIdEl.title = 'TCP fingerprinting requires sudo';
+            }
+        }
+
+        // 更新 TLS 摘要卡片
+        this.updateTlsSummary(fpData);
+
+        // 更新一致性校验状态
+        this.updateConsistencyCheck(fpData.tcp);
+
+        // 保存数据
+        this.saveData();
+    }
+
     displayResults(result) {
         // 显示所有卡片
         document.getElementById('deviceCard').style.display = 'block';
@@ -36,10 +36,17 @@ export function getConfig() {
 /**
  * 发送指纹数据到服务器
  * @param {Object} fingerprint - 指纹数据
+ * @param {Object} [options]
+ * @param {boolean|string} [options.enrich] - 同时查询 IP 信息与 TLS 指纹 (true 或数据源列表，如 'ip_info')
+ * @param {string} [options.view] - 响应内容: 'ids' | 'summary' (附带服务端采集的数据) | 'full' (附带完整指纹)
  * @returns {Promise<Object>} 服务器响应
  */
-export async function sendFingerprint(fingerprint) {
-    const response = await fetch('/api/collect', {
+export async function sendFingerprint(fingerprint, { enrich, view } = {}) {
+    const params = new URLSearchParams();
+    if (enrich) params.set('enrich', enrich === true ? '1' : enrich);
+    if (view) params.set('view', view);
+    const query = params.toString();
+    const response = await fetch(query ? `/api/collect?${query}` : '/api/collect', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
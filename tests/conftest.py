@@ -0,0 +1,57 @@
+"""
+测试公共配置
+- 导入 app 前设置 DB_PATH，导入时的初始化不会写入程序目录下的 fingerprints.db
+- 每个测试使用独立的临时数据库
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fingerprint-tests-'), 'fingerprints.db')
+# 不连接本机可能存在的 TLS 服务，不启用异步写入
+os.environ.pop('TLS_IPC_SOCKET', None)
+os.environ.pop('WRITE_BEHIND', None)
+
+import app as core  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    """独立的临时数据库与设备缓存"""
+    monkeypatch.setattr(core, 'DB_PATH', str(tmp_path / 'fingerprints.db'))
+    monkeypatch.setattr(core, 'device_cache', core.DeviceSignalCache(core.DEVICE_CACHE_MAX_DEVICES))
+    core.init_db()
+    core.load_device_cache()
+    return core.DB_PATH
+
+
+@pytest.fixture
+def client():
+    return core.app.test_client()
+
+
+@pytest.fixture
+def save_fingerprints():
+    """
+    保存 count 条指纹（id 为 fp000、fp001 …），返回 id 列表
+    created_at(index) 指定各条的创建时间，为 None 时使用当前时间
+    """
+    def save(count, created_at=None, client=None):
+        ids = []
+        for index in range(count):
+            fp_id = f'fp{index:03d}'
+            data = dict(client(index) if client else {}, fonts=[str(index)])
+            core.save_fingerprint(fp_id, {'client': data, 'server': {'ip': '10.0.0.1'}})
+            ids.append(fp_id)
+        if created_at:
+            with core.get_db() as conn:
+                conn.executemany('UPDATE fingerprints SET created_at = ? WHERE id = ?',
+                                 [(created_at(index), fp_id) for index, fp_id in enumerate(ids)])
+                conn.commit()
+        return ids
+    return save
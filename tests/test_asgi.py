@@ -0,0 +1,141 @@
+"""ASGI 入口与同步（WSGI）接口的响应一致：状态码、响应体、CORS 头与存储结果"""
+
+import asyncio
+import json
+
+import pytest
+
+import app as core
+
+asgi = pytest.importorskip('asgi')
+httpx = pytest.importorskip('httpx')
+
+CLIENT_IP = '10.0.0.7'
+FINGERPRINT = {
+    'fonts': ['Arial'],
+    'canvas': {'hash': 'c1'},
+    'deviceId': {'coreId': 'core-1', 'signals': {'audio': 'a', 'math': 'm'}},
+}
+# 每次请求都不同的字段
+VARYING_FIELDS = ('collected_at', 'first_seen', 'last_seen')
+
+
+@pytest.fixture(autouse=True)
+def no_sidecar(monkeypatch):
+    """两个入口都不连接 TLS 服务"""
+    monkeypatch.setattr(core, 'tls_ipc_client', None)
+    monkeypatch.setattr(asgi, 'tls_ipc_client', None)
+    monkeypatch.setattr(core, 'tls_stream_store', core.TTLCache(16))
+
+
+# 两个测试客户端发送相同的请求头（browser_id 包含 User-Agent 与 Accept-Encoding，完整指纹包含全部请求头）
+HEADERS = {'User-Agent': 'pytest', 'Accept': '*/*', 'Accept-Encoding': 'identity', 'Connection': 'keep-alive'}
+
+
+def asgi_request(method, url, headers=None, **kwargs):
+    kwargs['headers'] = dict(HEADERS, **(headers or {}))
+
+    async def send():
+        transport = httpx.ASGITransport(app=asgi.app, client=(CLIENT_IP, 50000))
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+            return await client.request(method, url, **kwargs)
+    return asyncio.run(send())
+
+
+def wsgi_request(client, method, url, headers=None, content=None):
+    return client.open(url, method=method, data=content, headers=dict(HEADERS, **(headers or {})),
+                       environ_base={'REMOTE_ADDR': CLIENT_IP})
+
+
+def without_varying(value):
+    if isinstance(value, dict):
+        return {key: without_varying(item) for key, item in value.items() if key not in VARYING_FIELDS}
+    if isinstance(value, list):
+        return [without_varying(item) for item in value]
+    return value
+
+
+def assert_same(sync_response, async_response):
+    assert async_response.status_code == sync_response.status_code
+    assert async_response.headers.get('content-type') == sync_response.headers.get('Content-Type')
+    assert async_response.headers.get('access-control-allow-origin') == \
+        sync_response.headers.get('Access-Control-Allow-Origin')
+    assert without_varying(async_response.json()) == without_varying(sync_response.get_json())
+
+
+@pytest.mark.parametrize('url, body', [
+    ('/api/collect', FINGERPRINT),
+    ('/api/collect?view=full', FINGERPRINT),
+    ('/api/collect?view=ids', FINGERPRINT),
+    ('/api/collect?view=unknown', FINGERPRINT),
+    ('/api/collect', [1]),
+    ('/api/collect?enrich=geo', FINGERPRINT),
+])
+def test_collect_parity(client, monkeypatch, tmp_path, url, body):
+    headers = {'Content-Type': 'application/json', 'Origin': 'http://example.com'}
+    sync_response = wsgi_request(client, 'POST', url, content=json.dumps(body), headers=headers)
+    # 异步接口使用另一个空数据库，两个入口在相同的初始状态下处理请求（设备匹配结果一致）
+    monkeypatch.setattr(core, 'DB_PATH', str(tmp_path / 'asgi.db'))
+    monkeypatch.setattr(core, 'device_cache', core.DeviceSignalCache(core.DEVICE_CACHE_MAX_DEVICES))
+    core.init_db()
+    core.load_device_cache()
+    async_response = asgi_request('POST', url, content=json.dumps(body), headers=headers)
+    assert_same(sync_response, async_response)
+
+
+def test_collect_stores_same_fingerprint(client):
+    body = json.dumps(FINGERPRINT)
+    sync_id = wsgi_request(client, 'POST', '/api/collect', content=body,
+                           headers={'Content-Type': 'application/json'}).get_json()['id']
+    async_response = asgi_request('POST', '/api/collect', content=body, headers={'Content-Type': 'application/json'})
+    assert async_response.json()['id'] == sync_id
+    # 第二次提交匹配到同步接口保存的设备
+    assert async_response.json()['device_match']['match_type'] == 'exact'
+    stored = core.get_fingerprint(sync_id)
+    assert stored['server']['ip'] == CLIENT_IP
+
+
+@pytest.mark.parametrize('body', [b'{not json', b'', b'null'])
+def test_collect_body_parity(client, body):
+    headers = {'Content-Type': 'application/json'}
+    assert_same(wsgi_request(client, 'POST', '/api/collect', content=body, headers=headers),
+                asgi_request('POST', '/api/collect', content=body, headers=headers))
+
+
+def test_collect_body_too_large(client):
+    body = json.dumps({'fonts': ['x' * core.COLLECT_MAX_BODY_BYTES]})
+    headers = {'Content-Type': 'application/json'}
+    sync_response = wsgi_request(client, 'POST', '/api/collect', content=body, headers=headers)
+    assert sync_response.status_code == 413
+    assert_same(sync_response, asgi_request('POST', '/api/collect', content=body, headers=headers))
+
+
+@pytest.mark.parametrize('url', ['/api/ip-info', f'/api/ip-info/{CLIENT_IP}', '/api/ip-info/192.168.1.1'])
+def test_ip_info_parity(client, url):
+    assert_same(wsgi_request(client, 'GET', url), asgi_request('GET', url))
+
+
+def test_forwarded_to_flask(client):
+    core.save_fingerprint('fp1', {'client': {}, 'server': {'ip': CLIENT_IP}})
+    url = '/api/fingerprints?fields=id,ip'
+    sync_response = wsgi_request(client, 'GET', url)
+    async_response = asgi_request('GET', url)
+    assert async_response.json()['fingerprints'] == [{'id': 'fp1', 'ip': CLIENT_IP}]
+    assert_same(sync_response, async_response)
+
+
+def test_cors_preflight_forwarded(client):
+    headers = {'Origin': 'http://example.com', 'Access-Control-Request-Method': 'POST'}
+    sync_response = wsgi_request(client, 'OPTIONS', '/api/collect', headers=headers)
+    async_response = asgi_request('OPTIONS', '/api/collect', headers=headers)
+    assert async_response.status_code == sync_response.status_code == 200
+    for name in ('Access-Control-Allow-Origin', 'Access-Control-Allow-Methods'):
+        assert async_response.headers[name] == sync_response.headers[name]
+
+
+def test_tls_parity_without_sidecar(client, monkeypatch):
+    # 没有监听的端口：两个入口都返回 TLS 服务未运行
+    monkeypatch.setattr(core, 'TLS_SIDECAR_URL', 'https://127.0.0.1:9')
+    sync_response = wsgi_request(client, 'GET', '/api/tls')
+    assert sync_response.status_code == 503
+    assert_same(sync_response, asgi_request('GET', '/api/tls'))
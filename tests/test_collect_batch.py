@@ -0,0 +1,98 @@
+"""批量采集接口：JSON 数组与 NDJSON、服务端字段覆盖、单条失败只回滚该条、并发批量写入"""
+
+import json
+import threading
+
+import app as core
+
+
+def post_batch(client, body, content_type='application/json'):
+    return client.post('/api/collect/batch', data=body, content_type=content_type)
+
+
+def device_item(core_id, fonts):
+    """信号各不相同的设备（不会相互模糊匹配）"""
+    signals = {'audio': core_id, 'canvasGeometry': core_id, 'webglRenderer': core_id, 'math': core_id}
+    return {'fonts': fonts, 'deviceId': {'coreId': core_id, 'signals': signals}}
+
+
+def test_batch_accepts_items(client):
+    body = json.dumps([{'fonts': ['Arial']}, {'client': {'fonts': ['Verdana']}, 'server': {'ip': '203.0.113.9'}}])
+    response = post_batch(client, body)
+    assert response.status_code == 200
+    assert (response.json['count'], response.json['saved'], response.json['failed']) == (2, 2, 0)
+    results = response.json['results']
+    assert [result['success'] for result in results] == [True, True]
+    # server 中的字段覆盖本次请求的服务端数据
+    assert core.get_fingerprint(results[1]['id'])['server']['ip'] == '203.0.113.9'
+
+
+def test_batch_ndjson(client):
+    body = '\n'.join([json.dumps({'fonts': ['Arial']}), '{not json', '', json.dumps({'fonts': ['Verdana']})])
+    response = post_batch(client, body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['error'].startswith('Invalid JSON')
+
+
+def test_batch_too_many_items(client, monkeypatch):
+    monkeypatch.setattr(core, 'COLLECT_BATCH_MAX_ITEMS', 2)
+    response = post_batch(client, json.dumps([{}, {}, {}]))
+    assert response.status_code == 413
+
+
+def test_batch_same_device_twice(client):
+    """同一批中第二次出现的设备精确匹配到第一次保存的设备"""
+    response = post_batch(client, json.dumps([device_item('core-1', ['Arial']), device_item('core-1', ['Verdana'])]))
+    first, second = response.json['results']
+    assert first['device_match']['match_type'] == 'new'
+    assert second['device_match']['match_type'] == 'exact'
+    assert second['device_match']['visit_count'] == 2
+
+
+def test_failed_item_rolls_back_only_itself(client, monkeypatch):
+    store = core.store_collected_fingerprint
+
+    def fail_second(full_fingerprint, device, timings, known_devices=None):
+        result = store(full_fingerprint, device, timings, known_devices)
+        if device.core_id == 'core-2':
+            raise RuntimeError('disk full')
+        return result
+    monkeypatch.setattr(core, 'store_collected_fingerprint', fail_second)
+
+    items = [device_item(f'core-{index}', [str(index)]) for index in range(1, 4)]
+    results = post_batch(client, json.dumps(items)).json['results']
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['error'] == 'disk full'
+    with core.get_db() as conn:
+        core_ids = [row[0] for row in conn.execute('SELECT core_id FROM device_fingerprints ORDER BY id')]
+        fingerprints = conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+    assert core_ids == ['core-1', 'core-3']
+    assert fingerprints == 2
+    # 回滚的设备不会经提交后回调写入内存缓存
+    assert sorted(device[1] for device in core.device_cache.devices.values()) == ['core-1', 'core-3']
+
+
+def test_concurrent_batches():
+    """并发的批量请求排队取得写锁，不会因事务升级写锁失败而返回 database is locked"""
+    errors = []
+
+    def worker(worker_index):
+        client = core.app.test_client()
+        for batch in range(3):
+            items = [device_item(f'core-{worker_index}-{batch}-{index}', [str(index)]) for index in range(10)]
+            response = post_batch(client, json.dumps(items))
+            if response.status_code != 200:
+                errors.append(response.json['error'])
+                continue
+            errors.extend(result['error'] for result in response.json['results'] if not result['success'])
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with core.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM device_fingerprints').fetchone()[0] == 120
@@ -0,0 +1,113 @@
+"""采集数据的解析与校验：顶层类型、设备信号类型、请求体大小、嵌套层数与数组长度限制"""
+
+import io
+import json
+
+import pytest
+
+import app as core
+
+
+def nested(depth):
+    """嵌套 depth 层的对象"""
+    value = {}
+    for _ in range(depth - 1):
+        value = {'a': value}
+    return value
+
+
+@pytest.mark.parametrize('body', [b'', b'null', b'{}', b'  '])
+def test_empty_body_is_empty_payload(body):
+    assert core.parse_collect_payload(body).data == {}
+
+
+@pytest.mark.parametrize('body', [b'[1]', b'"fonts"', b'1'])
+def test_top_level_must_be_object(client, body):
+    with pytest.raises(ValueError):
+        core.parse_collect_payload(body)
+    response = client.post('/api/collect', data=body, content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('device, error', [
+    ({'coreId': 1}, 'deviceId.coreId'),
+    ({'coreId': 'abc', 'signals': {'audio': {'value': 1}}}, 'deviceId.signals.audio'),
+    ({'coreId': 'abc', 'signals': ['audio']}, 'deviceId.signals'),
+    ({'coreId': 'abc', 'confidence': True}, 'deviceId.confidence'),
+])
+def test_invalid_device_identity(client, device, error):
+    response = client.post('/api/collect', json={'deviceId': device})
+    assert response.status_code == 400
+    assert response.json['error'].startswith(error)
+
+
+def test_device_signals_typed():
+    payload = core.CollectPayload({
+        'deviceId': {'fullCoreId': 'f' * 40, 'signals': {'audio': '124.04', 'hardwareConcurrency': 8}},
+    })
+    assert payload.device.core_id == 'f' * 32
+    assert payload.device.device_id == 'f' * 40
+    assert payload.device.signals.audio == '124.04'
+    assert payload.device.signals.hardware_concurrency == 8
+    assert payload.device.signals.math is None
+
+
+def post_batch(client, body, content_type='application/json'):
+    return client.post('/api/collect/batch', data=body, content_type=content_type)
+
+
+def test_batch_body_over_limit(client, monkeypatch):
+    monkeypatch.setattr(core, 'COLLECT_BATCH_MAX_BODY_BYTES', 64)
+    response = post_batch(client, json.dumps([{'fonts': ['x' * 100]}]))
+    assert response.status_code == 413
+    assert not response.json['success']
+
+
+def post_chunked(client, body):
+    """没有 Content-Length 的分块请求（服务器设置 wsgi.input_terminated）"""
+    return client.post('/api/collect/batch', input_stream=io.BytesIO(body), content_type='application/json',
+                       headers={'Transfer-Encoding': 'chunked'},
+                       environ_overrides={'wsgi.input_terminated': True})
+
+
+def test_batch_chunked_body_over_limit(client, monkeypatch):
+    """分块请求体同样受限制，不会被截断后按不完整的 JSON 处理"""
+    monkeypatch.setattr(core, 'COLLECT_BATCH_MAX_BODY_BYTES', 64)
+    assert post_chunked(client, json.dumps([{'fonts': ['x' * 100]}]).encode()).status_code == 413
+    response = post_chunked(client, json.dumps([{'fonts': ['x']}]).encode())
+    assert response.status_code == 200 and response.json['results'][0]['success']
+
+
+def test_batch_item_nested_too_deeply(client):
+    """单条超过嵌套层数时只有该条失败"""
+    deep = nested(core.COLLECT_MAX_DEPTH + 1)
+    response = post_batch(client, json.dumps([{'fonts': ['Arial']}, deep, {'client': {}, 'server': deep}]))
+    assert response.status_code == 200
+    results = response.json['results']
+    assert results[0]['success']
+    assert not results[1]['success'] and 'nested too deeply' in results[1]['error']
+    assert not results[2]['success'] and 'nested too deeply' in results[2]['error']
+
+
+def test_batch_item_within_depth_limit(client):
+    response = post_batch(client, json.dumps([{'extra': nested(core.COLLECT_MAX_DEPTH - 1)}]))
+    assert response.json['results'][0]['success']
+
+
+def test_batch_ndjson_line_nested_too_deeply(client):
+    """NDJSON 中超过解析器递归上限的行只影响该条"""
+    deep_line = '[' * 100000 + ']' * 100000
+    body = '\n'.join([json.dumps({'fonts': ['Arial']}), deep_line])
+    response = post_batch(client, body, content_type='application/x-ndjson')
+    assert response.status_code == 200
+    results = response.json['results']
+    assert results[0]['success']
+    assert not results[1]['success']
+
+
+def test_batch_item_array_too_large(client, monkeypatch):
+    monkeypatch.setattr(core, 'COLLECT_MAX_ARRAY_ITEMS', 3)
+    response = post_batch(client, json.dumps([{'fonts': ['a', 'b', 'c', 'd']}, {'fonts': ['a']}]))
+    results = response.json['results']
+    assert not results[0]['success'] and 'too many items' in results[0]['error']
+    assert results[1]['success']
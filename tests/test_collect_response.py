@@ -0,0 +1,151 @@
+"""/api/collect 的 ?view= 响应内容，以及 JSON 响应按 Accept-Encoding 的 gzip / brotli 压缩"""
+
+import gzip
+import json
+
+import pytest
+
+import app as core
+
+FINGERPRINT = {
+    'fonts': ['Arial'],
+    'canvas': {'hash': 'c1'},
+    'deviceId': {'coreId': 'core-1', 'signals': {'audio': 'a', 'math': 'm'}},
+}
+ID_KEYS = {'success', 'id', 'ids', 'browser_id', 'tls_id', 'combined_id', 'device_match'}
+
+
+def collect(client, query='', headers=None):
+    return client.post(f'/api/collect{query}', data=json.dumps(FINGERPRINT),
+                       headers=dict({'Content-Type': 'application/json'}, **(headers or {})))
+
+
+@pytest.mark.parametrize('query', ['', '?view=ids'])
+def test_view_ids(client, query):
+    response = collect(client, query)
+    assert response.status_code == 200
+    assert response.json.keys() == ID_KEYS
+    assert response.json['ids']['browser_v1'] == response.json['browser_id']
+
+
+def test_view_summary(client):
+    data = collect(client, '?view=summary').json
+    assert data.keys() == ID_KEYS | {'fingerprint'}
+    # 只包含服务端采集的部分，不回显客户端提交的数据
+    assert data['fingerprint'].keys() == {'server'}
+    assert data['fingerprint']['server']['ip'] == '127.0.0.1'
+
+
+def test_view_full(client):
+    data = collect(client, '?view=full').json
+    assert data['fingerprint']['id'] == data['id']
+    assert data['fingerprint']['client']['canvas'] == FINGERPRINT['canvas']
+    assert data['fingerprint'] == core.get_fingerprint(data['id'])
+
+
+def test_default_view_from_config(client, monkeypatch):
+    monkeypatch.setattr(core, 'COLLECT_RESPONSE_VIEW', 'summary')
+    assert collect(client).json['fingerprint'].keys() == {'server'}
+    # 显式指定的 view 优先
+    assert 'fingerprint' not in collect(client, '?view=ids').json
+
+
+def test_invalid_view(client):
+    response = collect(client, '?view=everything')
+    assert response.status_code == 400
+    assert 'Invalid view' in response.json['error']
+    # 参数错误时不保存指纹
+    assert client.get('/api/fingerprints').json['fingerprints'] == []
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('br', 'br'),
+    ('gzip, br', 'br'),                 # q 值相同时 brotli 优先
+    ('gzip;q=1.0, br;q=0.5', 'gzip'),
+    ('gzip;q=0.2, br;q=0.8', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('gzip;q=0, br;q=0', None),
+    ('*', 'br'),
+    ('*;q=0.5, gzip', 'gzip'),
+    ('gzip;q=abc, br;q=0.1', 'br'),     # 无法解析的 q 值按 0 处理
+    ('deflate, zstd', None),
+])
+def test_negotiate_encoding(header, expected):
+    pytest.importorskip('brotli')
+    assert core.negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize('header, expected', [('br', None), ('gzip, br', 'gzip'), ('*', 'gzip')])
+def test_negotiate_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(core, 'brotli', None)
+    assert core.negotiate_encoding(header) == expected
+
+
+@pytest.fixture
+def compress_all(monkeypatch):
+    """所有 JSON 响应都达到压缩大小下限"""
+    monkeypatch.setattr(core, 'RESPONSE_COMPRESS_MIN_SIZE', 1)
+
+
+def decompress(response):
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'br':
+        return pytest.importorskip('brotli').decompress(response.data)
+    if encoding == 'gzip':
+        return gzip.decompress(response.data)
+    return response.data
+
+
+@pytest.mark.parametrize('accept_encoding', ['gzip', 'br'])
+def test_json_response_compressed(client, compress_all, accept_encoding):
+    if accept_encoding == 'br':
+        pytest.importorskip('brotli')
+    response = collect(client, '?view=full', headers={'Accept-Encoding': accept_encoding})
+    assert response.headers['Content-Encoding'] == accept_encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) == len(response.data)
+    data = json.loads(decompress(response))
+    assert data['fingerprint']['client']['canvas'] == FINGERPRINT['canvas']
+
+
+def test_gzip_output_deterministic(client, compress_all):
+    # mtime=0：相同内容的压缩结果相同（便于缓存与 ETag）
+    headers = {'Accept-Encoding': 'gzip'}
+    first = client.get('/api/fingerprints', headers=headers)
+    second = client.get('/api/fingerprints', headers=headers)
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert first.data == second.data
+
+
+def test_small_response_not_compressed(client):
+    response = collect(client, headers={'Accept-Encoding': 'gzip, br'})
+    assert len(response.data) < core.RESPONSE_COMPRESS_MIN_SIZE
+    assert 'Content-Encoding' not in response.headers
+    # 响应是否压缩取决于 Accept-Encoding，缓存需要区分
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.json['success'] is True
+
+
+def test_not_compressed_without_accept_encoding(client, compress_all):
+    for headers in ({}, {'Accept-Encoding': 'identity'}, {'Accept-Encoding': 'gzip;q=0'}):
+        response = collect(client, '?view=full', headers=headers)
+        assert 'Content-Encoding' not in response.headers
+        assert response.json['fingerprint']['id'] == response.json['id']
+
+
+def test_non_json_response_not_compressed(client, compress_all):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert response.mimetype != 'application/json'
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_compression_disabled(client, compress_all, monkeypatch):
+    monkeypatch.setattr(core, 'RESPONSE_COMPRESSION', False)
+    response = collect(client, '?view=full', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Vary' not in response.headers or 'Accept-Encoding' not in response.headers['Vary']
+    assert response.json['success'] is True
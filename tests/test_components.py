@@ -0,0 +1,101 @@
+"""重复子文档去重存储：共享组件只存一份，替换指纹时清除旧引用，异步写入时与指纹行整组写入"""
+
+import app as core
+
+FINGERPRINT = {
+    'client': {'webgl': {'extensions': [f'EXT_{index}' for index in range(50)]}, 'fonts': ['Arial']},
+    'server': {'ip': '10.0.0.1'},
+}
+
+
+def component_refs(fp_id):
+    with core.get_db() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM fingerprint_components WHERE fingerprint_id = ?', (fp_id,)
+        ).fetchone()[0]
+
+
+def test_shared_components_stored_once(client, monkeypatch):
+    monkeypatch.setattr(core, 'COMPONENT_STORE', True)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    core.save_fingerprint('fp2', dict(FINGERPRINT, server={'ip': '10.0.0.2'}))
+    with core.get_db() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM components').fetchone()[0] == 1
+        stored = core.payload_codec.loads(conn.execute("SELECT data FROM fingerprints WHERE id = 'fp2'").fetchone()[0])
+    assert 'webgl' not in stored['client'] and stored['$components'].keys() == {'client.webgl'}
+    # 小于 COMPONENT_MIN_SIZE 的子文档保留在原文档中
+    assert stored['client']['fonts'] == ['Arial']
+    assert core.get_fingerprint('fp2')['client'] == FINGERPRINT['client']
+
+    components = client.get('/api/fingerprint/fp1/components').json['components']
+    assert [(item['path'], item['shared_by']) for item in components] == [('client.webgl', 2)]
+    digest = components[0]['hash']
+    for limit, listed in ((100, 2), (1, 1), (-1, 1)):
+        response = client.get(f'/api/components/{digest}?limit={limit}')
+        assert response.json['count'] == 2
+        assert len(response.json['fingerprints']) == listed
+
+
+def test_prune_unreferenced_components(monkeypatch):
+    monkeypatch.setattr(core, 'COMPONENT_STORE', True)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    assert core.prune_components() == 0
+    with core.get_db() as conn:
+        conn.execute('DELETE FROM fingerprint_components')
+        conn.commit()
+    assert core.prune_components() == 1
+
+
+def test_replace_without_component_store_clears_refs(monkeypatch):
+    monkeypatch.setattr(core, 'COMPONENT_STORE', True)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    assert component_refs('fp1') > 0
+
+    monkeypatch.setattr(core, 'COMPONENT_STORE', False)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    assert component_refs('fp1') == 0
+    assert core.get_fingerprint('fp1')['client']['webgl'] == FINGERPRINT['client']['webgl']
+
+
+class PausedWriteBehindQueue(core.WriteBehindQueue):
+    """不启动后台线程：入队的数据只在 stop() 时写入"""
+
+    def _ensure_started(self):
+        pass
+
+
+def use_write_behind(monkeypatch, max_size):
+    monkeypatch.setattr(core, 'COMPONENT_STORE', True)
+    monkeypatch.setattr(core, 'WRITE_BEHIND', True)
+    monkeypatch.setattr(core, 'WRITE_BEHIND_PUT_TIMEOUT_MS', 0)
+    queue = PausedWriteBehindQueue(max_size, 10, 60)
+    monkeypatch.setattr(core, 'write_behind', queue)
+    return queue
+
+
+def fingerprint_rows():
+    with core.get_db() as conn:
+        return conn.execute('SELECT COUNT(*) FROM fingerprints').fetchone()[0]
+
+
+def test_write_behind_queues_components_with_row(monkeypatch):
+    """组件与指纹行是同一个队列项，不会只有一部分入队、另一部分同步写入"""
+    queue = use_write_behind(monkeypatch, 2)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    assert queue.queue.qsize() == 1
+    assert fingerprint_rows() == 0
+
+    queue.stop()
+    assert component_refs('fp1') > 0
+    assert core.get_fingerprint('fp1')['client']['webgl'] == FINGERPRINT['client']['webgl']
+
+
+def test_write_behind_full_queue_writes_group_together(monkeypatch):
+    """队列满时同步写入整组：指纹行与它引用的组件一起写入"""
+    queue = use_write_behind(monkeypatch, 1)
+    queue.queue.put((('SELECT 1', ()),))
+    core.save_fingerprint('fp1', FINGERPRINT)
+
+    assert fingerprint_rows() == 1
+    assert component_refs('fp1') > 0
+    assert core.get_fingerprint('fp1')['client']['webgl'] == FINGERPRINT['client']['webgl']
@@ -0,0 +1,62 @@
+"""SQLite 连接池：连接复用与 WAL 配置、归还时回滚未提交事务、池满时等待、fork 后重建"""
+
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import app as core
+
+
+def count_devices():
+    with core.get_db() as conn:
+        return conn.execute('SELECT COUNT(*) FROM device_fingerprints').fetchone()[0]
+
+
+def insert_device(conn, device_id):
+    conn.execute('INSERT INTO device_fingerprints (device_id, core_id) VALUES (?, ?)', (device_id, device_id))
+
+
+def test_connections_reused_and_configured():
+    with core.get_db() as conn:
+        first = conn
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == core.DB_BUSY_TIMEOUT_MS
+        # 同一线程内嵌套调用复用同一连接
+        with core.get_db() as nested:
+            assert nested is conn
+    with core.get_db() as conn:
+        assert conn is first
+    assert core.get_db_pool().created == 1
+
+
+def test_release_rolls_back_uncommitted():
+    with core.get_db() as conn:
+        insert_device(conn, 'd1')
+        assert conn.in_transaction
+    assert count_devices() == 0
+
+
+def test_pool_exhausted(monkeypatch):
+    monkeypatch.setattr(core, 'DB_BUSY_TIMEOUT_MS', 50)
+    pool = core.ConnectionPool(core.DB_PATH, 1)
+    conn = pool.acquire()
+    with pytest.raises(sqlite3.OperationalError, match='exhausted'):
+        pool.acquire()
+    # 其他线程归还后等待中的线程取得连接
+    timer = threading.Timer(0.01, pool.release, (conn,))
+    monkeypatch.setattr(core, 'DB_BUSY_TIMEOUT_MS', 2000)
+    timer.start()
+    assert pool.acquire() is conn
+    timer.join()
+    pool.release(conn)
+    pool.close()
+    assert pool.created == 0
+
+
+def test_new_pool_after_fork(monkeypatch):
+    pool = core.get_db_pool()
+    monkeypatch.setattr(os, 'getpid', lambda: pool.pid + 1)
+    assert core.get_db_pool() is not pool
+
@@ -0,0 +1,99 @@
+"""设备信号内存缓存：增量同步、写穿、超出上限后停用并回退到 SQLite"""
+
+import app as core
+
+
+def save_device(core_id, audio='a', math='m'):
+    device = core.DeviceIdentity({
+        'coreId': core_id,
+        'signals': {'audio': audio, 'canvasGeometry': core_id, 'webglRenderer': core_id, 'math': math},
+    })
+    core.save_device_fingerprint(device, '10.0.0.1', 'pytest')
+
+
+def insert_device(core_id):
+    """其他进程写入的设备：只写数据库，不经过本进程的缓存"""
+    with core.get_db() as conn:
+        conn.execute('INSERT INTO device_fingerprints (device_id, core_id, audio, math) VALUES (?, ?, ?, ?)',
+                     (core_id, core_id, 'a', 'm'))
+        conn.commit()
+
+
+def cached_ids(cache):
+    return sorted(entry[1] for entry in cache.devices.values())
+
+
+def test_write_through():
+    save_device('d1')
+    save_device('d2')
+    assert cached_ids(core.device_cache) == ['d1', 'd2']
+    # 相同的字符串共享同一个对象
+    first, second = core.device_cache.devices.values()
+    assert first[2] is second[2]
+
+
+def test_sync_loads_devices_from_other_processes():
+    save_device('d1')
+    insert_device('d2')
+    with core.get_db() as conn:
+        assert core.device_cache.sync(conn)
+    assert cached_ids(core.device_cache) == ['d1', 'd2']
+    assert core.device_cache.synced_id == 2
+
+
+def test_sync_skipped_inside_transaction():
+    """事务中读到的行可能回滚，不写入缓存"""
+    with core.db_transaction() as conn:
+        conn.execute("INSERT INTO device_fingerprints (device_id, core_id) VALUES ('d1', 'd1')")
+        assert core.device_cache.sync(conn)
+        assert core.device_cache.devices == {}
+        conn.rollback()
+    with core.get_db() as conn:
+        core.device_cache.sync(conn)
+    assert core.device_cache.devices == {}
+
+
+def test_find_candidates_needs_two_core_signals():
+    save_device('d1', audio='a', math='m')
+    save_device('d2', audio='a', math='other')
+    signals = core.DeviceSignals({'audio': 'a', 'math': 'm', 'canvasGeometry': 'x', 'webglRenderer': 'y'})
+    assert [device['device_id'] for device in core.device_cache.find_candidates(signals)] == ['d1']
+
+
+def test_exceeding_limit_disables_cache(monkeypatch):
+    cache = core.DeviceSignalCache(2)
+    monkeypatch.setattr(core, 'device_cache', cache)
+    core.load_device_cache()
+    save_device('d1')
+    save_device('d2')
+    assert cache.ready and cached_ids(cache) == ['d1', 'd2']
+
+    save_device('d3')
+    assert cache.disabled and not cache.ready
+    assert cache.devices == {} and cache.pair_index == {}
+    with core.get_db() as conn:
+        assert not cache.sync(conn)
+
+    # 缓存停用后匹配回退到 SQLite 查询
+    device = core.DeviceIdentity({'coreId': 'other', 'signals': {
+        'audio': 'a', 'math': 'm', 'canvasGeometry': 'd3', 'webglRenderer': 'd3',
+    }})
+    result = core.match_device(device)
+    assert (result['match_type'], result['device_id']) == ('fuzzy_core', 'd3')
+
+
+def test_sync_over_limit_disables_cache():
+    for index in range(3):
+        insert_device(f'd{index}')
+    cache = core.DeviceSignalCache(2)
+    with core.get_db() as conn:
+        assert not cache.sync(conn)
+    assert cache.disabled
+
+
+def test_zero_limit_disables_cache():
+    cache = core.DeviceSignalCache(0)
+    save_device('d1')
+    with core.get_db() as conn:
+        assert not cache.sync(conn)
+    assert cache.devices == {}
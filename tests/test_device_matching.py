@@ -0,0 +1,65 @@
+"""设备模糊匹配：候选索引（内存缓存与 SQLite 回退）与全表扫描得到相同的最佳匹配"""
+
+import random
+
+import pytest
+
+import app as core
+
+# 取值范围很小，使设备之间大量共享信号；包含 None 与空字符串
+CORE_VALUES = ('a', 'b', '', None)
+ENV_VALUES = {
+    'screen': ('1920x1080', '', None),
+    'timezone': ('Asia/Shanghai', 'UTC', None),
+    'platform': ('Win32', '', None),
+    'hardwareConcurrency': (4, 8, None),
+}
+CORE_FIELDS = tuple(field for field, _ in core.CORE_SIGNAL_COLUMNS)
+# 比较的结果字段（first_seen / visit_count 随每次匹配更新，不参与比较）
+RESULT_FIELDS = ('match', 'match_type', 'confidence', 'device_id', 'core_matches', 'env_similarity')
+
+
+def random_device(rng, core_id):
+    signals = {field: rng.choice(CORE_VALUES) for field in CORE_FIELDS}
+    signals.update((field, rng.choice(values)) for field, values in ENV_VALUES.items())
+    return core.DeviceIdentity({'coreId': core_id, 'signals': signals})
+
+
+def full_scan(conn, signals, min_id=0):
+    """基准：不使用索引，遍历全部设备"""
+    return conn.execute(
+        f'SELECT {", ".join(core.DEVICE_SIGNAL_COLUMNS)} FROM device_fingerprints WHERE id > ? ORDER BY id',
+        (min_id,)
+    ).fetchall()
+
+
+def match(device):
+    result = core.match_device(device)
+    return {field: result.get(field) for field in RESULT_FIELDS}
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_candidate_index_matches_full_scan(seed):
+    rng = random.Random(seed)
+    for index in range(150):
+        core.save_device_fingerprint(random_device(rng, f'device-{index}'), '10.0.0.1', 'pytest')
+    assert core.device_cache.ready and len(core.device_cache.devices) == 150
+
+    matched = 0
+    for index in range(100):
+        # core_id 不存在，跳过第一层精确匹配
+        device = random_device(rng, f'query-{index}')
+
+        cached = match(device)
+        with pytest.MonkeyPatch.context() as patch:
+            # 缓存禁用时回退到 SQLite 索引查询
+            patch.setattr(core, 'device_cache', core.DeviceSignalCache(0))
+            from_sql = match(device)
+            patch.setattr(core, 'find_candidate_devices', full_scan)
+            expected = match(device)
+
+        assert cached == expected
+        assert from_sql == expected
+        matched += expected['match']
+    # 随机数据中确实出现了匹配，比较不是只在“新设备”上进行
+    assert matched > 0
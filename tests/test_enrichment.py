@@ -0,0 +1,131 @@
+"""增强采集：并发查询各数据源、按各自超时返回部分结果；TLS 指纹只使用推送流内存表与本地 IPC"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app as core
+
+TLS_FINGERPRINT = {'tls': {'ja4': 't13d1516h2_8daaf6152771_b0da82dd1658', 'ja3_hash': 'stream'}}
+
+
+class StubIPCClient:
+    """记录查询的 IP，返回固定结果"""
+
+    def __init__(self, result):
+        self.result = result
+        self.queried = []
+
+    def query_fingerprint(self, ip):
+        self.queried.append(ip)
+        return self.result
+
+
+@pytest.fixture(autouse=True)
+def no_https_fallback(monkeypatch):
+    """HTTPS 接口返回的是本服务自身连接的指纹，增强采集调用它即为错误"""
+    def fail(client_ip):
+        raise AssertionError('collect enrichment must not query the HTTPS sidecar')
+    monkeypatch.setattr(core, 'query_tls_sidecar', fail)
+    monkeypatch.setattr(core, 'tls_ipc_client', None)
+
+
+def test_lookup_without_ipc_returns_none():
+    assert core.lookup_tls_enrichment('198.51.100.1') is None
+
+
+def test_lookup_uses_stream_store(monkeypatch):
+    store = core.TTLCache(16)
+    store.set('198.51.100.2', TLS_FINGERPRINT, 60)
+    monkeypatch.setattr(core, 'tls_stream_store', store)
+    assert core.lookup_tls_enrichment('198.51.100.2') == TLS_FINGERPRINT
+
+
+def test_lookup_queries_ipc(monkeypatch):
+    stub = StubIPCClient({'success': True, 'fingerprint': TLS_FINGERPRINT})
+    monkeypatch.setattr(core, 'tls_ipc_client', stub)
+    assert core.lookup_tls_enrichment('198.51.100.3') == TLS_FINGERPRINT
+    assert stub.queried == ['198.51.100.3']
+
+    stub.result = {'success': False, 'error': 'not found'}
+    assert core.lookup_tls_enrichment('198.51.100.3') is None
+
+
+def test_collect_enrichment_without_ipc(client):
+    response = client.post('/api/collect?enrich=tls&view=full', json={'fonts': ['Arial']},
+                           headers={'X-Forwarded-For': '198.51.100.4'})
+    assert response.status_code == 200
+    assert response.json['enrichment']['tls'] == {'status': 'ok', 'data': None}
+    assert not response.json['partial']
+
+
+def test_async_lookup_without_ipc(monkeypatch):
+    asgi = pytest.importorskip('asgi')
+
+    async def fail(client_ip):
+        raise AssertionError('collect enrichment must not query the HTTPS sidecar')
+    monkeypatch.setattr(asgi, 'query_tls_sidecar_async', fail)
+    monkeypatch.setattr(asgi, 'tls_ipc_client', None)
+    assert asyncio.run(asgi.lookup_tls_enrichment_async('198.51.100.5')) is None
+
+    store = core.TTLCache(16)
+    store.set('198.51.100.5', TLS_FINGERPRINT, 60)
+    monkeypatch.setattr(core, 'tls_stream_store', store)
+    assert asyncio.run(asgi.lookup_tls_enrichment_async('198.51.100.5')) == TLS_FINGERPRINT
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, ()), ('0', ()), ('all', ('ip_info', 'tls')), ('1', ('ip_info', 'tls')),
+    ('tls', ('tls',)), ('tls, ip_info,tls', ('tls', 'ip_info')),
+])
+def test_parse_enrich_sources(value, expected):
+    assert core.parse_enrich_sources(value) == expected
+
+
+def test_unknown_enrich_source(client):
+    with pytest.raises(ValueError):
+        core.parse_enrich_sources('ip_info,geo')
+    assert client.post('/api/collect?enrich=geo', json={}).status_code == 400
+
+
+def test_sources_queried_concurrently(monkeypatch):
+    """各数据源同时开始查询：两个都需要对方开始后才能完成"""
+    barrier = threading.Barrier(2, timeout=2)
+
+    def source(ip):
+        barrier.wait()
+        return ip
+    monkeypatch.setitem(core.ENRICHMENT_SOURCES, 'ip_info', source)
+    monkeypatch.setitem(core.ENRICHMENT_SOURCES, 'tls', source)
+    timings = {}
+    results = core.Enrichment(('ip_info', 'tls'), '198.51.100.6', timings).collect()
+    assert results == {'ip_info': {'status': 'ok', 'data': '198.51.100.6'},
+                       'tls': {'status': 'ok', 'data': '198.51.100.6'}}
+    assert {'enrich_ip_info', 'enrich_tls'} <= timings.keys()
+
+
+def test_slow_and_failing_sources_are_partial(client, monkeypatch):
+    release = threading.Event()
+
+    def slow(ip):
+        release.wait(5)
+        return {'country': 'late'}
+
+    def failing(ip):
+        raise RuntimeError('sidecar unavailable')
+    monkeypatch.setitem(core.ENRICHMENT_SOURCES, 'ip_info', slow)
+    monkeypatch.setitem(core.ENRICHMENT_SOURCES, 'tls', failing)
+    monkeypatch.setitem(core.ENRICHMENT_TIMEOUTS, 'ip_info', 50)
+
+    started = time.monotonic()
+    try:
+        response = client.post('/api/collect?enrich=all&view=full', json={'fonts': ['Arial']})
+    finally:
+        release.set()
+    assert time.monotonic() - started < 2
+    assert response.status_code == 200
+    assert response.json['partial']
+    assert response.json['enrichment']['ip_info'] == {'status': 'timeout', 'data': None}
+    assert response.json['enrichment']['tls'] == {'status': 'error', 'data': None, 'error': 'sidecar unavailable'}
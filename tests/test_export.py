@@ -0,0 +1,101 @@
+"""时间统一以 UTC 存储与过滤，导出接口的键集分页与 NDJSON/CSV 输出"""
+
+import csv
+import io
+import json
+
+import pytest
+
+import app as core
+
+
+def test_stored_times_are_utc(save_fingerprints):
+    save_fingerprints(1)
+    with core.get_db() as conn:
+        created_at = conn.execute('SELECT created_at FROM fingerprints').fetchone()[0]
+    assert created_at == core.normalize_time_bound(created_at)
+    assert 'T' not in created_at
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2026-01-01', '2026-01-01 00:00:00'),
+    ('2026-01-01T08:30:00', '2026-01-01 08:30:00'),
+    ('2026-01-01 08:30:00.250', '2026-01-01 08:30:00'),
+    ('2026-01-01T08:30:00Z', '2026-01-01 08:30:00'),
+    ('2026-01-01T08:30:00+08:00', '2026-01-01 00:30:00'),
+])
+def test_normalize_time_bound(value, expected):
+    assert core.normalize_time_bound(value) == expected
+
+
+def test_since_until_accept_any_iso_form(client, save_fingerprints):
+    save_fingerprints(4, created_at=lambda index: f'2026-01-0{index + 1} 12:00:00')
+    for since, until in (('2026-01-02', '2026-01-04'), ('2026-01-02T00:00:00Z', '2026-01-04 00:00:00'),
+                         ('2026-01-02T08:00:00+08:00', '2026-01-04T08:00:00+08:00')):
+        response = client.get('/api/fingerprints', query_string={'since': since, 'until': until, 'fields': 'id'})
+        assert sorted(item['id'] for item in response.json['fingerprints']) == ['fp001', 'fp002']
+    assert client.get('/api/fingerprints?since=yesterday').status_code == 400
+
+
+def test_legacy_local_times_converted():
+    with core.get_db() as conn:
+        conn.execute("INSERT INTO fingerprints (id, data, created_at) VALUES ('old', '{}', '2026-01-01T08:30:00.123456')")
+        conn.execute('PRAGMA user_version = 0')
+        conn.commit()
+    core.init_db()
+    with core.get_db() as conn:
+        created_at = conn.execute("SELECT created_at FROM fingerprints WHERE id = 'old'").fetchone()[0]
+        expected = conn.execute("SELECT datetime('2026-01-01T08:30:00', 'utc')").fetchone()[0]
+    assert created_at == expected
+
+
+def test_export_pages_on_primary_key_while_rows_change():
+    """导出期间更新 last_seen 不会导致设备重复输出"""
+    with core.get_db() as conn:
+        conn.executemany(
+            'INSERT INTO device_fingerprints (device_id, core_id, last_seen) VALUES (?, ?, ?)',
+            [(f'd{index}', f'c{index}', f'2026-01-01 00:00:0{index}') for index in range(5)]
+        )
+        conn.commit()
+    columns, where, params = core.export_query('device_fingerprints', {'since': '2026-01-01'})
+    exported = []
+    for items in core.iter_export_rows('device_fingerprints', columns, where, params, chunk_size=2):
+        exported += [item['device_id'] for item in items]
+        with core.get_db() as conn:
+            conn.execute("UPDATE device_fingerprints SET last_seen = '2026-01-01 00:00:09'")
+            conn.commit()
+    assert exported == [f'd{index}' for index in range(5)]
+
+
+def test_export_ndjson(client, save_fingerprints):
+    save_fingerprints(3)
+    response = client.get('/api/export/fingerprints?since=2000-01-01')
+    rows = [json.loads(line) for line in response.data.splitlines()]
+    assert [row['id'] for row in rows] == ['fp000', 'fp001', 'fp002']
+    assert rows[0]['data']['client']['fonts'] == ['0']
+
+
+def test_export_csv(client, save_fingerprints):
+    save_fingerprints(2)
+    response = client.get('/api/export/fingerprints?format=csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['id'] for row in rows] == ['fp000', 'fp001']
+    # 嵌套数据以 JSON 文本写入单元格
+    assert json.loads(rows[1]['data'])['client']['fonts'] == ['1']
+
+
+def test_export_device_visits_by_visit_time(client):
+    for index in range(3):
+        core.record_device_visit(f'd{index}', '10.0.0.1', 'pytest', 'new', 0)
+    with core.get_db() as conn:
+        conn.execute("UPDATE device_visits SET visit_time = '2026-01-0' || id || ' 00:00:00'")
+        conn.commit()
+    response = client.get('/api/export/device_visits?since=2026-01-02&until=2026-01-03T00:00:00Z')
+    assert [json.loads(line)['device_id'] for line in response.data.splitlines()] == ['d1']
+
+
+@pytest.mark.parametrize('path', ['/api/export/users', '/api/export/fingerprints?format=xml',
+                                  '/api/export/device_visits?ip=10.0.0.1', '/api/export/device_visits?since=soon'])
+def test_export_invalid(client, path):
+    assert client.get(path).status_code == 400
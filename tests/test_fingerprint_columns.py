@@ -0,0 +1,85 @@
+"""指纹热点字段列：提取规则、旧数据回填，tools/reidentify.py --rewrite 同时刷新列值"""
+
+import sys
+
+import pytest
+
+import app as core
+from tools import reidentify
+
+FINGERPRINT = {
+    'client': {'navigator': {'platform': 'Linux x86_64'}, 'tls': {'ja3_hash': 'abc', 'ja4': 't13d_test'}},
+    'server': {'ip': '10.0.0.1', 'user_agent': 'pytest'},
+    'browser_id': 'stale-browser',
+    'tls_id': 'stale-tls',
+    'combined_id': 'stale-combined',
+}
+
+
+def run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['reidentify.py', '--workers', '0', *args])
+    reidentify.main()
+
+
+def load_row(fp_id):
+    with core.get_db() as conn:
+        row = conn.execute('SELECT * FROM fingerprints WHERE id = ?', (fp_id,)).fetchone()
+    return row, core.decode_fingerprint(row['data'])
+
+
+def test_extract_columns_fallback_paths():
+    """按候选路径取第一个非空值；客户端未提交 TLS 数据时取 TLS 服务推送的"""
+    columns = dict(zip((column for column, _, _ in core.FINGERPRINT_COLUMNS), core.extract_fingerprint_columns({
+        'client': {'webgl': {'renderer': 'ANGLE', 'vendor': {'nested': True}}, 'automation': {'score': 0.5}},
+        'server': {'tls': {'tls': {'ja4': 'server-ja4'}, 'http2': {'akamai_hash': 'h2'}}},
+    })))
+    assert columns['webgl_renderer'] == 'ANGLE'
+    assert columns['webgl_vendor'] is None  # 非标量不写入列
+    assert columns['automation_score'] == 0.5
+    assert columns['ja4'] == 'server-ja4'
+    assert columns['http2_hash'] == 'h2'
+
+
+def test_backfill_old_rows():
+    core.save_fingerprint('fp1', FINGERPRINT)
+    with core.get_db() as conn:
+        conn.execute('UPDATE fingerprints SET ja4 = NULL, platform = NULL, columns_version = 0')
+        conn.commit()
+
+    assert core.backfill_fingerprint_columns() == 1
+    row, _ = load_row('fp1')
+    assert (row['ja4'], row['platform']) == ('t13d_test', 'Linux x86_64')
+    assert row['columns_version'] == core.FINGERPRINT_COLUMNS_VERSION
+    assert core.backfill_fingerprint_columns() == 0
+
+
+@pytest.mark.parametrize('component_store', [False, True])
+def test_rewrite_refreshes_columns(monkeypatch, component_store):
+    monkeypatch.setattr(core, 'COMPONENT_STORE', component_store)
+    core.save_fingerprint('fp1', FINGERPRINT)
+    with core.get_db() as conn:
+        conn.execute('UPDATE fingerprints SET columns_version = 0')
+        conn.commit()
+
+    run(monkeypatch, '--rewrite')
+
+    row, fingerprint = load_row('fp1')
+    assert fingerprint['tls_id'] != 'stale-tls'
+    assert row['tls_id'] == fingerprint['tls_id']
+    assert row['combined_id'] == fingerprint['combined_id']
+    assert row['ja4'] == 't13d_test'
+    assert row['platform'] == 'Linux x86_64'
+    assert row['columns_version'] == core.FINGERPRINT_COLUMNS_VERSION
+    # 列值与按改写后的数据重新提取的结果一致
+    assert tuple(row[column] for column, _, _ in core.FINGERPRINT_COLUMNS) == core.extract_fingerprint_columns(fingerprint)
+
+
+def test_without_rewrite_keeps_data(monkeypatch):
+    core.save_fingerprint('fp1', FINGERPRINT)
+    run(monkeypatch)
+
+    row, fingerprint = load_row('fp1')
+    assert fingerprint['tls_id'] == row['tls_id'] == 'stale-tls'
+    with core.get_db() as conn:
+        schemes = {r['scheme'] for r in conn.execute("SELECT scheme FROM fingerprint_ids WHERE fingerprint_id = 'fp1'")}
+    assert schemes == {scheme.name for scheme in core.active_id_schemes()}
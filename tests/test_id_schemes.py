@@ -0,0 +1,91 @@
+"""版本化的指纹 ID 方案：注册、主版本选择、额外计算的版本、各方案 ID 的计算与存储"""
+
+import pytest
+
+import app as core
+
+CLIENT = {
+    'canvas': {'hash': 'c1'},
+    'screen': {'width': 1920, 'innerWidth': 1200},
+    'timestamp': 1,
+    'tls': {'ja4': 'ignored'},
+}
+TLS = {
+    'tls_version': '771', 'cipher_suite': '4865',
+    'ciphers': ['GREASE', 'TLS_AES_128_GCM_SHA256'],
+    'extensions': [{'name': 'server_name'}, {'name': 'GREASE'}, {'name': 'alpn'}],
+    'supported_groups': ['x25519'], 'supported_versions': ['TLS 1.3'],
+}
+
+
+def fingerprint(client=CLIENT):
+    return {'client': client, 'server': {'user_agent': 'pytest', 'accept_encoding': 'gzip'}}
+
+
+@pytest.fixture
+def browser_v2(monkeypatch):
+    """注册一个只使用 canvas 的 browser v2 方案（测试结束后恢复注册表）"""
+    monkeypatch.setattr(core, 'ID_SCHEMES', {kind: dict(versions) for kind, versions in core.ID_SCHEMES.items()})
+    monkeypatch.setattr(core, 'ID_SCHEME_PRIMARY', dict(core.ID_SCHEME_PRIMARY))
+    monkeypatch.setattr(core, 'ID_SCHEME_VERSIONS', set())
+    return core.register_id_scheme(core.FingerprintIdScheme(
+        'browser', 2, include={'canvas': (('client', 'canvas', 'hash'), None)},
+    ))
+
+
+def test_v1_ignores_unstable_fields():
+    scheme = core.get_id_scheme('browser', 1)
+    fp_id = scheme.compute(fingerprint())
+    changed = dict(CLIENT, timestamp=2, screen={'width': 1920, 'innerWidth': 800}, tls={'ja4': 'other'})
+    assert scheme.compute(fingerprint(changed)) == fp_id
+    assert scheme.compute(fingerprint(dict(CLIENT, canvas={'hash': 'c2'}))) != fp_id
+    # screen 不是对象时按空对象处理
+    assert scheme.compute(fingerprint(dict(CLIENT, screen=None))) == scheme.compute(fingerprint(dict(CLIENT, screen={})))
+    assert scheme.compute(None) is None
+
+
+def test_tls_v1_ignores_grease_and_extension_order():
+    scheme = core.get_id_scheme('tls')
+    reordered = dict(TLS, extensions=[{'name': 'alpn'}, {'name': 'server_name'}], ciphers=['TLS_AES_128_GCM_SHA256'])
+    assert scheme.compute(reordered) == scheme.compute(TLS)
+    assert scheme.compute(dict(TLS, ciphers=['TLS_AES_256_GCM_SHA384'])) != scheme.compute(TLS)
+
+
+def test_registered_version_computed_alongside_primary(browser_v2):
+    assert core.get_id_scheme('browser') is core.get_id_scheme('browser', 1)
+    assert [scheme.name for scheme in core.active_id_schemes()] == ['browser_v1', 'tls_v1', 'browser_v2']
+
+    ids = core.compute_fingerprint_ids(fingerprint(), TLS)
+    assert ids.keys() == {'browser_v1', 'browser_v2', 'tls_v1'}
+    assert ids['browser_v1'] == core.generate_browser_fingerprint_id(fingerprint())
+    assert ids['tls_v1'] == core.generate_tls_fingerprint_id(TLS)
+    # 没有 TLS 数据时不计算 TLS 方案
+    assert core.compute_fingerprint_ids(fingerprint()).keys() == {'browser_v1', 'browser_v2'}
+
+
+def test_extra_versions_limited_by_config(browser_v2, monkeypatch):
+    core.register_id_scheme(core.FingerprintIdScheme('browser', 3))
+    monkeypatch.setattr(core, 'ID_SCHEME_VERSIONS', {'browser_v3'})
+    assert [scheme.name for scheme in core.active_id_schemes()] == ['browser_v1', 'tls_v1', 'browser_v3']
+
+
+def test_primary_version_switch(browser_v2, monkeypatch):
+    monkeypatch.setitem(core.ID_SCHEME_PRIMARY, 'browser', 2)
+    assert core.get_id_scheme('browser') is browser_v2
+    assert core.generate_browser_fingerprint_id(fingerprint()) == browser_v2.compute(fingerprint())
+    assert core.active_id_schemes()[0] is browser_v2
+    with pytest.raises(KeyError):
+        core.get_id_scheme('browser', 9)
+
+
+def test_collect_stores_every_scheme_id(client, browser_v2):
+    response = client.post('/api/collect', json=dict(CLIENT, tls=TLS))
+    assert response.status_code == 200
+    fp_id = response.json['id']
+    assert response.json['ids'].keys() == {'browser_v1', 'browser_v2', 'tls_v1'}
+    with core.get_db() as conn:
+        stored = dict(conn.execute(
+            'SELECT scheme, value FROM fingerprint_ids WHERE fingerprint_id = ?', (fp_id,)
+        ).fetchall())
+    assert stored == response.json['ids']
+    assert stored['browser_v1'] == fp_id
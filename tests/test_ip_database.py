@@ -0,0 +1,92 @@
+"""离线 IP 段数据库：CSV 编译、二分查找的边界、IPv6 与 IPv4 映射地址、加载失败与离线查询"""
+
+import os
+
+import pytest
+
+import app as core
+
+CSV = '''start_ip,end_ip,country,country_code,city,asn,is_proxy,is_datacenter
+1.0.0.0,1.0.0.255,Australia,AU,Sydney,AS13335,,
+8.8.8.0,8.8.8.255,United States,US,Mountain View,AS15169,0,true
+9.9.9.9,9.9.9.9,Switzerland,CH,Zurich,AS19281,yes,1
+223.255.255.0,255.255.255.255,Edge,ED,,,,
+2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,United States,US,Mountain View,AS15169,0,true
+::,::ff,Low,LO,,,,
+'''
+
+
+@pytest.fixture
+def ip_db(tmp_path):
+    csv_path = tmp_path / 'ip.csv'
+    csv_path.write_text(CSV, encoding='utf-8')
+    return core.load_ip_database(str(csv_path))
+
+
+def city(db, ip):
+    record = db.lookup(ip)
+    return record and record['city']
+
+
+def test_compiled_from_csv(ip_db, tmp_path):
+    assert os.path.exists(tmp_path / 'ip.bin')
+    assert ip_db.size == 6
+    # 相同的记录只保存一份
+    assert len(ip_db.records) == 5
+
+
+@pytest.mark.parametrize('ip, expected', [
+    ('1.0.0.0', 'Sydney'),          # 段起始
+    ('1.0.0.255', 'Sydney'),        # 段结束
+    ('1.0.1.0', None),              # 段之后、下一段之前
+    ('0.255.255.255', None),        # 第一段之前
+    ('8.8.8.8', 'Mountain View'),
+    ('9.9.9.8', None),
+    ('9.9.9.9', 'Zurich'),          # 单个地址的段
+    ('9.9.9.10', None),
+    ('255.255.255.255', ''),        # 最后一段的结束地址
+    ('2001:4860:4860::8888', 'Mountain View'),
+    ('2001:4861::', None),
+    ('::', ''),                     # IPv6 的最小地址不与 IPv4 的段混淆
+    ('::ffff:9.9.9.9', 'Zurich'),   # IPv4 映射地址按 IPv4 查询
+    ('not-an-ip', None),
+])
+def test_lookup(ip_db, ip, expected):
+    assert city(ip_db, ip) == expected
+
+
+def test_record_fields(ip_db):
+    record = ip_db.lookup('9.9.9.9')
+    assert record['country_code'] == 'CH'
+    assert record['is_proxy'] is True and record['is_datacenter'] is True and record['is_mobile'] is False
+    assert record['region'] == ''
+
+
+def test_recompiled_when_csv_changes(ip_db, tmp_path):
+    csv_path = tmp_path / 'ip.csv'
+    csv_path.write_text(CSV.replace('Sydney', 'Melbourne'), encoding='utf-8')
+    stat = os.stat(csv_path)
+    os.utime(csv_path, (stat.st_atime, os.path.getmtime(tmp_path / 'ip.bin') + 10))
+    assert city(core.load_ip_database(str(csv_path)), '1.0.0.1') == 'Melbourne'
+
+
+def test_invalid_database(tmp_path):
+    path = tmp_path / 'ip.bin'
+    path.write_bytes(b'x' * 64)
+    assert core.load_ip_database(str(path)) is None
+    assert core.load_ip_database(str(tmp_path / 'missing.csv')) is None
+    assert core.load_ip_database('') is None
+
+
+def test_offline_lookup(ip_db, monkeypatch):
+    monkeypatch.setattr(core, 'ip_database', ip_db)
+    monkeypatch.setattr(core, 'IP_LOOKUP_OFFLINE', True)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError('offline mode must not query ip-api.com')
+    monkeypatch.setattr(core, 'http_get', no_network)
+
+    info = core.lookup_ip_info('9.9.9.9')
+    assert (info['source'], info['city'], info['risk_score'], info['risk_level']) == ('local_db', 'Zurich', 70, '高风险')
+    assert core.lookup_ip_info('8.8.4.4')['type'] == 'unknown'
+    assert core.lookup_ip_info('10.0.0.1')['type'] == 'local'
@@ -0,0 +1,83 @@
+"""IP 信息缓存（过期时间 + LRU、失败结果短期缓存）与本地地址判断"""
+
+import pytest
+
+import app as core
+
+
+def test_ttl_cache_expiry():
+    cache = core.TTLCache(4)
+    cache.set('fresh', 1, 60)
+    cache.set('expired', 2, -1)
+    assert cache.get('fresh') == 1
+    assert cache.get('expired') is None
+    assert cache.get('missing') is None
+    # 过期的条目在读取时删除
+    assert cache.stats() == {'size': 1, 'max_size': 4, 'hits': 1, 'misses': 2, 'hit_rate': 0.3333}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = core.TTLCache(2)
+    cache.set('a', 1, 60)
+    cache.set('b', 2, 60)
+    cache.get('a')
+    cache.set('c', 3, 60)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    # 覆盖已有的键不会挤出其他条目
+    cache.set('a', 4, 60)
+    assert (cache.get('a'), cache.get('c')) == (4, 3)
+
+
+def test_ttl_cache_disabled():
+    cache = core.TTLCache(0)
+    cache.set('a', 1, 60)
+    assert cache.get('a') is None
+    assert cache.stats()['hit_rate'] == 0
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """记录实际查询的 IP；公网地址查询失败"""
+    queried = []
+
+    def lookup(ip):
+        queried.append(ip)
+        if core.is_local_ip(ip):
+            return core.lookup_ip_info_offline(ip)
+        return core.unknown_ip_info(ip)
+    monkeypatch.setattr(core, 'ip_info_cache', core.TTLCache(16))
+    monkeypatch.setattr(core, 'lookup_ip_info', lookup)
+    return queried
+
+
+def test_get_ip_info_cached(lookups):
+    assert core.get_ip_info('10.0.0.1')['type'] == 'local'
+    assert core.get_ip_info('10.0.0.1')['type'] == 'local'
+    assert lookups == ['10.0.0.1']
+
+
+def test_failed_lookup_cached_briefly(monkeypatch, lookups):
+    assert core.get_ip_info('8.8.4.4')['type'] == 'unknown'
+    assert core.get_ip_info('8.8.4.4')['type'] == 'unknown'
+    assert lookups == ['8.8.4.4']
+
+    # 失败结果按 IP_INFO_NEGATIVE_TTL 过期，成功结果不受影响
+    monkeypatch.setattr(core, 'IP_INFO_NEGATIVE_TTL', -1)
+    core.get_ip_info('9.9.9.9')
+    core.get_ip_info('9.9.9.9')
+    core.get_ip_info('10.0.0.2')
+    core.get_ip_info('10.0.0.2')
+    assert lookups[1:] == ['9.9.9.9', '9.9.9.9', '10.0.0.2']
+
+
+@pytest.mark.parametrize('ip', [
+    'localhost', '127.0.0.1', '10.1.2.3', '172.16.0.1', '192.168.1.1', '169.254.0.1', '100.64.0.1',
+    '0.0.0.0', '::1', 'fe80::1', 'fd00::1', '::ffff:192.168.1.1',
+])
+def test_local_ips(ip):
+    assert core.is_local_ip(ip)
+
+
+@pytest.mark.parametrize('ip', ['8.8.8.8', '1.1.1.1', '2606:4700:4700::1111', '::ffff:8.8.8.8', 'example.com', ''])
+def test_public_or_invalid_ips(ip):
+    assert not core.is_local_ip(ip)
@@ -0,0 +1,161 @@
+"""JSON 编解码：orjson / msgspec / 标准库三种实现的解析结果与标准库一致，编码结果等价"""
+
+import datetime
+import json
+import math
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+import app as core
+
+DOCUMENTS = [
+    '{"a": 1, "b": [true, false, null], "c": {"d": "e"}}',
+    '{"text": "宋体 \\u00e9 \\n \\"quoted\\" \\ud83d\\ude00", "empty": ""}',
+    '[0, -1, 1.5, -0.0, 0.1, 1e-7, 1E+2, 12345678901234567]',
+    # 超过 64 位的整数（orjson 解析为浮点数，需回退到标准库）
+    '{"big": 123456789012345678901234567890, "neg": -18446744073709551616, "max": 18446744073709551615}',
+    '[NaN, Infinity, -Infinity, 1e400]',
+    '"\\ud800 lone surrogate"',
+    '"plain"', '42', 'null', '[]', '{}',
+    ' \n {"padded": true} \t',
+]
+
+
+def codecs():
+    for name in core.JsonCodec.NAMES:
+        module = getattr(core, name, json)
+        yield pytest.param(name, marks=pytest.mark.skipif(module is None, reason=f'{name} is not installed'))
+
+
+@pytest.fixture(params=list(codecs()))
+def codec(request):
+    return core.JsonCodec(request.param)
+
+
+def canonical(value):
+    """可比较的形式：NaN 不等于自身，按标准库的输出比较（同时区分整数与浮点数）"""
+    return json.dumps(value, sort_keys=True)
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_loads_matches_standard_library(codec, document):
+    expected = canonical(json.loads(document))
+    assert canonical(codec.loads(document)) == expected
+    assert canonical(codec.loads(document.encode('utf-8', 'surrogatepass'))) == expected
+
+
+def test_loads_keeps_big_integers_exact(codec):
+    value = codec.loads('[123456789012345678901234567890, 9007199254740993]')
+    assert value == [123456789012345678901234567890, 9007199254740993]
+    assert all(type(item) is int for item in value)
+
+
+@pytest.mark.parametrize('document', ['', '{', '[1,]', '{"a" 1}', "{'a': 1}", 'nul', b'\xff\xfe'])
+def test_loads_invalid(codec, document):
+    with pytest.raises(ValueError):
+        codec.loads(document)
+
+
+@pytest.mark.parametrize('obj', [
+    {'a': [1, 2.5, None, True], 'b': {'c': '宋体'}},
+    {'big': 2 ** 70, 'neg': -(2 ** 64)},
+    {1: 'int key', 'text': 'x'},
+    ['\ud800 lone surrogate'],
+    [],
+    'plain',
+])
+def test_dumps_round_trip(codec, obj):
+    expected = json.loads(json.dumps(obj))
+    assert json.loads(codec.dumps(obj)) == expected
+    assert json.loads(codec.dumps_bytes(obj)) == expected
+    assert isinstance(codec.dumps(obj), str) and isinstance(codec.dumps_bytes(obj), bytes)
+
+
+def test_non_finite_floats_written_back(codec):
+    # 解析出的 NaN/Infinity 原样写回（快速实现会编码为 null，重新计算的指纹 ID 将会改变）
+    value = codec.loads('{"a": [NaN, Infinity, -Infinity, 1e400, 1.5]}')
+    assert math.isnan(value['a'][0])
+    assert codec.dumps(value).replace(' ', '') == '{"a":[NaN,Infinity,-Infinity,Infinity,1.5]}'
+
+
+def test_encoder_sort_keys_and_default(codec):
+    # 日期时间交给 default 处理（与 json.dumps 一致，不使用快速实现自带的 ISO 格式）
+    obj = {'b': 1, 'a': {'d': datetime.datetime(2024, 1, 2, 3, 4), 'e': datetime.date(2024, 1, 2), 'c': 2}}
+    default = lambda value: f'<{value}>'  # noqa: E731
+    encoded = codec.encoder(sort_keys=True, default=default)(obj)
+    assert list(json.loads(encoded)) == ['a', 'b']
+    assert list(json.loads(encoded)['a']) == ['c', 'd', 'e']
+    assert json.loads(encoded) == json.loads(json.dumps(obj, default=default))
+    with pytest.raises(TypeError):
+        codec.dumps({'a': object()})
+
+
+def test_loads_object(codec):
+    assert codec.loads_object(b'{"a": [1, {"b": null}]}') == {'a': [1, {'b': None}]}
+    assert canonical(codec.loads_object('{"n": 1e400, "big": 123456789012345678901234567890}')) == \
+        canonical({'n': math.inf, 'big': 123456789012345678901234567890})
+
+
+@pytest.mark.parametrize('document, kind', [('[1]', 'list'), ('1', 'int'), ('null', 'NoneType'), ('"s"', 'str')])
+def test_loads_object_rejects_non_objects(codec, document, kind):
+    with pytest.raises(ValueError, match=f'Expected a JSON object, got {kind}$'):
+        codec.loads_object(document)
+
+
+@pytest.mark.parametrize('document', ['', '{', '{"a": }', b'\xff'])
+def test_loads_object_invalid(codec, document):
+    with pytest.raises(ValueError):
+        codec.loads_object(document)
+
+
+def test_codec_selection(monkeypatch):
+    assert core.JsonCodec('json').name == 'json'
+    with pytest.raises(RuntimeError, match='JSON_CODEC must be one of'):
+        core.JsonCodec('simplejson')
+    monkeypatch.setattr(core, 'orjson', None)
+    with pytest.raises(RuntimeError, match='requires the orjson package'):
+        core.JsonCodec('orjson')
+    monkeypatch.setattr(core, 'msgspec', None)
+    assert core.JsonCodec('auto').name == 'json'
+
+
+@pytest.fixture
+def provider(codec, monkeypatch):
+    """只有快速实现会替换 Flask 的默认实现"""
+    if codec.name == 'json':
+        pytest.skip('the standard library codec keeps the default provider')
+    monkeypatch.setattr(core, 'json_codec', codec)
+    return core.CodecJSONProvider(core.app)
+
+
+RESPONSE = {'z': [1, 2.5, None], 'a': {'date': datetime.date(2024, 1, 2), 'text': '宋体'}}
+
+
+def test_provider_compact_output(provider):
+    # 与默认实现的紧凑输出等价（键排序），可能不转义非 ASCII 字符
+    expected = DefaultJSONProvider(core.app).dumps(RESPONSE, **core.CodecJSONProvider.COMPACT_ARGS)
+    output = provider.dumps(RESPONSE, **core.CodecJSONProvider.COMPACT_ARGS)
+    assert json.loads(output) == json.loads(expected)
+    assert list(json.loads(output)) == ['a', 'z']
+    compact = [json.dumps(json.loads(output), separators=(',', ':'), ensure_ascii=ascii) for ascii in (True, False)]
+    assert output in compact
+    assert provider.dumps(RESPONSE) == output
+
+
+def test_provider_other_args_use_default(provider):
+    # 调试模式的缩进输出等与默认实现逐字节相同
+    default = DefaultJSONProvider(core.app)
+    assert provider.dumps(RESPONSE, indent=2) == default.dumps(RESPONSE, indent=2)
+
+
+def test_provider_loads(provider):
+    assert provider.loads('{"big": 123456789012345678901234567890}') == {'big': 123456789012345678901234567890}
+    assert provider.loads('{"a": 1.5}', parse_float=str) == {'a': '1.5'}
+
+
+def test_provider_response(provider):
+    with core.app.app_context():
+        response = provider.response(RESPONSE)
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['a'] == {'date': 'Tue, 02 Jan 2024 00:00:00 GMT', 'text': '宋体'}
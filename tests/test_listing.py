@@ -0,0 +1,80 @@
+"""指纹列表的游标分页、过滤与取值统计"""
+
+import pytest
+
+import app as core
+
+
+def test_cursor_round_trip():
+    cursor = core.encode_cursor('2026-01-02 03:04:05', 'fp001')
+    assert core.decode_cursor(cursor) == ('2026-01-02 03:04:05', 'fp001')
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', core.encode_cursor('x', 'y')[:-3], '!!!'])
+def test_invalid_cursor(client, cursor):
+    with pytest.raises(ValueError):
+        core.decode_cursor(cursor)
+    assert client.get(f'/api/fingerprints?cursor={cursor}').status_code == 400
+
+
+def test_pages_cover_every_row_once(client, save_fingerprints):
+    # 相同的 created_at 由 id 决定顺序，翻页时不会重复或遗漏
+    ids = save_fingerprints(7, created_at=lambda index: f'2026-01-01 00:00:0{index // 3}')
+    seen = []
+    cursor = None
+    while True:
+        query = {'limit': 3, 'fields': 'summary'}
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/fingerprints', query_string=query)
+        assert response.status_code == 200
+        seen += [item['id'] for item in response.json['fingerprints']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert seen == ids[::-1]
+
+
+def test_filters(client, save_fingerprints):
+    save_fingerprints(4, client=lambda index: {
+        'navigator': {'platform': 'Win32' if index % 2 else 'Linux x86_64'},
+        'automation': {'score': index / 10},
+    })
+
+    def listed(**query):
+        response = client.get('/api/fingerprints', query_string=dict(query, fields='id', count='exact'))
+        assert response.status_code == 200
+        assert response.json['count'] == 4
+        assert response.json['matched'] == len(response.json['fingerprints'])
+        return sorted(item['id'] for item in response.json['fingerprints'])
+
+    assert listed(platform='Win32') == ['fp001', 'fp003']
+    assert listed(platform='Win32', min_automation_score=0.2) == ['fp003']
+    assert listed(max_automation_score=0.1) == ['fp000', 'fp001']
+    assert listed(ip='10.0.0.2') == []
+
+
+def test_ua_filter_escapes_wildcards(client):
+    for fp_id, user_agent in (('plain', 'Mozilla 100'), ('percent', 'Mozilla 100%')):
+        core.save_fingerprint(fp_id, {'client': {}, 'server': {'ip': '10.0.0.1', 'user_agent': user_agent}})
+    response = client.get('/api/fingerprints', query_string={'ua': '100%', 'fields': 'id'})
+    assert [item['id'] for item in response.json['fingerprints']] == ['percent']
+
+
+@pytest.mark.parametrize('query', [{'unknown': 'x'}, {'fields': 'id,data'}, {'limit': 'many'}])
+def test_invalid_query(client, query):
+    assert client.get('/api/fingerprints', query_string=query).status_code == 400
+
+
+def test_analytics(client, save_fingerprints):
+    save_fingerprints(3, client=lambda index: {'navigator': {'platform': 'Win32' if index else 'MacIntel'}})
+    response = client.get('/api/analytics/platform')
+    assert response.json['total'] == 3
+    assert response.json['values'] == [{'value': 'Win32', 'count': 2}, {'value': 'MacIntel', 'count': 1}]
+    assert client.get('/api/analytics/platform?limit=1').json['values'] == [{'value': 'Win32', 'count': 2}]
+
+
+@pytest.mark.parametrize('path', ['/api/analytics/platform?limit=0', '/api/analytics/platform?limit=-1',
+                                  '/api/analytics/data'])
+def test_analytics_invalid(client, path):
+    assert client.get(path).status_code == 400
@@ -0,0 +1,77 @@
+"""指纹数据的压缩存储：各算法与字典的编解码往返，切换算法或字典后旧数据仍可读取"""
+
+import json
+
+import pytest
+
+import app as core
+
+FINGERPRINT = {
+    'client': {'webgl': {'extensions': [f'WEBGL_ext_{index}' for index in range(40)]}, 'fonts': ['Arial', '宋体']},
+    'server': {'ip': '10.0.0.1', 'headers': {'accept-language': 'zh-CN,zh;q=0.9'}},
+}
+METHODS = ['', 'zlib', 'zstd']
+
+
+def make_codec(method, dictionary, tmp_path):
+    if method == 'zstd':
+        pytest.importorskip('zstandard')
+    dict_path = ''
+    if dictionary:
+        path = tmp_path / f'{dictionary}.dict'
+        path.write_bytes(json.dumps(FINGERPRINT).encode() * 4 + dictionary.encode())
+        dict_path = str(path)
+    return core.PayloadCodec(method, 0, dict_path)
+
+
+@pytest.mark.parametrize('dictionary', ['', 'dict-a'])
+@pytest.mark.parametrize('method', METHODS)
+def test_round_trip(tmp_path, method, dictionary):
+    codec = make_codec(method, dictionary, tmp_path)
+    text = json.dumps(FINGERPRINT, ensure_ascii=False)
+    encoded = codec.encode(text)
+    if method:
+        assert isinstance(encoded, bytes) and encoded[:2] == core.PayloadCodec.MAGIC + codec.METHODS[method]
+        assert len(encoded) < len(text.encode())
+    else:
+        assert encoded == text
+    assert codec.decode(encoded) == text
+    assert codec.loads(encoded) == FINGERPRINT
+
+
+@pytest.mark.parametrize('read_method', METHODS)
+@pytest.mark.parametrize('write_method, write_dictionary', [
+    ('', ''), ('zlib', ''), ('zlib', 'dict-a'), ('zstd', ''), ('zstd', 'dict-a'),
+])
+def test_old_data_readable_after_switch(tmp_path, write_method, write_dictionary, read_method):
+    """读取按数据头部识别算法与字典：换用其他算法或字典后，之前写入的数据仍可读取"""
+    writer = make_codec(write_method, write_dictionary, tmp_path)
+    reader = make_codec(read_method, 'dict-b' if read_method else '', tmp_path)
+    with core.get_db() as conn:
+        writer.store_dictionary(conn)
+        conn.commit()
+    text = json.dumps(FINGERPRINT)
+    assert reader.decode(writer.encode(text)) == text
+
+
+def test_missing_dictionary(tmp_path):
+    encoded = make_codec('zlib', 'dict-a', tmp_path).encode('{}')
+    with pytest.raises(ValueError, match='not found'):
+        core.PayloadCodec('zlib').decode(encoded)
+
+
+def test_invalid_method():
+    with pytest.raises(ValueError):
+        core.PayloadCodec('lz4')
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_save_and_load_fingerprint(tmp_path, monkeypatch, method):
+    codec = make_codec(method, 'dict-a' if method else '', tmp_path)
+    monkeypatch.setattr(core, 'payload_codec', codec)
+    core.init_db()
+    core.save_fingerprint('fp1', FINGERPRINT)
+    with core.get_db() as conn:
+        stored = conn.execute("SELECT data FROM fingerprints WHERE id = 'fp1'").fetchone()[0]
+    assert isinstance(stored, bytes if method else str)
+    assert core.get_fingerprint('fp1') == FINGERPRINT
@@ -0,0 +1,167 @@
+"""TLS 服务本地 IPC 客户端：用 Python 实现的 TLS 服务替身测试 ping、查询与断线重连"""
+
+import asyncio
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import pytest
+
+import app as core
+
+TLS_FINGERPRINT = {'tls': {'ja4': 't13d1516h2_8daaf6152771_b0da82dd1658', 'ja3_hash': 'ipc'}}
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix domain socket is not available')
+
+
+class FakeSidecar:
+    """
+    TLS 服务 IPC 的替身，帧格式与响应和 tls-server/ipc.go 一致
+    store 为 IP -> 指纹；drop_connections() 关闭已建立的连接，restart() 重新监听同一路径
+    """
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self.connections = set()
+        self.accepted = 0
+        self.server = None
+        self.start()
+
+    def handle_request(self, request):
+        op = request.get('op')
+        if op == 'ping':
+            return {'success': True}
+        if op == 'fingerprint':
+            fingerprint = self.store.get(request.get('ip'))
+            if fingerprint is None:
+                return {'success': False, 'error': 'No fingerprint found'}
+            return {'success': True, 'client_ip': request['ip'], 'fingerprint': fingerprint}
+        return {'success': False, 'error': 'unknown op'}
+
+    def serve_connection(self, conn):
+        self.accepted += 1
+        self.connections.add(conn)
+        reader = conn.makefile('rb')
+        try:
+            while True:
+                header = reader.read(4)
+                if len(header) < 4:
+                    return
+                size, = struct.unpack('>I', header)
+                body = json.dumps(self.handle_request(json.loads(reader.read(size)))).encode()
+                conn.sendall(struct.pack('>I', len(body)) + body)
+        except OSError:
+            pass
+        finally:
+            reader.close()
+            self.connections.discard(conn)
+
+    def start(self):
+        sidecar = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sidecar.serve_connection(self.request)
+
+        self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def drop_connections(self):
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        self.drop_connections()
+        os.remove(self.path)
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+
+@pytest.fixture
+def sidecar(tmp_path):
+    server = FakeSidecar(str(tmp_path / 'tls.sock'), {'198.51.100.1': TLS_FINGERPRINT})
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ipc_client(sidecar):
+    return core.TLSSidecarClient(sidecar.path, 2)
+
+
+def test_ping(ipc_client):
+    assert ipc_client.ping() == {'success': True}
+
+
+def test_query_fingerprint(ipc_client):
+    assert ipc_client.query_fingerprint('198.51.100.1') == {
+        'success': True, 'client_ip': '198.51.100.1', 'fingerprint': TLS_FINGERPRINT,
+    }
+    assert ipc_client.query_fingerprint('198.51.100.2') == {'success': False, 'error': 'No fingerprint found'}
+    assert ipc_client.request({'op': 'stats'}) == {'success': False, 'error': 'unknown op'}
+
+
+def test_connection_reused(ipc_client, sidecar):
+    for _ in range(3):
+        assert ipc_client.ping()['success']
+    assert sidecar.accepted == 1
+
+
+def test_reconnects_after_connection_dropped(ipc_client, sidecar):
+    """空闲连接被对端关闭后，下一次请求换新连接重试，不向调用方报错"""
+    assert ipc_client.ping()['success']
+    sidecar.drop_connections()
+    assert ipc_client.query_fingerprint('198.51.100.1')['fingerprint'] == TLS_FINGERPRINT
+    assert sidecar.accepted == 2
+
+
+def test_reconnects_after_restart(ipc_client, sidecar):
+    assert ipc_client.ping()['success']
+    sidecar.restart()
+    assert ipc_client.ping()['success']
+
+
+def test_sidecar_not_running(ipc_client, sidecar):
+    sidecar.stop()
+    with pytest.raises(OSError):
+        ipc_client.ping()
+
+
+def test_lookup_enrichment_through_ipc(monkeypatch, ipc_client):
+    monkeypatch.setattr(core, 'tls_ipc_client', ipc_client)
+    assert core.lookup_tls_enrichment('198.51.100.1') == TLS_FINGERPRINT
+    assert core.lookup_tls_enrichment('198.51.100.2') is None
+
+
+def test_async_client(sidecar):
+    asgi = pytest.importorskip('asgi')
+    ipc_client = asgi.AsyncTLSSidecarClient(sidecar.path, 2)
+
+    async def run():
+        assert (await ipc_client.query_fingerprint('198.51.100.1'))['fingerprint'] == TLS_FINGERPRINT
+        assert not (await ipc_client.query_fingerprint('198.51.100.2'))['success']
+        sidecar.drop_connections()
+        assert (await ipc_client.query_fingerprint('198.51.100.1'))['fingerprint'] == TLS_FINGERPRINT
+        sidecar.restart()
+        assert (await ipc_client.request({'op': 'ping'})) == {'success': True}
+        sidecar.stop()
+        with pytest.raises(OSError):
+            await ipc_client.request({'op': 'ping'})
+        sidecar.start()
+
+    asyncio.run(run())
@@ -0,0 +1,158 @@
+package main
+
+import (
+	"bufio"
+	"encoding/binary"
+	"encoding/json"
+	"fmt"
+	"io"
+	"log"
+	"net"
+	"os"
+	"path/filepath"
+	"strconv"
+)
+
+// 本地 IPC 通道（Unix domain socket）
+// Flask 通过它按客户端 IP 查询指纹，省去回环 TLS 握手和 HTTP 解析
+// 帧格式: 4 字节大端长度 + JSON，同一连接上可连续请求
+//   请求: {"op": "fingerprint", "ip": "1.2.3.4"} 或 {"op": "ping"}
+//   响应: {"success": true, "client_ip": "1.2.3.4", "fingerprint": {...}}
+
+const maxIPCFrameSize = 1 << 20
+
+type ipcRequest struct {
+	Op string `json:"op"`
+	IP string `json:"ip"`
+}
+
+// StartIPCServer 在指定路径监听 Unix socket
+// 通过 socket 可以查询访客的指纹，只允许运行 Flask 的用户访问：
+// socket 权限为 0600，所在目录不存在时以 0700 创建；sudo 启动时两者都交给调用 sudo 的用户
+func StartIPCServer(path string) error {
+	dir := filepath.Dir(path)
+	if _, err := os.Stat(dir); os.IsNotExist(err) {
+		if err := os.MkdirAll(dir, 0700); err != nil {
+			return err
+		}
+		if err := chownToSudoUser(dir); err != nil {
+			return err
+		}
+	}
+	// 只删除上次遗留的 socket；路径是普通文件或符号链接时拒绝启动，不跟随链接删除
+	if info, err := os.Lstat(path); err == nil {
+		if info.Mode()&os.ModeSocket == 0 {
+			return fmt.Errorf("%s exists and is not a socket", path)
+		}
+		if err := os.Remove(path); err != nil {
+			return err
+		}
+	}
+	listener, err := net.Listen("unix", path)
+	if err != nil {
+		return err
+	}
+	if err := os.Chmod(path, 0600); err != nil {
+		listener.Close()
+		return err
+	}
+	if err := chownToSudoUser(path); err != nil {
+		listener.Close()
+		return err
+	}
+
+	go func() {
+		for {
+			conn, err := listener.Accept()
+			if err != nil {
+				log.Printf("IPC accept error: %v", err)
+				return
+			}
+			go handleIPCConnection(conn)
+		}
+	}()
+	return nil
+}
+
+// chownToSudoUser 经 sudo 启动时（TCP 指纹采集需要 root）把文件交给调用 sudo 的用户
+func chownToSudoUser(path string) error {
+	uidText, gidText := os.Getenv("SUDO_UID"), os.Getenv("SUDO_GID")
+	if uidText == "" || os.Geteuid() != 0 {
+		return nil
+	}
+	uid, err := strconv.Atoi(uidText)
+	if err != nil {
+		return fmt.Errorf("invalid SUDO_UID %q", uidText)
+	}
+	gid := -1
+	if gidText != "" {
+		if gid, err = strconv.Atoi(gidText); err != nil {
+			return fmt.Errorf("invalid SUDO_GID %q", gidText)
+		}
+	}
+	return os.Chown(path, uid, gid)
+}
+
+func handleIPCConnection(conn net.Conn) {
+	defer conn.Close()
+
+	reader := bufio.NewReader(conn)
+	header := make([]byte, 4)
+	for {
+		if _, err := io.ReadFull(reader, header); err != nil {
+			return
+		}
+		size := binary.BigEndian.Uint32(header)
+		if size > maxIPCFrameSize {
+			log.Printf("IPC frame too large: %d bytes", size)
+			return
+		}
+		payload := make([]byte, size)
+		if _, err := io.ReadFull(reader, payload); err != nil {
+			return
+		}
+
+		var result interface{}
+		var req ipcRequest
+		if err := json.Unmarshal(payload, &req); err != nil {
+			result = map[string]interface{}{"success": false, "error": "invalid request"}
+		} else {
+			result = handleIPCRequest(&req)
+		}
+
+		body, _ := json.Marshal(result)
+		frame := make([]byte, 4+len(body))
+		binary.BigEndian.PutUint32(frame, uint32(len(body)))
+		copy(frame[4:], body)
+		if _, err := conn.Write(frame); err != nil {
+			return
+		}
+	}
+}
+
+func handleIPCRequest(req *ipcRequest) interface{} {
+	switch req.Op {
+	case "ping":
+		return map[string]interface{}{"success": true}
+
+	case "fingerprint":
+		storeMutex.RLock()
+		fp := fingerprintStore[req.IP]
+		storeMutex.RUnlock()
+
+		if fp == nil {
+			return map[string]interface{}{
+				"success": false,
+				"error":   "No fingerprint found",
+			}
+		}
+		return map[string]interface{}{
+			"success":     true,
+			"client_ip":   req.IP,
+			"fingerprint": fp,
+		}
+
+	default:
+		return map[string]interface{}{"success": false, "error": "unknown op"}
+	}
+}
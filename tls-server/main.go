@@ -158,6 +158,8 @@ func main() {
 	host := flag.String("host", "0.0.0.0", "监听地址")
 	iface := flag.String("iface", "", "网络接口名称 (如 en0, eth0)，留空自动检测")
 	disableTCP := flag.Bool("disable-tcp", false, "禁用 TCP/IP 指纹采集")
+	ipcSocket := flag.String("ipc-socket", "", "本地 IPC Unix socket 路径，留空不启用")
+	stream := flag.Bool("stream", false, "将采集到的指纹以 NDJSON 推送到 stdout")
 	flag.Parse()
 
 	// Initialize fingerprint database
@@ -181,6 +183,20 @@ func main() {
 		}
 	}
 
+	// Start fingerprint stream on stdout
+	if *stream {
+		StartFingerprintStream()
+	}
+
+	// Start local IPC channel for the Flask app
+	if *ipcSocket != "" {
+		if err := StartIPCServer(*ipcSocket); err != nil {
+			log.Printf("[WARNING] IPC socket disabled: %v", err)
+		} else {
+			log.Printf("IPC socket listening on %s", *ipcSocket)
+		}
+	}
+
 	// Start raw TCP listener to capture ClientHello
 	addr := fmt.Sprintf("%s:%d", *host, *port)
 	listener, err := net.Listen("tcp", addr)
@@ -282,6 +298,7 @@ func handleConnection(conn net.Conn, cert *tls.Certificate) {
 		host, _, _ := net.SplitHostPort(remoteAddr)
 		fingerprintStore[host] = combined
 		storeMutex.Unlock()
+		publishFingerprint(host, combined)
 
 		// Handle HTTP/1.1
 		handleHTTP(tlsConn, remoteAddr)
@@ -347,6 +364,7 @@ func handleHTTP2(conn net.Conn, remoteAddr string, combined *CombinedFingerprint
 	host, _, _ := net.SplitHostPort(remoteAddr)
 	fingerprintStore[host] = combined
 	storeMutex.Unlock()
+	publishFingerprint(host, combined)
 
 	// Now we need to respond as an HTTP/2 server
 	// Send SETTINGS frame (server settings)
@@ -967,24 +985,33 @@ func buildJA4R(clientVersion uint16, supportedVersions []uint16, sni string, cip
 	return prefix + "_" + cipherPart + "_" + extPart + "_" + sigPart
 }
 
+// handleHTTP 处理 HTTP/1.1 连接，支持 keep-alive（同一连接上循环处理请求，空闲超时后关闭）
 func handleHTTP(conn net.Conn, remoteAddr string) {
 	defer conn.Close()
 
 	buf := make([]byte, 8192)
-	n, err := conn.Read(buf)
-	if err != nil {
-		return
+	for {
+		conn.SetDeadline(time.Now().Add(30 * time.Second))
+		n, err := conn.Read(buf)
+		if err != nil {
+			return
+		}
+		if !serveHTTPRequest(conn, remoteAddr, string(buf[:n])) {
+			return
+		}
 	}
+}
 
-	request := string(buf[:n])
+// serveHTTPRequest 处理单个请求，返回是否保持连接
+func serveHTTPRequest(conn net.Conn, remoteAddr string, request string) bool {
 	lines := strings.Split(request, "\r\n")
 	if len(lines) == 0 {
-		return
+		return false
 	}
 
 	parts := strings.Split(lines[0], " ")
 	if len(parts) < 2 {
-		return
+		return false
 	}
 
 	fullPath := parts[1]
@@ -993,12 +1020,15 @@ func handleHTTP(conn net.Conn, remoteAddr string) {
 		path = path[:idx] // 去掉查询参数用于路由匹配
 	}
 
-	// Extract User-Agent header
+	// Extract User-Agent / Connection header
 	userAgent := ""
+	keepAlive := !strings.HasSuffix(lines[0], "HTTP/1.0")
 	for _, line := range lines {
-		if strings.HasPrefix(strings.ToLower(line), "user-agent:") {
+		lower := strings.ToLower(line)
+		if strings.HasPrefix(lower, "user-agent:") {
 			userAgent = strings.TrimSpace(line[11:])
-			break
+		} else if strings.HasPrefix(lower, "connection:") {
+			keepAlive = strings.Contains(lower, "keep-alive") || (keepAlive && !strings.Contains(lower, "close"))
 		}
 	}
 
@@ -1111,6 +1141,7 @@ func handleHTTP(conn net.Conn, remoteAddr string) {
 
 	conn.Write([]byte(response))
 	conn.Write(body)
+	return keepAlive
 }
 
 // Helper functions
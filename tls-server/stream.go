@@ -0,0 +1,63 @@
+package main
+
+import (
+	"bufio"
+	"encoding/json"
+	"log"
+	"os"
+	"time"
+)
+
+// 指纹推送流
+// 开启 -stream 后，每个采集到的指纹以 NDJSON 一行一条写到 stdout，供父进程（Flask）订阅
+// 日志仍写 stderr，与数据流分开
+//   {"type": "fingerprint", "ip": "1.2.3.4", "ts": 1700000000, "fingerprint": {"tls": ..., "http2": ..., "tcp": ...}}
+
+const streamBufferSize = 1024
+
+type streamRecord struct {
+	Type        string               `json:"type"`
+	IP          string               `json:"ip"`
+	Timestamp   int64                `json:"ts"`
+	Fingerprint *CombinedFingerprint `json:"fingerprint"`
+}
+
+var streamChan chan []byte
+
+// StartFingerprintStream 启动写 stdout 的后台 goroutine
+func StartFingerprintStream() {
+	streamChan = make(chan []byte, streamBufferSize)
+	go func() {
+		writer := bufio.NewWriter(os.Stdout)
+		for line := range streamChan {
+			writer.Write(line)
+			// 缓冲区中没有待写数据时立即刷新，保证实时性
+			if len(streamChan) == 0 {
+				if err := writer.Flush(); err != nil {
+					log.Printf("Fingerprint stream write error: %v", err)
+				}
+			}
+		}
+	}()
+}
+
+// publishFingerprint 推送一条指纹记录；读取方跟不上时丢弃，不阻塞连接处理
+func publishFingerprint(ip string, fp *CombinedFingerprint) {
+	if streamChan == nil {
+		return
+	}
+	line, err := json.Marshal(streamRecord{
+		Type:        "fingerprint",
+		IP:          ip,
+		Timestamp:   time.Now().Unix(),
+		Fingerprint: fp,
+	})
+	if err != nil {
+		return
+	}
+	select {
+	case streamChan <- append(line, '\n'):
+	default:
+		log.Printf("Fingerprint stream buffer full, dropping record for %s", ip)
+	}
+}
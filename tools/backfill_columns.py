@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+为已有指纹回填热点字段列（FINGERPRINT_COLUMNS）
+
+用法: python tools/backfill_columns.py [--batch-size 1000]
+
+新增列由 init_db 自动创建，本脚本只负责回填旧数据；
+按批提交，只处理 columns_version 落后的行，中断后重新运行即可继续。
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='回填指纹热点字段列')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批行数（每批一个事务）')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+
+    def progress(total, last_rowid):
+        elapsed = time.monotonic() - started
+        print(f'[INFO] {total} rows backfilled (rowid {last_rowid}), {total / elapsed if elapsed else 0:.0f} rows/s')
+
+    total = app.backfill_fingerprint_columns(args.batch_size, progress)
+    print(f'[INFO] Done: {total} rows in {time.monotonic() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
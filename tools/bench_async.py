@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+同步（gthread）与异步（asgi.py + UvicornWorker）服务的并发压测对比
+
+用法: python tools/bench_async.py [--endpoint tls|collect] [--latency 50] [-c 200] [-n 2000]
+
+启动一个模拟的 TLS 服务 IPC socket（每次查询固定延迟 --latency 毫秒），
+分别以单个 gthread worker 和单个 UvicornWorker 启动服务，在同样的并发下请求
+/api/tls 或 /api/collect（每个请求使用不同的 X-Forwarded-For），输出吞吐量与延迟分位数。
+注意: collect 会写入当前数据库，请在测试环境中运行。
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = (
+    ('sync (gthread)', 'gthread', 'app:app'),
+    ('async (uvicorn)', 'uvicorn.workers.UvicornWorker', 'asgi:app'),
+)
+
+
+def run_fake_sidecar(path, latency):
+    """模拟 TLS 服务的 IPC 接口：长度前缀 JSON 帧，每次查询延迟 latency 秒"""
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            conn = self.request
+            while True:
+                header = conn.recv(4, socket.MSG_WAITALL)
+                if len(header) < 4:
+                    return
+                size, = struct.unpack('>I', header)
+                request = json.loads(conn.recv(size, socket.MSG_WAITALL))
+                time.sleep(latency)
+                body = json.dumps({
+                    'success': True,
+                    'client_ip': request.get('ip'),
+                    'fingerprint': {'tls': {'ja4': 't13d1516h2_8daaf6152771_b0da82dd1658', 'ja3_hash': 'bench'}},
+                }).encode()
+                conn.sendall(struct.pack('>I', len(body)) + body)
+
+    class Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    if os.path.exists(path):
+        os.remove(path)
+    with Server(path, Handler) as server:
+        server.serve_forever()
+
+
+def sample_payload(index):
+    """collect 请求体：包含设备信号，不含 tls（服务端通过 IPC 查询）"""
+    return {
+        'userAgent': 'bench',
+        'canvas': f'canvas-{index % 50}',
+        'deviceId': {
+            'coreId': f'bench-{index % 50}',
+            'audio': '124.04347527516074',
+            'canvasGeometry': f'geometry-{index % 50}',
+            'webglRenderer': 'ANGLE (Bench)',
+            'math': 'bench',
+        },
+    }
+
+
+def start_server(worker_class, target, port, args, env):
+    cmd = [
+        sys.executable, '-m', 'gunicorn', target,
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', '1',
+        '--worker-class', worker_class,
+        '--threads', str(args.threads),
+        '--backlog', '4096',
+        '--log-level', 'warning',
+        '--chdir', ROOT,
+    ]
+    # 在临时目录中启动，不加载 gunicorn.conf.py（不启动 TLS 服务，由模拟的 IPC socket 代替）
+    process = subprocess.Popen(cmd, cwd=tempfile.gettempdir(), env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/api/config', timeout=1)
+            return process
+        except httpx.HTTPError:
+            if process.poll() is not None:
+                raise SystemExit(f'[ERROR] Server exited with code {process.returncode}')
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('[ERROR] Server did not start within 30s')
+
+
+async def send_request(reader, writer, method, path, headers, body=b''):
+    """在 keep-alive 连接上发送一个 HTTP/1.1 请求，返回 (状态码, 响应体)"""
+    lines = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', f'Content-Length: {len(body)}']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def run_load(port, args):
+    """
+    --concurrency 个连接并发请求，共 --requests 个，返回 (耗时, 各请求延迟, 错误数)
+    压测客户端直接使用 asyncio 流（httpx 等客户端在高并发下自身开销过大，会成为瓶颈）
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal errors
+        reader = writer = None
+        for index in counter:
+            headers = {'X-Forwarded-For': f'10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}'}
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                if args.endpoint == 'collect':
+                    headers['Content-Type'] = 'application/json'
+                    status, body = await send_request(reader, writer, 'POST', '/api/collect', headers,
+                                                      json.dumps(sample_payload(index)).encode())
+                else:
+                    status, body = await send_request(reader, writer, 'GET', '/api/tls', headers)
+                if status != 200 or not json.loads(body).get('success'):
+                    errors += 1
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+            latencies.append(time.perf_counter() - started)
+        if writer is not None:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return time.perf_counter() - started, latencies, errors
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步/异步服务并发压测对比')
+    parser.add_argument('--endpoint', choices=('tls', 'collect'), default='tls', help='压测的接口')
+    parser.add_argument('--latency', type=float, default=50, help='模拟 TLS 服务每次查询的延迟（毫秒）')
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help='并发请求数')
+    parser.add_argument('-n', '--requests', type=int, default=2000, help='每个服务的请求总数')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('GUNICORN_THREADS', 4)),
+                        help='同步 worker 的线程数')
+    parser.add_argument('--port', type=int, default=5099, help='服务监听端口')
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='bench-async-'), 'tls.sock')
+    sidecar = multiprocessing.Process(target=run_fake_sidecar, args=(socket_path, args.latency / 1000), daemon=True)
+    sidecar.start()
+    env = dict(os.environ, TLS_IPC_SOCKET=socket_path, TLS_STREAM='0')
+
+    print(f'{args.requests} x {args.endpoint}, concurrency {args.concurrency}, '
+          f'sidecar latency {args.latency:.0f} ms, 1 worker ({args.threads} threads for sync)')
+    print(f"{'server':<18}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+    try:
+        for name, worker_class, target in SERVERS:
+            process = start_server(worker_class, target, args.port, args, env)
+            try:
+                elapsed, latencies, errors = asyncio.run(run_load(args.port, args))
+            finally:
+                process.terminate()
+                process.wait()
+            print(f'{name:<18}{len(latencies) / elapsed:>9.0f}{percentile(latencies, 0.5) * 1000:>9.1f}'
+                  f'{percentile(latencies, 0.99) * 1000:>9.1f}{max(latencies) * 1000:>9.1f}{errors:>8}')
+    finally:
+        sidecar.terminate()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        os.rmdir(os.path.dirname(socket_path))
+
+
+if __name__ == '__main__':
+    main()
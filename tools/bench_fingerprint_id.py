@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+浏览器指纹 ID 计算的微基准测试
+
+用法: python tools/bench_fingerprint_id.py [-n 次数]
+
+用接近真实采集数据的负载（150 个字体、WebGL 参数表等）对比旧版逐层 copy/pop 的实现，
+同时校验两者生成的 ID 完全一致，并拆分出字段过滤与序列化各自的耗时。
+"""
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def legacy_browser_fingerprint_id(data):
+    """旧版实现，作为 ID 兼容性与性能的参照"""
+    client = data.get('client', {}).copy()
+    for key in ('timestamp', 'hash', 'timing', 'tls', 'incognito'):
+        client.pop(key, None)
+    if 'screen' in client:
+        screen = client['screen'].copy() if isinstance(client['screen'], dict) else {}
+        for key in ('innerWidth', 'innerHeight', 'outerWidth', 'outerHeight',
+                    'availWidth', 'availHeight', 'screenX', 'screenY'):
+            screen.pop(key, None)
+        client['screen'] = screen
+    for name, keys in (('navigator', ('connection', 'languages', 'doNotTrack')),
+                       ('audio', ('fingerprint', 'baseLatency', 'outputLatency', 'state', 'error')),
+                       ('storage', ('indexedDBEnabled',))):
+        if name in client and isinstance(client[name], dict):
+            section = client[name].copy()
+            for key in keys:
+                section.pop(key, None)
+            client[name] = section
+    if 'automation' in client and isinstance(client['automation'], dict):
+        automation = client['automation'].copy()
+        automation.pop('score', None)
+        if 'checks' in automation and isinstance(automation['checks'], dict):
+            checks = automation['checks'].copy()
+            checks.pop('permissionsInconsistent', None)
+            checks.pop('languagesLengthZero', None)
+            automation['checks'] = checks
+        client['automation'] = automation
+
+    stable_data = {
+        'client': client,
+        'user_agent': data.get('server', {}).get('user_agent', ''),
+        'accept_encoding': data.get('server', {}).get('accept_encoding', ''),
+    }
+    content = json.dumps(stable_data, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def random_string(rng, n=12):
+    return ''.join(rng.choice(string.ascii_letters) for _ in range(n))
+
+
+def sample_payload(seed=7):
+    """生成一份结构与前端采集结果一致的负载"""
+    rng = random.Random(seed)
+    rs = lambda n=12: random_string(rng, n)  # noqa: E731
+    client = {
+        'timestamp': 1700000000000,
+        'hash': rs(32),
+        'timing': {'total': 123.4, 'canvas': 12.1},
+        'incognito': {'isPrivate': False, 'method': 'storage'},
+        'screen': {
+            'width': 1920, 'height': 1080, 'availWidth': 1920, 'availHeight': 1040,
+            'innerWidth': 1200, 'innerHeight': 900, 'outerWidth': 1200, 'outerHeight': 1000,
+            'screenX': 10, 'screenY': 20, 'colorDepth': 24, 'pixelRatio': 2,
+            'orientation': 'landscape-primary',
+        },
+        'navigator': {
+            'userAgent': 'Mozilla/5.0 ' + rs(80), 'platform': 'MacIntel', 'language': 'zh-CN',
+            'languages': ['zh-CN', 'en'], 'hardwareConcurrency': 8, 'deviceMemory': 8,
+            'doNotTrack': None, 'cookieEnabled': True,
+            'connection': {'effectiveType': '4g', 'downlink': 10, 'rtt': 50},
+            'vendor': 'Google Inc.', 'maxTouchPoints': 0, 'webdriver': False,
+        },
+        'audio': {
+            'fingerprint': '124.04347527516074', 'sampleRate': 44100, 'baseLatency': 0.01,
+            'outputLatency': 0.02, 'state': 'collected', 'channelCount': 2,
+        },
+        'storage': {'localStorage': True, 'sessionStorage': True, 'indexedDBEnabled': True},
+        'automation': {
+            'score': 0,
+            'checks': {name: False for name in (
+                'webdriver', 'permissionsInconsistent', 'languagesLengthZero', 'headlessUA',
+                'pluginsLengthZero', 'chromeRuntimeMissing', 'selenium', 'phantom')},
+        },
+        'canvas': {'geometry': rs(64), 'text': rs(64), 'hash': rs(32), 'winding': True},
+        'webgl': {
+            'vendor': 'WebKit', 'renderer': 'WebKit WebGL',
+            'unmaskedRenderer': 'ANGLE (Apple, ANGLE Metal Renderer: Apple M1 Pro, Unspecified Version)',
+            'extensions': ['EXT_' + rs(10) for _ in range(40)],
+            'parameters': {
+                'GL_' + rs(14): rng.choice([rng.randint(0, 65536), [rng.randint(0, 16384)] * 2, rs(6)])
+                for _ in range(80)
+            },
+            'shaderPrecision': {
+                f'{shader}_{precision}': {'rangeMin': 127, 'rangeMax': 127, 'precision': 23}
+                for shader in ('vertex', 'fragment') for precision in ('high', 'medium', 'low')
+            },
+        },
+        'fonts': sorted(rs(rng.randint(5, 18)) for _ in range(150)),
+        'math': {'values': {'m' + rs(5): rng.random() for _ in range(20)}},
+        'features': {rs(8): rng.choice([True, False]) for _ in range(60)},
+        'plugins': [{'name': rs(20), 'filename': rs(15), 'description': rs(30)} for _ in range(5)],
+        'webrtcIps': ['192.168.1.5'],
+    }
+    server = {'ip': '1.2.3.4', 'user_agent': 'Mozilla/5.0 ' + rs(80), 'accept_encoding': 'gzip, deflate, br'}
+    return {'client': client, 'server': server}
+
+
+def bench(func, number, repeat=7):
+    """返回单次调用的最短耗时（微秒）"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='浏览器指纹 ID 计算基准测试')
+    parser.add_argument('-n', '--number', type=int, default=2000, help='每轮调用次数')
+    args = parser.parse_args()
+
+    data = sample_payload()
+
+    # ID 兼容性：原始负载 + 随机改动若干字段
+    rng = random.Random(1)
+    for _ in range(200):
+        variant = copy.deepcopy(data)
+        for key in rng.sample(list(variant['client']), 4):
+            variant['client'][key] = rng.choice([None, 1, 'x', [], {}, variant['client'][key]])
+        assert app.generate_browser_fingerprint_id(variant) == legacy_browser_fingerprint_id(variant)
+    print('[OK] IDs identical to legacy implementation (200 variants)')
+
+    scheme = app.get_id_scheme('browser')
+    stable = scheme.extract(data)
+    print(f"payload: {len(json.dumps(data['client']))} bytes JSON, scheme {scheme.name}")
+    print(f"{'legacy':<24}{bench(lambda: legacy_browser_fingerprint_id(data), args.number):8.1f} us")
+    print(f"{'current':<24}{bench(lambda: app.generate_browser_fingerprint_id(data), args.number):8.1f} us")
+    print(f"{'  field filtering':<24}{bench(lambda: scheme.extract(data), args.number * 10):8.1f} us")
+    print(f"{'  canonical JSON':<24}{bench(lambda: app._canonical_json(stable), args.number):8.1f} us")
+    print(f"{'all schemes':<24}{bench(lambda: app.compute_fingerprint_ids(data), args.number):8.1f} us")
+
+
+if __name__ == '__main__':
+    main()
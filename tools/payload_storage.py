@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+指纹数据压缩存储工具
+
+用法:
+    python tools/payload_storage.py bench                    # 对比各压缩方式的体积与编解码耗时
+    python tools/payload_storage.py train -o fp-zstd.dict    # 用已有数据训练压缩字典
+    python tools/payload_storage.py migrate [--vacuum]       # 按当前配置重新编码已有数据
+    python tools/payload_storage.py dedup [--vacuum]         # 将已有数据转换为组件去重存储
+    python tools/payload_storage.py prune                    # 删除不再被引用的组件
+
+migrate 以 PAYLOAD_COMPRESSION / PAYLOAD_COMPRESSION_LEVEL / PAYLOAD_DICT_PATH 为目标格式，
+只处理格式不一致的行，按批提交，中断后重新运行即可继续。
+字典在启动时保存到数据库的 payload_dictionaries 表，之后更换字典或算法不影响已有数据的读取。
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def load_samples(limit):
+    """读取最近的 limit 条指纹（解码为 JSON 文本）"""
+    with app.get_db() as conn:
+        rows = conn.execute('SELECT data FROM fingerprints ORDER BY rowid DESC LIMIT ?', (limit,)).fetchall()
+    return [app.payload_codec.decode(row['data']).encode() for row in rows]
+
+
+def synthetic_samples(count):
+    """没有数据时用基准测试的样例负载生成样本"""
+    from bench_fingerprint_id import sample_payload
+    return [json.dumps(sample_payload(seed)).encode() for seed in range(count)]
+
+
+def build_zlib_dictionary(samples, size=32 * 1024):
+    """
+    zlib 预置字典：选取在多数样本中重复出现的 JSON 片段
+    出现越频繁的片段放在越靠后的位置（zlib 对距离近的匹配编码更短）
+    """
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update(set(sample.split(b', ')))
+    threshold = max(len(samples) // 10, 2)
+    fragments = [
+        fragment for fragment, count in document_frequency.items()
+        if count >= threshold and len(fragment) > 3
+    ]
+    # 按节省的字节数挑选，放不下时优先保留收益最大的
+    fragments.sort(key=lambda fragment: document_frequency[fragment] * len(fragment), reverse=True)
+    selected = []
+    total = 0
+    for fragment in fragments:
+        if total + len(fragment) + 2 > size:
+            continue
+        selected.append(fragment)
+        total += len(fragment) + 2
+    selected.sort(key=lambda fragment: document_frequency[fragment])
+    return b', '.join(selected)
+
+
+def train_dictionary(method, samples, size):
+    if method == 'zstd':
+        if app.zstandard is None:
+            raise SystemExit('[ERROR] zstd dictionaries require the zstandard package')
+        return app.zstandard.train_dictionary(size, samples).as_bytes()
+    return build_zlib_dictionary(samples, min(size, 32 * 1024))
+
+
+def cmd_train(args):
+    samples = synthetic_samples(args.samples) if args.synthetic else load_samples(args.samples)
+    if len(samples) < 10:
+        raise SystemExit('[ERROR] Not enough fingerprints to train a dictionary (need at least 10)')
+    dictionary = train_dictionary(args.method, samples, args.size)
+    with open(args.output, 'wb') as f:
+        f.write(dictionary)
+    print(f'[INFO] {args.method} dictionary written to {args.output}: {len(dictionary)} bytes, '
+          f'id {zlib.crc32(dictionary):08x}, trained on {len(samples)} fingerprints')
+    print(f'[HINT] PAYLOAD_COMPRESSION={args.method} PAYLOAD_DICT_PATH={os.path.abspath(args.output)}')
+
+
+def migrate_table(codec, table, batch_size):
+    """重新编码一张表的 data 列，返回 (行数, 原大小, 新大小)"""
+    if codec.method:
+        condition = "(typeof(data) = 'text' OR substr(data, 1, 6) != ?)"
+        condition_params = [codec.header]
+    else:
+        condition = "typeof(data) = 'blob'"
+        condition_params = []
+
+    started = time.monotonic()
+    last_rowid = 0
+    converted = 0
+    bytes_before = 0
+    bytes_after = 0
+    while True:
+        with app.get_db() as conn:
+            rows = conn.execute(
+                f'SELECT rowid, data FROM {table} WHERE rowid > ? AND {condition} ORDER BY rowid LIMIT ?',
+                [last_rowid] + condition_params + [batch_size]
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                encoded = codec.encode(codec.decode(row['data']))
+                bytes_before += len(row['data'])
+                bytes_after += len(encoded)
+                updates.append((encoded, row['rowid']))
+            conn.executemany(f'UPDATE {table} SET data = ? WHERE rowid = ?', updates)
+            conn.commit()
+        last_rowid = rows[-1]['rowid']
+        converted += len(rows)
+        elapsed = time.monotonic() - started
+        print(f'[INFO] {table}: {converted} rows -> {codec.method or "uncompressed"} (rowid {last_rowid}), '
+              f'{bytes_before / 1024 / 1024:.1f} MB -> {bytes_after / 1024 / 1024:.1f} MB, '
+              f'{converted / elapsed if elapsed else 0:.0f} rows/s')
+    return converted
+
+
+def cmd_migrate(args):
+    started = time.monotonic()
+    converted = sum(migrate_table(app.payload_codec, table, args.batch_size)
+                    for table in ('fingerprints', 'components'))
+    print(f'[INFO] Done: {converted} rows converted in {time.monotonic() - started:.1f}s')
+    if args.vacuum:
+        vacuum()
+    elif converted:
+        print('[HINT] Run with --vacuum (or VACUUM manually) to shrink the database file')
+
+
+def vacuum():
+    print('[INFO] Running VACUUM to reclaim free pages...')
+    with app.get_db() as conn:
+        conn.execute('VACUUM')
+
+
+def cmd_dedup(args):
+    """将已有指纹转换为组件去重存储（已转换的行会跳过）"""
+    started = time.monotonic()
+    last_rowid = args.after_rowid
+    scanned = 0
+    converted = 0
+    while True:
+        with app.get_db() as conn:
+            rows = conn.execute(
+                'SELECT rowid, id, data FROM fingerprints WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (last_rowid, args.batch_size)
+            ).fetchall()
+        if not rows:
+            break
+        with app.db_transaction():
+            for row in rows:
+                stored = app.payload_codec.loads(row['data'])
+                if '$components' in stored:
+                    continue
+                stored, components = app.split_components(stored)
+                if not components:
+                    continue
+                # 组件与改写后的行作为一组写入，开启 WRITE_BEHIND 时也不会先于组件可见
+                app.execute_writes([
+                    *app.component_writes(row['id'], components),
+                    ('UPDATE fingerprints SET data = ? WHERE rowid = ?',
+                     (app.payload_codec.encode(app.json_codec.dumps(stored)), row['rowid'])),
+                ])
+                converted += 1
+        last_rowid = rows[-1]['rowid']
+        scanned += len(rows)
+        elapsed = time.monotonic() - started
+        print(f'[INFO] rowid {last_rowid}: {scanned} scanned, {converted} converted, '
+              f'{scanned / elapsed if elapsed else 0:.0f} rows/s (resume with --after-rowid {last_rowid})')
+
+    with app.get_db() as conn:
+        components = conn.execute('SELECT COUNT(*) FROM components').fetchone()[0]
+        references = conn.execute('SELECT COUNT(*) FROM fingerprint_components').fetchone()[0]
+    print(f'[INFO] Done: {converted} fingerprints converted; {references} references to {components} unique components')
+    if args.vacuum:
+        vacuum()
+
+
+def cmd_prune(args):
+    print(f'[INFO] Removed {app.prune_components()} unreferenced components')
+
+
+def cmd_bench(args):
+    samples = synthetic_samples(args.samples) if args.synthetic else load_samples(args.samples)
+    if len(samples) < 10:
+        raise SystemExit('[ERROR] Not enough fingerprints to benchmark (need at least 10, or use --synthetic)')
+    # 字典用前一半样本训练，在后一半上测量，避免高估压缩率
+    train, test = samples[:len(samples) // 2], samples[len(samples) // 2:]
+    texts = [sample.decode() for sample in test]
+    raw_size = sum(len(sample) for sample in test)
+
+    configs = [('none', '', 0, None), ('zlib-6', 'zlib', 6, None), ('zlib-9', 'zlib', 9, None),
+               ('zlib-6+dict', 'zlib', 6, build_zlib_dictionary(train))]
+    if app.zstandard is not None:
+        configs += [('zstd-3', 'zstd', 3, None), ('zstd-19', 'zstd', 19, None),
+                    ('zstd-3+dict', 'zstd', 3, train_dictionary('zstd', train, args.dict_size))]
+    else:
+        print('[WARN] zstandard not installed, skipping zstd')
+
+    print(f'{len(test)} fingerprints, average {raw_size / len(test):.0f} bytes JSON')
+    print(f"{'format':<14}{'avg bytes':>10}{'ratio':>8}{'encode us':>11}{'decode us':>11}{'loads us':>10}")
+    for name, method, level, dictionary in configs:
+        dict_path = ''
+        if dictionary:
+            dict_path = os.path.join(args.tmp_dir, f'bench-{name}.dict')
+            with open(dict_path, 'wb') as f:
+                f.write(dictionary)
+        codec = app.PayloadCodec(method, level, dict_path)
+
+        start = time.perf_counter()
+        encoded = [codec.encode(text) for text in texts]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for data in encoded:
+            codec.decode(data)
+        decode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for data in encoded:
+            codec.loads(data)
+        loads_time = time.perf_counter() - start
+
+        size = sum(len(data) for data in encoded)
+        count = len(encoded)
+        print(f'{name:<14}{size / count:>10.0f}{raw_size / size:>8.2f}'
+              f'{encode_time / count * 1e6:>11.1f}{decode_time / count * 1e6:>11.1f}{loads_time / count * 1e6:>10.1f}')
+        if dict_path:
+            os.remove(dict_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指纹数据压缩存储工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    bench = subparsers.add_parser('bench', help='对比各压缩方式')
+    bench.add_argument('--samples', type=int, default=2000, help='样本数量')
+    bench.add_argument('--dict-size', type=int, default=64 * 1024, help='zstd 字典大小')
+    bench.add_argument('--synthetic', action='store_true', help='使用生成的样例数据')
+    bench.add_argument('--tmp-dir', default=tempfile.gettempdir(), help='临时字典文件目录')
+    bench.set_defaults(func=cmd_bench)
+
+    train = subparsers.add_parser('train', help='训练压缩字典')
+    train.add_argument('-o', '--output', required=True, help='字典输出路径')
+    train.add_argument('--method', choices=sorted(app.PayloadCodec.METHODS),
+                       default=app.PAYLOAD_COMPRESSION or ('zstd' if app.zstandard else 'zlib'))
+    train.add_argument('--samples', type=int, default=5000, help='样本数量')
+    train.add_argument('--size', type=int, default=64 * 1024, help='字典大小（zlib 最多 32KB）')
+    train.add_argument('--synthetic', action='store_true', help='使用生成的样例数据')
+    train.set_defaults(func=cmd_train)
+
+    migrate = subparsers.add_parser('migrate', help='按当前配置重新编码已有数据')
+    migrate.add_argument('--batch-size', type=int, default=500, help='每批行数（每批一个事务）')
+    migrate.add_argument('--vacuum', action='store_true', help='完成后执行 VACUUM')
+    migrate.set_defaults(func=cmd_migrate)
+
+    dedup = subparsers.add_parser('dedup', help='将已有指纹转换为组件去重存储')
+    dedup.add_argument('--batch-size', type=int, default=500, help='每批行数（每批一个事务）')
+    dedup.add_argument('--after-rowid', type=int, default=0, help='从指定 rowid 之后继续')
+    dedup.add_argument('--vacuum', action='store_true', help='完成后执行 VACUUM')
+    dedup.set_defaults(func=cmd_dedup)
+
+    prune = subparsers.add_parser('prune', help='删除不再被引用的组件')
+    prune.set_defaults(func=cmd_prune)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
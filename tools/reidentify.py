@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+批量重新计算已存储指纹的 ID
+
+用法:
+    python tools/reidentify.py                       # 计算全部启用方案，写入 fingerprint_ids
+    python tools/reidentify.py --rewrite             # 同时更新指纹数据中的 browser_id/tls_id/combined_id/ids
+    python tools/reidentify.py --schemes browser_v2  # 只计算指定方案
+    python tools/reidentify.py --reset               # 忽略断点从头开始
+
+- 按 rowid 分块读取（每次只持有 --chunk-size 行），内存占用与总行数无关
+- 多进程计算 ID，主进程按顺序批量写回，每块一个事务
+- 断点与该块的写入在同一事务中保存，中断后重新运行会从上次提交处继续
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def reidentify_chunk(rows, scheme_names, rewrite):
+    """
+    计算一块数据的 ID（在子进程中执行）
+    返回 (ID 行, 需要改写的数据, 跳过的行数)
+    """
+    schemes = [scheme for scheme in app.active_id_schemes() if scheme.name in scheme_names]
+    browser_scheme = app.get_id_scheme('browser').name
+    tls_scheme = app.get_id_scheme('tls').name
+
+    id_rows = []
+    updates = []
+    skipped = 0
+    for rowid, fp_id, data in rows:
+        try:
+            fingerprint = app.decode_fingerprint(data)
+            tls_data = app.fingerprint_tls_data(fingerprint)
+            inputs = {'browser': fingerprint, 'tls': tls_data}
+            ids = {}
+            for scheme in schemes:
+                value = scheme.compute(inputs.get(scheme.kind))
+                if value is not None:
+                    ids[scheme.name] = value
+        except Exception as e:
+            print(f'[WARN] Skipping fingerprint {fp_id}: {e}', file=sys.stderr)
+            skipped += 1
+            continue
+
+        id_rows.extend((fp_id, name, value) for name, value in ids.items())
+        if rewrite:
+            # 行的主键保持不变（已有链接继续有效），新 ID 可通过 fingerprint_ids 查询
+            browser_id = ids.get(browser_scheme) or app.generate_browser_fingerprint_id(fingerprint)
+            tls_id = ids.get(tls_scheme)
+            if tls_id is None and tls_data:
+                tls_id = app.generate_tls_fingerprint_id(tls_data)
+            # 只改写顶层 ID 字段，保留原有存储格式（包括去重存储的组件引用）
+            top_level = {
+                'browser_id': browser_id,
+                'tls_id': tls_id,
+                'combined_id': app.generate_combined_fingerprint_id(browser_id, tls_id),
+            }
+            stored = app.payload_codec.loads(data)
+            stored.update(top_level, ids={**stored.get('ids', {}), **ids})
+            # 热点字段列（tls_id、combined_id 等）按改写后的完整指纹重新提取，与 data 保持一致
+            columns = app.extract_fingerprint_columns({**fingerprint, **top_level})
+            updates.append((
+                app.payload_codec.encode(app.json_codec.dumps(stored)),
+                *columns,
+                app.FINGERPRINT_COLUMNS_VERSION,
+                rowid,
+            ))
+    return id_rows, updates, skipped
+
+
+def read_chunks(last_rowid, chunk_size):
+    """按 rowid 分块读取，每块使用独立的短查询，不长期占用读事务"""
+    while True:
+        with app.get_db() as conn:
+            rows = conn.execute(
+                'SELECT rowid, id, data FROM fingerprints WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (last_rowid, chunk_size)
+            ).fetchall()
+        if not rows:
+            return
+        rows = [tuple(row) for row in rows]
+        last_rowid = rows[-1][0]
+        yield last_rowid, rows
+
+
+def load_checkpoint(conn, job):
+    row = conn.execute(
+        'SELECT last_rowid, processed FROM reidentify_checkpoints WHERE job = ?', (job,)
+    ).fetchone()
+    return (row['last_rowid'], row['processed']) if row else (0, 0)
+
+
+def write_chunk(job, last_rowid, processed, id_rows, updates):
+    """写回一块结果并保存断点（同一事务）"""
+    assignments = ', '.join(f'{column} = ?' for column, _, _ in app.FINGERPRINT_COLUMNS)
+    with app.get_db() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO fingerprint_ids (fingerprint_id, scheme, value) VALUES (?, ?, ?)',
+            id_rows
+        )
+        if updates:
+            conn.executemany(
+                f'UPDATE fingerprints SET data = ?, {assignments}, columns_version = ? WHERE rowid = ?',
+                updates
+            )
+        conn.execute(
+            'INSERT OR REPLACE INTO reidentify_checkpoints (job, last_rowid, processed, updated_at) '
+            'VALUES (?, ?, ?, CURRENT_TIMESTAMP)',
+            (job, last_rowid, processed)
+        )
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量重新计算已存储指纹的 ID')
+    parser.add_argument('--schemes', help='逗号分隔的方案名（默认全部启用方案）')
+    parser.add_argument('--rewrite', action='store_true', help='同时更新指纹数据中的 ID 字段')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='每块行数（每块一个事务）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='计算进程数，0 表示在主进程计算')
+    parser.add_argument('--job', help='断点名称（默认由方案名生成）')
+    parser.add_argument('--reset', action='store_true', help='清除断点，从头开始')
+    args = parser.parse_args()
+
+    active = [scheme.name for scheme in app.active_id_schemes()]
+    scheme_names = args.schemes.split(',') if args.schemes else active
+    unknown = set(scheme_names) - set(active)
+    if unknown:
+        parser.error(f'unknown or inactive schemes: {", ".join(sorted(unknown))} (active: {", ".join(active)})')
+    job = args.job or ('rewrite:' if args.rewrite else '') + ','.join(sorted(scheme_names))
+
+    with app.get_db() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reidentify_checkpoints (
+                job TEXT PRIMARY KEY,
+                last_rowid INTEGER NOT NULL,
+                processed INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        if args.reset:
+            conn.execute('DELETE FROM reidentify_checkpoints WHERE job = ?', (job,))
+        conn.commit()
+        last_rowid, processed = load_checkpoint(conn, job)
+        max_rowid = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM fingerprints').fetchone()[0]
+
+    if last_rowid:
+        print(f'[INFO] Resuming job "{job}" after rowid {last_rowid} ({processed} rows done)')
+    print(f'[INFO] Schemes: {", ".join(scheme_names)}; workers: {args.workers}; chunk size: {args.chunk_size}')
+
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 0 else None
+    # 最多同时处理 workers*2 块，读取速度不会超过计算速度
+    max_pending = max(args.workers, 1) * 2
+    pending = deque()
+    started = time.monotonic()
+    done = 0
+    skipped = 0
+
+    def submit(chunk_rowid, rows):
+        if executor:
+            future = executor.submit(reidentify_chunk, rows, scheme_names, args.rewrite)
+        else:
+            future = Future()
+            future.set_result(reidentify_chunk(rows, scheme_names, args.rewrite))
+        pending.append((chunk_rowid, len(rows), future))
+
+    def write_oldest():
+        """按读取顺序写回最早的一块，保证断点单调递增"""
+        nonlocal done, skipped
+        chunk_rowid, count, future = pending.popleft()
+        id_rows, updates, chunk_skipped = future.result()
+        done += count
+        skipped += chunk_skipped
+        write_chunk(job, chunk_rowid, processed + done, id_rows, updates)
+
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else 0
+        percent = chunk_rowid / max_rowid * 100 if max_rowid else 100
+        print(f'[INFO] rowid {chunk_rowid}/{max_rowid} ({percent:.1f}%), '
+              f'{processed + done} rows, {rate:.0f} rows/s')
+
+    try:
+        for chunk_rowid, rows in read_chunks(last_rowid, args.chunk_size):
+            submit(chunk_rowid, rows)
+            if len(pending) >= max_pending:
+                write_oldest()
+        while pending:
+            write_oldest()
+    except KeyboardInterrupt:
+        print('\n[INFO] Interrupted, progress up to the last committed chunk is saved')
+        sys.exit(130)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    print(f'[INFO] Done: {done} rows in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} rows/s), {skipped} skipped')
+
+
+if __name__ == '__main__':
+    main()